@@ -0,0 +1,78 @@
+"""
+Integer-encoded ACLs.
+
+Every principal named in chunk metadata (allowed_groups / allowed_users) gets a
+row in acl_principals, and chunks store the ids in the GIN-indexed acl_ids int[]
+column. Search turns the caller's group names into ids inside the same statement
+and filters with `acl_ids && ids`, which matches exactly the chunks the old
+`metadata->'allowed_groups' ?| :groups` filter matched.
+"""
+from typing import Any, Dict, Iterable, List, Set, Tuple
+from sqlalchemy import select, func, any_, literal, Text
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.orm import Session
+from app.models import AclPrincipal, DocumentChunk
+
+Principal = Tuple[str, str] # (kind, name)
+
+# metadata key -> principal kind
+ACL_METADATA_KEYS = {"allowed_groups": "group", "allowed_users": "user"}
+
+def _names(value: Any) -> List[str]:
+    # Mirrors JSONB `?` semantics: string array elements, or a bare string.
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, list):
+        return [v for v in value if isinstance(v, str)]
+    return []
+
+def metadata_principals(metadata: Dict[str, Any]) -> Set[Principal]:
+    principals = set()
+    for key, kind in ACL_METADATA_KEYS.items():
+        principals.update((kind, name) for name in _names(metadata.get(key)))
+    return principals
+
+def resolve_principals(session: Session, principals: Iterable[Principal]) -> Dict[Principal, int]:
+    """Returns {(kind, name): id}, inserting principals seen for the first time."""
+    principals = set(principals)
+    if not principals:
+        return {}
+    rows = [{"kind": kind, "name": name} for kind, name in sorted(principals)]
+    session.execute(insert(AclPrincipal).values(rows).on_conflict_do_nothing())
+    names = [name for _, name in principals]
+    existing = session.execute(
+        select(AclPrincipal.kind, AclPrincipal.name, AclPrincipal.id).where(AclPrincipal.name.in_(names))
+    ).all()
+    return {(kind, name): pid for kind, name, pid in existing if (kind, name) in principals}
+
+def acl_ids_for(metadata: Dict[str, Any], principal_ids: Dict[Principal, int]) -> List[int]:
+    return sorted({principal_ids[p] for p in metadata_principals(metadata)})
+
+def group_filter(allowed_groups: List[str]):
+    """
+    `acl_ids && ARRAY(SELECT id FROM acl_principals WHERE kind = 'group' AND name = ANY(:groups))`.
+    The subquery runs once per statement (InitPlan), so the GIN index on acl_ids stays usable.
+    """
+    group_ids = select(AclPrincipal.id).where(
+        AclPrincipal.kind == "group",
+        AclPrincipal.name == any_(literal(allowed_groups, ARRAY(Text))),
+    ).scalar_subquery()
+    return DocumentChunk.acl_ids.overlap(func.array(group_ids))
+
+# Backfill for rows written before acl_ids existed (see app/schema.py).
+# One row per (chunk, principal) with JSONB `?`-compatible semantics.
+CHUNK_PRINCIPALS_SQL = """
+    SELECT c.id AS chunk_id, p.kind, e #>> '{}' AS name
+    FROM document_chunks c
+    CROSS JOIN LATERAL (
+        VALUES ('group', c.metadata->'allowed_groups'), ('user', c.metadata->'allowed_users')
+    ) AS p(kind, val)
+    CROSS JOIN LATERAL jsonb_array_elements(
+        CASE jsonb_typeof(p.val)
+            WHEN 'array' THEN p.val
+            WHEN 'string' THEN jsonb_build_array(p.val)
+            ELSE '[]'::jsonb
+        END
+    ) AS e
+    WHERE jsonb_typeof(e) = 'string'
+"""
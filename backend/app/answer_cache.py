@@ -0,0 +1,242 @@
+"""
+Semantic answer cache in front of RAGPipeline.
+
+Users ask paraphrases of the same few questions, and each one would otherwise
+pay for retrieval, rerank and generation again. A new query reuses a cached
+answer if the cosine similarity of the query embeddings is at least
+ANSWER_CACHE_THRESHOLD.
+
+- Partitioned by the canonical (frozen) set of the caller's groups and the
+  search scope, like the retrieval cache: an answer is only served to callers
+  with exactly the same ACL view, asking within the same source / spaces.
+- Each partition keeps its unit query vectors in one float32 matrix, so a
+  lookup is a single matrix-vector product.
+- Entries carry the chunk and source ids they cite. When the corpus
+  generation moves, the pipeline asks the backend which sources changed
+  (corpus_changes), and where the ones still stored live and who can read them.
+  Evicted are the entries citing a changed source, and every entry of a
+  partition that can see one: a new or edited document in its scope may
+  answer its questions better (or at all, for a "not found" answer). If the
+  log doesn't reach back far enough, everything goes.
+- Bounded to ANSWER_CACHE_SIZE entries per worker (LRU), with a TTL.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+import threading
+import time
+
+import numpy as np
+
+from app.retrieval_backend import RetrievedChunk, SearchScope, SourceVisibility
+from app import config
+
+@dataclass(frozen=True)
+class CachedAnswer:
+    query: str
+    answer: str
+    chunk_ids: Tuple[int, ...]
+    source_ids: frozenset
+    similarity: float = 1.0 # of the query that was looked up, set on hits
+
+# (frozenset of the caller's groups, search scope)
+_PartitionKey = Tuple[frozenset, Hashable]
+
+@dataclass
+class _Entry:
+    partition: _PartitionKey
+    row: int
+    expires_at: float
+    answer: CachedAnswer
+
+class _Partition:
+    """Unit query vectors of one group set and scope, one row per entry (rows are kept dense by swap-removal)."""
+
+    def __init__(self, dim: int, capacity: int = 16):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.entry_ids: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.entry_ids)
+
+    def add(self, entry_id: int, unit: np.ndarray) -> int:
+        row = len(self.entry_ids)
+        if row == len(self.vectors):
+            self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+        self.vectors[row] = unit
+        self.entry_ids.append(entry_id)
+        return row
+
+    def remove(self, row: int) -> Optional[int]:
+        """Drops `row`; returns the id of the entry moved into it, if any."""
+        last = len(self.entry_ids) - 1
+        moved = None
+        if row != last:
+            self.vectors[row] = self.vectors[last]
+            self.entry_ids[row] = moved = self.entry_ids[last]
+        self.entry_ids.pop()
+        return moved
+
+    def best(self, unit: np.ndarray) -> Tuple[int, float]:
+        similarities = self.vectors[:len(self.entry_ids)] @ unit
+        row = int(np.argmax(similarities))
+        return row, float(similarities[row])
+
+def _unit(vector) -> Optional[np.ndarray]:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0 else None
+
+def _sees(groups: frozenset, scope: Optional[SearchScope], source: SourceVisibility) -> bool:
+    """Whether retrieval for this group set and scope could return the document."""
+    return not groups.isdisjoint(source.groups) and (scope is None or scope.covers(source.source, source.scope_key))
+
+class AnswerCache:
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 3600, threshold: float = 0.95):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.generation: Optional[int] = None
+        self._partitions: Dict[_PartitionKey, _Partition] = {}
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict() # LRU order
+        self._by_source: Dict[str, Set[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0 # entries dropped because a cited source changed
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        partition = self._partitions[entry.partition]
+        moved = partition.remove(entry.row)
+        if moved is not None:
+            self._entries[moved].row = entry.row
+        if not partition:
+            del self._partitions[entry.partition]
+        for source_id in entry.answer.source_ids:
+            cited_by = self._by_source.get(source_id)
+            if cited_by is not None:
+                cited_by.discard(entry_id)
+                if not cited_by:
+                    del self._by_source[source_id]
+
+    def _clear(self):
+        self._partitions.clear()
+        self._entries.clear()
+        self._by_source.clear()
+
+    def get(self, allowed_groups: List[str], query_vec, scope: Hashable = None) -> Optional[CachedAnswer]:
+        """The cached answer closest to `query_vec` for exactly this group set and scope, if similar enough."""
+        unit = _unit(query_vec)
+        key = (frozenset(allowed_groups), scope)
+        with self._lock:
+            # An expired best match is dropped and the search repeated: a live entry
+            # just below it may still clear the threshold.
+            while unit is not None and key in self._partitions:
+                partition = self._partitions[key]
+                row, similarity = partition.best(unit)
+                if similarity < self.threshold:
+                    break
+                entry_id = partition.entry_ids[row]
+                entry = self._entries[entry_id]
+                if entry.expires_at > time.monotonic():
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return replace(entry.answer, similarity=similarity)
+                self._remove(entry_id)
+            self.misses += 1
+            return None
+
+    def put(self, allowed_groups: List[str], query_vec, query: str, answer: str,
+            cited: Iterable[RetrievedChunk], generation: int, scope: Hashable = None) -> bool:
+        """
+        Caches `answer` for this group set and scope. `generation` is the one the cache was
+        synced to before retrieval; if it has moved since, the answer may already be
+        stale and is not stored. Answers citing nothing (or chunks without a
+        source id) are not stored either: no ingestion could ever evict them.
+        """
+        cited = list(cited)
+        unit = _unit(query_vec)
+        if self.max_size <= 0 or unit is None or not cited or any(c.source_id is None for c in cited):
+            return False
+        key = (frozenset(allowed_groups), scope)
+        cached = CachedAnswer(
+            query=query, answer=answer,
+            chunk_ids=tuple(dict.fromkeys(c.id for c in cited)),
+            source_ids=frozenset(c.source_id for c in cited),
+        )
+        with self._lock:
+            if generation != self.generation:
+                return False
+            partition = self._partitions.get(key)
+            if partition is None:
+                partition = self._partitions[key] = _Partition(len(unit))
+            elif len(partition):
+                # A paraphrase of an entry we already hold replaces it
+                row, similarity = partition.best(unit)
+                if similarity >= self.threshold:
+                    self._remove(partition.entry_ids[row])
+                    partition = self._partitions.setdefault(key, partition)
+
+            entry_id = self._next_id
+            self._next_id += 1
+            row = partition.add(entry_id, unit)
+            self._entries[entry_id] = _Entry(key, row, time.monotonic() + self.ttl_seconds, cached)
+            for source_id in cached.source_ids:
+                self._by_source.setdefault(source_id, set()).add(entry_id)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+            return True
+
+    def sync(self, generation: int, changed: Optional[Set[str]],
+             visibility: Optional[Dict[str, SourceVisibility]] = None) -> int:
+        """
+        Moves the cache to `generation`, evicting the entries that cite a source in
+        `changed` (the sources written since self.generation) and the partitions whose
+        group set and scope can see one of them per `visibility` (the changed sources
+        still stored). Everything goes if `changed` is None, or if it isn't empty and
+        `visibility` is None. Returns the number of entries evicted.
+        """
+        with self._lock:
+            if generation == self.generation:
+                return 0
+            if self.generation is None:
+                # Nothing cached yet that could be stale
+                self.generation = generation
+                return 0
+            if changed is None or (changed and visibility is None):
+                evicted = len(self._entries)
+                self._clear()
+            else:
+                doomed = set().union(*(self._by_source.get(s, ()) for s in changed))
+                for (groups, scope), partition in self._partitions.items():
+                    if any(_sees(groups, scope, visibility[s]) for s in changed if s in visibility):
+                        doomed.update(partition.entry_ids)
+                for entry_id in doomed:
+                    self._remove(entry_id)
+                evicted = len(doomed)
+            self.generation = generation
+            self.evictions += evicted
+            return evicted
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "partitions": len(self._partitions),
+                "generation": self.generation,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    @classmethod
+    def from_config(cls) -> "AnswerCache":
+        return cls(config.ANSWER_CACHE_SIZE, config.ANSWER_CACHE_TTL, config.ANSWER_CACHE_THRESHOLD)
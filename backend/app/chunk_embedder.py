@@ -0,0 +1,129 @@
+"""
+Ingestion-side embedding stage.
+
+Embeds chunk texts from many documents at once instead of one call per
+document: identical texts are embedded once (keyed by content hash), the
+unique texts are packed into batches bounded by item count and estimated
+tokens, and up to `concurrency` batches are in flight at a time, each retried
+with exponential backoff.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List
+import hashlib
+import logging
+import random
+import threading
+import time
+
+from langchain_core.embeddings import Embeddings
+
+from app import config
+
+logger = logging.getLogger(__name__)
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English with OpenAI tokenizers; only used to bound batch size
+    return len(text) // 4 + 1
+
+class ChunkEmbedder:
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        batch_size: int = None,
+        batch_tokens: int = None,
+        concurrency: int = None,
+        max_retries: int = None,
+        retry_backoff: float = None,
+    ):
+        self.embeddings = embeddings
+        self.batch_size = batch_size or config.EMBED_BATCH_SIZE
+        self.batch_tokens = batch_tokens or config.EMBED_BATCH_TOKENS
+        self.concurrency = concurrency or config.EMBED_CONCURRENCY
+        self.max_retries = config.EMBED_MAX_RETRIES if max_retries is None else max_retries
+        self.retry_backoff = config.EMBED_RETRY_BACKOFF if retry_backoff is None else retry_backoff
+
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.batches_done = 0
+        self.chunks_embedded = 0
+        self.duplicates_skipped = 0
+
+    def batches(self, texts: List[str]) -> Iterator[List[str]]:
+        """Packs texts into batches of at most batch_size items and ~batch_tokens tokens."""
+        batch, tokens = [], 0
+        for text in texts:
+            cost = estimate_tokens(text)
+            if batch and (len(batch) >= self.batch_size or tokens + cost > self.batch_tokens):
+                yield batch
+                batch, tokens = [], 0
+            batch.append(text)
+            tokens += cost
+        if batch:
+            yield batch
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        with self._lock:
+            self.in_flight += 1
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    return self.embeddings.embed_documents(batch)
+                except Exception as e:
+                    if attempt == self.max_retries:
+                        raise
+                    delay = self.retry_backoff * (2 ** attempt) * (0.5 + random.random())
+                    logger.warning(f"Embedding batch of {len(batch)} failed ({e}); retrying in {delay:.1f}s")
+                    time.sleep(delay)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.batches_done += 1
+                self.chunks_embedded += len(batch)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Returns one vector per input text, in input order."""
+        unique: Dict[str, str] = {} # hash -> text
+        hashes = []
+        for text in texts:
+            h = content_hash(text)
+            hashes.append(h)
+            unique.setdefault(h, text)
+        with self._lock:
+            self.duplicates_skipped += len(texts) - len(unique)
+
+        unique_hashes = list(unique)
+        vectors_by_hash = {}
+        started = time.perf_counter()
+        offset = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = []
+            for batch in self.batches([unique[h] for h in unique_hashes]):
+                futures.append((unique_hashes[offset:offset + len(batch)], pool.submit(self._embed_batch, batch)))
+                offset += len(batch)
+            for batch_hashes, future in futures:
+                vectors_by_hash.update(zip(batch_hashes, future.result()))
+                elapsed = time.perf_counter() - started
+                logger.debug(
+                    f"Embedded {len(vectors_by_hash)}/{len(unique_hashes)} unique chunks "
+                    f"({len(vectors_by_hash) / elapsed if elapsed else 0:.0f} chunks/s, {self.in_flight} batches in flight)"
+                )
+
+        elapsed = time.perf_counter() - started
+        if unique_hashes:
+            logger.info(
+                f"Embedded {len(unique_hashes)} unique chunks ({len(texts) - len(unique_hashes)} duplicates skipped) "
+                f"in {len(futures)} batches, {len(unique_hashes) / elapsed if elapsed else 0:.0f} chunks/s"
+            )
+        return [vectors_by_hash[h] for h in hashes]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "batches_in_flight": self.in_flight,
+                "batches_done": self.batches_done,
+                "chunks_embedded": self.chunks_embedded,
+                "duplicates_skipped": self.duplicates_skipped,
+            }
@@ -0,0 +1,163 @@
+"""
+Write side of ingestion: applies DocumentPlans (what changed per source document)
+to document_chunks.
+
+Plans are grouped into transactions of roughly `commit_rows` written rows. A
+document is never split across transactions, so each source document still
+changes atomically, but a full reload commits periodically instead of holding
+one huge transaction. Every transaction bumps the corpus generation.
+
+OrmChunkWriter uses ORM bulk executemany statements. CopyChunkWriter streams
+inserts with binary COPY (vector, jsonb and int[] sent in binary) and falls back
+to the ORM path if COPY is unavailable or fails.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+import logging
+
+import numpy as np
+from sqlalchemy import insert, update, delete
+from sqlalchemy.orm import Session
+
+from app.models import DocumentChunk
+from app.corpus import bump_generation
+from app import config
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class DocumentPlan:
+    """What re-ingesting one source document has to change in document_chunks."""
+    source_id: Optional[str]
+    inserts: List[Dict[str, Any]] = field(default_factory=list)
+    updates: List[Dict[str, Any]] = field(default_factory=list)          # new content + embedding
+    metadata_updates: List[Dict[str, Any]] = field(default_factory=list) # same content, new title/ACL
+    delete_from_index: Optional[int] = None # delete chunks with chunk_index >= this
+    delete_ids: List[int] = field(default_factory=list) # stale copies of its chunks in another scope
+    unchanged: int = 0
+    needs_embedding: List[Dict[str, Any]] = field(default_factory=list) # subset of inserts/updates
+
+    @property
+    def changed(self) -> bool:
+        return bool(
+            self.inserts or self.updates or self.metadata_updates or self.delete_ids
+            or self.delete_from_index is not None
+        )
+
+    @property
+    def rows(self) -> int:
+        return len(self.inserts) + len(self.updates) + len(self.metadata_updates) + len(self.delete_ids) + 1
+
+class OrmChunkWriter:
+    def __init__(self, commit_rows: int = None):
+        self.commit_rows = commit_rows or config.INGEST_COMMIT_ROWS
+
+    def _transactions(self, plans: List[DocumentPlan]) -> Iterator[List[DocumentPlan]]:
+        group, rows = [], 0
+        for plan in plans:
+            if not plan.changed:
+                continue
+            if group and rows + plan.rows > self.commit_rows:
+                yield group
+                group, rows = [], 0
+            group.append(plan)
+            rows += plan.rows
+        if group:
+            yield group
+
+    def _insert(self, session: Session, rows: List[Dict[str, Any]]):
+        session.execute(insert(DocumentChunk), rows)
+
+    def write(self, session: Session, plans: List[DocumentPlan]) -> Dict[str, int]:
+        stats = {"inserted": 0, "updated": 0, "deleted": 0, "transactions": 0}
+        for group in self._transactions(plans):
+            try:
+                delete_ids = [row_id for plan in group for row_id in plan.delete_ids]
+                if delete_ids:
+                    stats["deleted"] += session.execute(
+                        delete(DocumentChunk).where(DocumentChunk.id.in_(delete_ids))
+                    ).rowcount
+                inserts = [row for plan in group for row in plan.inserts]
+                if inserts:
+                    self._insert(session, inserts)
+                # ORM bulk UPDATE by primary key (executemany)
+                updates = [row for plan in group for row in plan.updates]
+                if updates:
+                    session.execute(update(DocumentChunk), updates)
+                metadata_updates = [row for plan in group for row in plan.metadata_updates]
+                if metadata_updates:
+                    session.execute(update(DocumentChunk), metadata_updates)
+                for plan in group:
+                    if plan.delete_from_index is not None:
+                        # New inserts all have chunk_index < delete_from_index, so this only hits the old tail
+                        stats["deleted"] += session.execute(delete(DocumentChunk).where(
+                            DocumentChunk.source_id == plan.source_id,
+                            DocumentChunk.chunk_index >= plan.delete_from_index,
+                        )).rowcount
+                # Same transaction as the writes: retrieval caches drop their entries once this commits
+                bump_generation(session, (plan.source_id for plan in group))
+                session.commit()
+            except Exception:
+                session.rollback()
+                logger.error(f"Failed to save chunks for {[p.source_id for p in group]}")
+                raise
+            stats["inserted"] += len(inserts)
+            stats["updated"] += len(updates) + len(metadata_updates)
+            stats["transactions"] += 1
+        return stats
+
+COPY_COLUMNS = (
+    "source_id", "chunk_index", "content", "content_hash", "embedding", "metadata", "acl_ids", "source", "scope_key",
+)
+COPY_TYPES = ("text", "int4", "text", "varchar", "vector", "jsonb", "int4[]", "varchar", "varchar")
+
+class CopyChunkWriter(OrmChunkWriter):
+    def __init__(self, commit_rows: int = None):
+        super().__init__(commit_rows)
+        self.copy_enabled = True
+
+    def _driver_connection(self, session: Session):
+        raw = session.connection().connection.driver_connection
+        if raw.adapters.types.get("vector") is None:
+            from pgvector.psycopg import register_vector
+            register_vector(raw)
+        return raw
+
+    def _copy(self, session: Session, rows: List[Dict[str, Any]]):
+        raw = self._driver_connection(session)
+        sql = f"COPY document_chunks ({', '.join(COPY_COLUMNS)}) FROM STDIN (FORMAT BINARY)"
+        with raw.cursor() as cur:
+            with cur.copy(sql) as copy:
+                copy.set_types(list(COPY_TYPES))
+                for row in rows:
+                    copy.write_row((
+                        row["source_id"],
+                        row["chunk_index"],
+                        row["content"],
+                        row["content_hash"],
+                        np.asarray(row["embedding"], dtype=np.float32),
+                        row["metadata_"],
+                        row["acl_ids"],
+                        row["source"],
+                        row["scope_key"],
+                    ))
+
+    def _insert(self, session: Session, rows: List[Dict[str, Any]]):
+        if self.copy_enabled:
+            try:
+                # Savepoint, so a failed COPY doesn't abort the whole transaction
+                with session.begin_nested():
+                    self._copy(session, rows)
+                return
+            except Exception as e:
+                logger.warning(f"COPY failed ({e}); falling back to INSERT for this and later batches")
+                self.copy_enabled = False
+        super()._insert(session, rows)
+
+def make_writer(kind: str = None) -> OrmChunkWriter:
+    kind = kind or config.INGEST_WRITER
+    if kind == "copy":
+        return CopyChunkWriter()
+    if kind == "orm":
+        return OrmChunkWriter()
+    raise ValueError(f"Unknown INGEST_WRITER {kind!r}, expected 'copy' or 'orm'")
@@ -0,0 +1,133 @@
+"""
+Runtime tuning knobs, read once from the environment (or .env).
+Connection settings live in app/database.py.
+"""
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Retrieval
+# sequential: dense query, then sparse query, RRF in Python (two round trips, summed latency)
+# parallel:   dense and sparse legs on separate connections at the same time, RRF in Python
+# fused:      both legs and RRF scoring in one CTE statement (one round trip)
+SEARCH_MODE = os.getenv("SEARCH_MODE", "sequential")
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Where the legs run (app/retrieval_backend.py)
+# RETRIEVAL_BACKEND: postgres | numpy (in-process index built with `python build_numpy_index.py`)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "postgres")
+NUMPY_INDEX_PATH = os.getenv("NUMPY_INDEX_PATH", "numpy_index")
+NUMPY_BLOCK_ROWS = int(os.getenv("NUMPY_BLOCK_ROWS", "65536"))   # embedding rows scored per matrix product
+
+# ANN index on document_chunks.embedding (managed by init_db.py / reset_db.py)
+# VECTOR_INDEX: hnsw | ivfflat | none
+# VECTOR_DISTANCE: l2 | cosine | ip  (picks both the index opclass and the search operator)
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "hnsw")
+VECTOR_DISTANCE = os.getenv("VECTOR_DISTANCE", "l2")
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "100"))
+# VECTOR_QUANTIZATION: none | halfvec | binary, what the index is built on (see app/schema.py).
+# With halfvec/binary, search rescores RESCORE_MULTIPLIER x k index candidates with the full vector.
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+RESCORE_MULTIPLIER = int(os.getenv("RESCORE_MULTIPLIER", "4"))
+# maintenance_work_mem for index builds; HNSW builds are much faster when the graph fits
+VECTOR_INDEX_BUILD_MEMORY = os.getenv("VECTOR_INDEX_BUILD_MEMORY", "")
+
+# Partitioning of document_chunks (app/schema.py; existing tables: `python init_db.py --partition`)
+# CHUNK_PARTITIONING: LIST partitions by source, one per CHUNK_PARTITION_SOURCES entry plus a default one.
+# CHUNK_SCOPE_PARTITIONS: HASH sub-partitions on scope_key (space / project) per source, 0 = none.
+CHUNK_PARTITIONING = os.getenv("CHUNK_PARTITIONING", "false").lower() in ("1", "true", "yes")
+CHUNK_PARTITION_SOURCES = [s for s in os.getenv("CHUNK_PARTITION_SOURCES", "confluence,jira").split(",") if s]
+CHUNK_SCOPE_PARTITIONS = int(os.getenv("CHUNK_SCOPE_PARTITIONS", "0"))
+
+# Query-time recall/latency defaults, overridable per request. Unset = server default
+# (hnsw.ef_search=40, ivfflat.probes=1).
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "0")) or None
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "0")) or None
+
+# Reranking (app/rerank.py)
+# RERANKER: lexical (BM25 + title boost over the candidates) | cross-encoder (sentence-transformers) | none
+RERANKER = os.getenv("RERANKER", "lexical")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))      # chunks retrieved for reranking
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "5"))                 # chunks kept for generation
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "100"))     # per request; past it, RRF order is kept (0 = no limit)
+RERANK_TITLE_BOOST = float(os.getenv("RERANK_TITLE_BOOST", "2.0"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "50000"))   # (query, chunk) scores per worker
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))      # cross-encoder pairs per forward pass
+CROSS_ENCODER_MODEL = os.getenv("CROSS_ENCODER_MODEL", "BAAI/bge-reranker-base")
+
+# Prompt context (app/context.py)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))   # tokens of retrieved text per prompt
+CONTEXT_NEIGHBOURS = int(os.getenv("CONTEXT_NEIGHBOURS", "1"))          # adjacent chunks fetched on each side of a hit
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "cl100k_base")       # tiktoken encoding used for counting
+
+# Query-embedding cache (app/embedding_cache.py)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))   # entries per worker, 0 disables
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "3600"))    # seconds
+EMBEDDING_CACHE_REDIS_URL = os.getenv("EMBEDDING_CACHE_REDIS_URL", "")   # optional shared tier across workers
+
+# Query-embedding micro-batching (app/embedding_batcher.py)
+QUERY_EMBED_BATCH_SIZE = int(os.getenv("QUERY_EMBED_BATCH_SIZE", "32"))           # texts per call, 1 disables
+QUERY_EMBED_BATCH_WAIT_MS = float(os.getenv("QUERY_EMBED_BATCH_WAIT_MS", "5"))    # max wait for a batch to fill
+
+# Retrieval result cache (app/retrieval_cache.py), invalidated by ingestion via corpus_generation
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "2048"))  # entries per worker, 0 disables
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "300"))   # seconds
+
+# Retrieval-only API (/v1/retrieve/batch)
+RETRIEVE_BATCH_MAX_QUERIES = int(os.getenv("RETRIEVE_BATCH_MAX_QUERIES", "256"))  # queries per request (one SQL statement)
+
+# Semantic answer cache (app/answer_cache.py): paraphrases of a cached question reuse its answer
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))               # answers per worker, 0 disables
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))               # seconds
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))   # min cosine similarity of the queries
+CORPUS_CHANGE_RETENTION = int(os.getenv("CORPUS_CHANGE_RETENTION", "10000"))  # generations kept in corpus_changes
+
+# Ingestion embedding stage (app/chunk_embedder.py)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))          # texts per embed_documents call
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "200000"))    # estimated tokens per call
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))           # batches in flight
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+EMBED_RETRY_BACKOFF = float(os.getenv("EMBED_RETRY_BACKOFF", "1.0"))   # seconds, doubled per attempt
+
+# Ingestion write stage (app/chunk_writer.py)
+# INGEST_WRITER: copy (binary COPY, falls back to INSERT on failure) | orm (INSERT executemany)
+INGEST_WRITER = os.getenv("INGEST_WRITER", "copy")
+INGEST_COMMIT_ROWS = int(os.getenv("INGEST_COMMIT_ROWS", "5000"))    # rows per transaction (whole documents)
+INGEST_BATCH_DOCS = int(os.getenv("INGEST_BATCH_DOCS", "500"))       # documents split/embedded/written at a time
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "2"))         # batches buffered between pipeline stages
+
+# Delta sync (app/delta_sync.py, run with `python sync.py`)
+CONFLUENCE_URL = os.getenv("CONFLUENCE_URL", "http://mock")
+CONFLUENCE_USER = os.getenv("CONFLUENCE_USER", "")
+CONFLUENCE_API_KEY = os.getenv("CONFLUENCE_API_KEY", "")
+JIRA_URL = os.getenv("JIRA_URL", "http://mock")
+JIRA_USER = os.getenv("JIRA_USER", "")
+JIRA_API_KEY = os.getenv("JIRA_API_KEY", "")
+SYNC_CONFLUENCE_SPACES = [s for s in os.getenv("SYNC_CONFLUENCE_SPACES", "").split(",") if s]
+SYNC_JIRA_PROJECTS = [p for p in os.getenv("SYNC_JIRA_PROJECTS", "").split(",") if p]
+
+def _group_map(name: str) -> dict:
+    # "SUP=group:support|group:dev;HR=group:hr" -> {"SUP": ["group:support", "group:dev"], "HR": ["group:hr"]}
+    return {
+        key.strip(): [g for g in groups.split("|") if g]
+        for key, _, groups in (entry.partition("=") for entry in os.getenv(name, "").split(";") if entry)
+    }
+
+# Confluence space -> groups with View permission on it. Pages of unlisted spaces are
+# indexed readable by no group; restricted pages keep only restriction groups listed here.
+CONFLUENCE_SPACE_GROUPS = _group_map("CONFLUENCE_SPACE_GROUPS")
+# Jira project -> groups with Browse permission. Issues of unlisted projects, and issues
+# with a security level, are indexed readable by no group.
+JIRA_PROJECT_GROUPS = _group_map("JIRA_PROJECT_GROUPS")
+SYNC_INTERVAL = float(os.getenv("SYNC_INTERVAL", "300"))              # seconds between runs
+SYNC_CONCURRENCY = int(os.getenv("SYNC_CONCURRENCY", "2"))            # sources syncing at once per system
+SYNC_RECONCILE_EVERY = int(os.getenv("SYNC_RECONCILE_EVERY", "1"))    # runs between deletion/ACL reconciles
+SYNC_RECONCILE_MIN_LISTED = float(os.getenv("SYNC_RECONCILE_MIN_LISTED", "0.5"))  # listed/stored ids below which nothing is deleted
+SYNC_OVERLAP = float(os.getenv("SYNC_OVERLAP", "120"))                # seconds re-read before the cursor
+
+# Observability (app/metrics.py, served at /metrics)
+# SERVER_TIMING: add a Server-Timing header with per-stage durations to every response
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() in ("1", "true", "yes")
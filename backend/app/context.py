@@ -0,0 +1,199 @@
+"""
+Builds the prompt context from the reranked chunks.
+
+1. The neighbours (chunk_index +/- CONTEXT_NEIGHBOURS) of every hit are fetched
+   in one ACL-filtered query through the retrieval backend.
+2. Chunks are grouped by source_id and runs of consecutive chunk_index are
+   merged into one passage. The splitter repeats up to CHUNK_OVERLAP characters
+   (whole words) at the start of each chunk, and that repeat is cut; chunks
+   without a plausible repeat are joined with a newline.
+3. Passages are added in score order (the best hit they contain) until
+   CONTEXT_TOKEN_BUDGET is reached. A passage that doesn't fit is retried
+   without its neighbours, and the first one is truncated rather than dropped.
+
+Every build reports the tokens the verbatim join of the hits would have taken,
+the tokens actually used and the difference (rag_context_tokens*, and the log).
+"""
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+
+from app.chunk_embedder import estimate_tokens
+from app.ingestion import CHUNK_OVERLAP
+from app.metrics import CONTEXT_TOKENS, CONTEXT_TOKENS_SAVED
+from app.retrieval_backend import RetrievalBackend, RetrievedChunk
+from app import config
+
+logger = logging.getLogger(__name__)
+
+def token_counter(encoding: str = None) -> Callable[[str], int]:
+    """tiktoken's count for CONTEXT_TOKENIZER, or the ~4 characters/token estimate if it can't be loaded."""
+    encoding = encoding or config.CONTEXT_TOKENIZER
+    try:
+        import tiktoken
+        enc = tiktoken.get_encoding(encoding)
+    except Exception as e:
+        logger.warning(f"Tokenizer {encoding!r} unavailable ({e}); estimating context tokens from length")
+        return estimate_tokens
+    return lambda text: len(enc.encode(text, disallowed_special=()))
+
+def overlap_length(previous: str, following: str, max_overlap: int = CHUNK_OVERLAP,
+                   min_overlap: Optional[int] = None) -> int:
+    """
+    Length of the splitter's repeat between consecutive chunks: the longest prefix of
+    `following` (up to max_overlap chars) that `previous` ends with. The splitter only
+    repeats whole words, so the match must start and end on whitespace, and it must be
+    at least min_overlap chars (default max_overlap // 2) unless a chunk is shorter;
+    anything less is a coincidence (e.g. "...services" + "so the...") and counts as 0.
+    """
+    min_overlap = max_overlap // 2 if min_overlap is None else min_overlap
+    shortest = min(min_overlap, len(previous), len(following))
+    for n in range(min(len(previous), len(following), max_overlap), max(shortest, 1) - 1, -1):
+        if not previous.endswith(following[:n]):
+            continue
+        starts_word = n == len(previous) or previous[-n - 1].isspace()
+        ends_word = n == len(following) or following[n].isspace()
+        if starts_word and ends_word:
+            return n
+    return 0
+
+def merge_chunks(chunks: List[RetrievedChunk]) -> str:
+    """Content of consecutive chunks of one document, without the repeated overlap."""
+    text = chunks[0].content
+    for chunk in chunks[1:]:
+        n = overlap_length(text, chunk.content)
+        text += chunk.content[n:] if n else "\n" + chunk.content
+    return text
+
+@dataclass
+class Passage:
+    source_id: Optional[str]
+    title: Optional[str]
+    url: Optional[str]
+    chunks: List[RetrievedChunk]   # consecutive chunk_index
+    hits: List[int]                # chunk_index values that were retrieved (the rest are neighbours)
+    score: float
+
+    def text(self, with_neighbours: bool = True) -> str:
+        if with_neighbours:
+            return merge_chunks(self.chunks)
+        core = [c for c in self.chunks if min(self.hits) <= c.chunk_index <= max(self.hits)]
+        return merge_chunks(core)
+
+    def render(self, content: str) -> str:
+        return f"Source: {self.title or 'Unknown'}\nContent: {content}"
+
+@dataclass
+class Context:
+    text: str
+    passages: List[Passage] = field(default_factory=list)
+    tokens_verbatim: int = 0 # the hits joined as they come, without merging or budget
+    tokens_used: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_verbatim - self.tokens_used
+
+def _score(chunk: RetrievedChunk) -> float:
+    return chunk.rerank_score if chunk.rerank_score is not None else chunk.score
+
+def build_passages(hits: List[RetrievedChunk], neighbours: List[RetrievedChunk]) -> List[Passage]:
+    """Groups hits + neighbours by source_id into runs of consecutive chunk_index, best first."""
+    hit_scores: Dict[Tuple[Optional[str], int], float] = {}
+    by_source: Dict[Optional[str], Dict[int, RetrievedChunk]] = {}
+    for chunk in hits:
+        key = (chunk.source_id, chunk.chunk_index)
+        hit_scores[key] = max(hit_scores.get(key, float("-inf")), _score(chunk))
+        by_source.setdefault(chunk.source_id, {})[chunk.chunk_index] = chunk
+    for chunk in neighbours:
+        if chunk.source_id in by_source:
+            by_source[chunk.source_id].setdefault(chunk.chunk_index, chunk)
+
+    passages = []
+    for source_id, chunks in by_source.items():
+        run: List[RetrievedChunk] = []
+        for index in sorted(chunks):
+            if run and index != run[-1].chunk_index + 1:
+                passages.append(run)
+                run = []
+            run.append(chunks[index])
+        passages.append(run)
+
+    result = []
+    for run in passages:
+        hit_indexes = [c.chunk_index for c in run if (c.source_id, c.chunk_index) in hit_scores]
+        if not hit_indexes:
+            continue
+        first_hit = next(c for c in run if c.chunk_index in hit_indexes)
+        result.append(Passage(
+            source_id=first_hit.source_id, title=first_hit.title, url=first_hit.url, chunks=run, hits=hit_indexes,
+            score=max(hit_scores[(first_hit.source_id, i)] for i in hit_indexes),
+        ))
+    result.sort(key=lambda p: -p.score)
+    return result
+
+class ContextBuilder:
+    def __init__(self, token_budget: int = None, neighbours: int = None, count_tokens: Callable[[str], int] = None):
+        self.token_budget = token_budget or config.CONTEXT_TOKEN_BUDGET
+        self.neighbours = config.CONTEXT_NEIGHBOURS if neighbours is None else neighbours
+        self.count_tokens = count_tokens or token_counter()
+
+    def _neighbour_keys(self, hits: List[RetrievedChunk]) -> List[Tuple[str, int]]:
+        have = {(c.source_id, c.chunk_index) for c in hits}
+        keys = set()
+        for chunk in hits:
+            if chunk.source_id is None or chunk.chunk_index is None:
+                continue
+            for offset in range(1, self.neighbours + 1):
+                for index in (chunk.chunk_index - offset, chunk.chunk_index + offset):
+                    if index >= 0 and (chunk.source_id, index) not in have:
+                        keys.add((chunk.source_id, index))
+        return sorted(keys)
+
+    async def build(self, hits: List[RetrievedChunk], allowed_groups: List[str],
+                    backend: Optional[RetrievalBackend] = None) -> Context:
+        verbatim = "\n\n".join(f"Source: {d.title or 'Unknown'}\nContent: {d.content}" for d in hits)
+        context = Context(text="", tokens_verbatim=self.count_tokens(verbatim) if hits else 0)
+        if not hits:
+            return context
+
+        neighbours: List[RetrievedChunk] = []
+        keys = self._neighbour_keys(hits) if backend is not None and self.neighbours > 0 else []
+        if keys:
+            neighbours = await backend.fetch_chunks(keys, allowed_groups)
+
+        parts, used = [], 0
+        separator = self.count_tokens("\n\n")
+        for passage in build_passages(hits, neighbours):
+            cost = separator if parts else 0
+            for content in dict.fromkeys((passage.text(True), passage.text(False))):
+                rendered = passage.render(content)
+                tokens = self.count_tokens(rendered)
+                if used + cost + tokens <= self.token_budget:
+                    parts.append(rendered)
+                    context.passages.append(passage)
+                    used += cost + tokens
+                    break
+            else:
+                if not parts:
+                    # Better a truncated best passage than no context at all
+                    rendered = self._truncate(passage.render(passage.text(False)), self.token_budget)
+                    parts.append(rendered)
+                    context.passages.append(passage)
+                    used = self.count_tokens(rendered)
+
+        context.text = "\n\n".join(parts)
+        context.tokens_used = used
+        CONTEXT_TOKENS.observe(used)
+        CONTEXT_TOKENS_SAVED.inc(max(context.tokens_saved, 0))
+        logger.info(
+            f"context: {len(hits)} hits -> {len(context.passages)} passages, {used} tokens "
+            f"({context.tokens_verbatim} verbatim, {context.tokens_saved} saved)"
+        )
+        return context
+
+    def _truncate(self, text: str, budget: int) -> str:
+        # Shrink proportionally until it fits; converges in a couple of steps
+        while text and self.count_tokens(text) > budget:
+            text = text[:max(int(len(text) * budget / self.count_tokens(text)) - 1, 0)]
+        return text
@@ -0,0 +1,72 @@
+"""
+Corpus generation counter.
+
+Anything that writes or replaces chunks calls bump_generation() inside its
+transaction; readers compare current_generation() with the generation their
+cached data was computed at. Because the bump commits atomically with the
+chunk writes, a reader can never see the new generation with the old data.
+
+The bump also logs which source documents the generation wrote or deleted
+(corpus_changes), so a cache can evict just the entries citing them
+(app/answer_cache.py) instead of everything.
+"""
+from typing import Dict, Iterable, Optional, Set
+from sqlalchemy import delete, insert, select, text
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import CorpusChange, CorpusGeneration, DocumentChunk
+from app.acl import metadata_principals
+from app.retrieval_backend import SourceVisibility
+from app import config
+
+_BUMP_SQL = text("""
+    INSERT INTO corpus_generation (id, generation) VALUES (1, 1)
+    ON CONFLICT (id) DO UPDATE SET generation = corpus_generation.generation + 1
+    RETURNING generation
+""")
+
+def bump_generation(session: Session, source_ids: Iterable[Optional[str]] = ()) -> int:
+    generation = session.execute(_BUMP_SQL).scalar_one()
+    changed = sorted({s for s in source_ids if s is not None})
+    if changed:
+        session.execute(insert(CorpusChange), [{"generation": generation, "source_id": s} for s in changed])
+    session.execute(delete(CorpusChange).where(CorpusChange.generation <= generation - config.CORPUS_CHANGE_RETENTION))
+    return generation
+
+async def current_generation(session: AsyncSession) -> int:
+    generation = await session.scalar(select(CorpusGeneration.generation).where(CorpusGeneration.id == 1))
+    return generation or 0
+
+def current_generation_sync(session: Session) -> int:
+    generation = session.scalar(select(CorpusGeneration.generation).where(CorpusGeneration.id == 1))
+    return generation or 0
+
+async def changed_sources(session: AsyncSession, since: int, generation: int) -> Optional[Set[str]]:
+    """
+    Source ids written in generations (since, generation], or None if the log
+    no longer goes back that far (or the counter went backwards: database reset).
+    """
+    if since > generation or generation - since >= config.CORPUS_CHANGE_RETENTION:
+        return None
+    rows = await session.scalars(
+        select(CorpusChange.source_id).distinct()
+        .where(CorpusChange.generation > since, CorpusChange.generation <= generation)
+    )
+    return set(rows)
+
+async def source_visibility(session: AsyncSession, source_ids: Iterable[str]) -> Dict[str, SourceVisibility]:
+    """Scope and reader groups of the stored documents among `source_ids` (from their first chunk)."""
+    source_ids = list(source_ids)
+    if not source_ids:
+        return {}
+    rows = await session.execute(
+        select(DocumentChunk.source_id, DocumentChunk.source, DocumentChunk.scope_key, DocumentChunk.metadata_)
+        .where(DocumentChunk.source_id.in_(source_ids), DocumentChunk.chunk_index == 0)
+    )
+    return {
+        row.source_id: SourceVisibility(
+            row.source, row.scope_key,
+            frozenset(name for kind, name in metadata_principals(row.metadata_) if kind == "group"),
+        )
+        for row in rows
+    }
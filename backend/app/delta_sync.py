@@ -0,0 +1,264 @@
+"""
+Delta sync: keeps the index fresh from Confluence spaces and Jira projects
+without full reloads.
+
+Each sync source (a space or a project) has a row in sync_state with a
+high-water mark: the newest `updated_at` it has ingested. A run asks the loader
+only for pages/issues changed since then (minus SYNC_OVERLAP, for clock skew and
+minute-precision queries; re-ingesting an unchanged document is a no-op) and
+feeds them through the usual incremental ingestion.
+
+Edits are all the cursor can see, so every run (every SYNC_RECONCILE_EVERY runs,
+if listing a large source is too expensive) also reconciles the source: the
+loader lists every id with its ACL, without bodies, and compares the list with
+what is stored. Revoked access and deletions are thus applied within one
+SYNC_INTERVAL.
+- ids no longer listed were deleted upstream, so their chunks are removed, unless
+  the listing is empty or shorter than SYNC_RECONCILE_MIN_LISTED of the stored
+  ids: a truncated listing must not wipe the source from the index;
+- ids whose ACL differs had a permission-only change, so they are re-fetched
+  (ingestion turns that into a metadata update, without re-embedding);
+- ids listed but not stored were missed, so they are fetched.
+
+SyncScheduler runs all sources every SYNC_INTERVAL seconds, with at most
+SYNC_CONCURRENCY sources per system (Confluence, Jira) syncing at once, to stay
+inside API rate limits.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import logging
+import threading
+import time
+
+from langchain_core.documents import Document
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.ingestion import IngestionService
+from app.loaders import SecureConfluenceLoader, SecureJiraLoader, PermissionEntry
+from app.models import DocumentChunk, SyncState
+from app import config
+
+logger = logging.getLogger(__name__)
+
+class SyncSource:
+    system: str # concurrency bucket, e.g. "confluence"
+
+    @property
+    def name(self) -> str:
+        raise NotImplementedError
+
+    def full_load(self) -> Iterator[Document]:
+        raise NotImplementedError
+
+    def changed_since(self, since: datetime) -> Iterator[Document]:
+        raise NotImplementedError
+
+    def list_permissions(self) -> Iterator[PermissionEntry]:
+        raise NotImplementedError
+
+    def fetch(self, source_ids: List[str]) -> Iterator[Document]:
+        raise NotImplementedError
+
+    def scope(self) -> list:
+        """WHERE clauses selecting the stored chunks this source owns."""
+        raise NotImplementedError
+
+class ConfluenceSpaceSync(SyncSource):
+    system = "confluence"
+
+    def __init__(self, loader: SecureConfluenceLoader, space_key: str):
+        self.loader = loader
+        self.space_key = space_key
+
+    @property
+    def name(self) -> str:
+        return f"confluence:{self.space_key}"
+
+    def full_load(self):
+        return self.loader.lazy_load(space_key=self.space_key)
+
+    def changed_since(self, since):
+        return self.loader.changed_since(since, space_key=self.space_key)
+
+    def list_permissions(self):
+        return self.loader.list_permissions(space_key=self.space_key)
+
+    def fetch(self, source_ids):
+        return self.loader.lazy_load(page_ids=source_ids)
+
+    def scope(self):
+        # The chunk_scope columns: an index scan, and only this space's partition when partitioned
+        return [DocumentChunk.source == "confluence", DocumentChunk.scope_key == self.space_key]
+
+class JiraProjectSync(SyncSource):
+    system = "jira"
+
+    def __init__(self, loader: SecureJiraLoader, project: str):
+        self.loader = loader
+        self.project = project
+        self.jql = f'project = "{project}"'
+
+    @property
+    def name(self) -> str:
+        return f"jira:{self.project}"
+
+    def full_load(self):
+        return self.loader.lazy_load(self.jql)
+
+    def changed_since(self, since):
+        return self.loader.changed_since(since, self.jql)
+
+    def list_permissions(self):
+        return self.loader.list_permissions(self.jql)
+
+    def fetch(self, source_ids):
+        return self.loader.load_keys(source_ids)
+
+    def scope(self):
+        return [DocumentChunk.source == "jira", DocumentChunk.scope_key == self.project]
+
+def _acl_key(groups, users) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    return tuple(sorted(groups or [])), tuple(sorted(users or []))
+
+class _CursorTracker:
+    """Passes documents through while remembering the newest updated_at and the ids seen."""
+
+    def __init__(self, documents: Iterable[Document]):
+        self.documents = documents
+        self.newest: Optional[datetime] = None
+        self.seen = set()
+
+    def __iter__(self):
+        for doc in self.documents:
+            self.seen.add(doc.metadata.get("source_id"))
+            updated = doc.metadata.get("updated_at")
+            if updated:
+                updated = datetime.fromisoformat(updated)
+                if self.newest is None or updated > self.newest:
+                    self.newest = updated
+            yield doc
+
+class DeltaSync:
+    def __init__(self, service_factory: Callable[[], IngestionService] = IngestionService,
+                 reconcile_every: int = None, overlap_seconds: float = None, min_listed: float = None):
+        self.service_factory = service_factory
+        self.reconcile_every = reconcile_every or config.SYNC_RECONCILE_EVERY
+        self.min_listed = config.SYNC_RECONCILE_MIN_LISTED if min_listed is None else min_listed
+        self.overlap = timedelta(seconds=config.SYNC_OVERLAP if overlap_seconds is None else overlap_seconds)
+
+    def _stored_acls(self, session: Session, source: SyncSource) -> Dict[str, tuple]:
+        rows = session.execute(
+            select(
+                DocumentChunk.source_id,
+                DocumentChunk.metadata_["allowed_groups"],
+                DocumentChunk.metadata_["allowed_users"],
+            ).where(DocumentChunk.chunk_index == 0, *source.scope())
+        )
+        return {source_id: _acl_key(groups, users) for source_id, groups, users in rows}
+
+    def _reconcile(self, session: Session, service: IngestionService, source: SyncSource, just_ingested: set) -> Dict[str, int]:
+        listed = {source_id: _acl_key(groups, users) for source_id, groups, users in source.list_permissions()}
+        stored = self._stored_acls(session, source)
+        session.commit()
+
+        removed = [sid for sid in stored if sid not in listed]
+        refetch = [
+            sid for sid, acl in listed.items()
+            if sid not in just_ingested and (sid not in stored or stored[sid] != acl)
+        ]
+        stats = {"removed": 0, "refetched": len(refetch)}
+        if removed and (not listed or len(listed) < self.min_listed * len(stored)):
+            logger.warning(
+                f"Reconcile of {source.name}: listing returned {len(listed)} ids for {len(stored)} stored; "
+                f"not deleting {len(removed)} unlisted ids"
+            )
+            stats["removals_refused"] = len(removed)
+        elif removed:
+            stats["removed"] = len(removed)
+            # Scoped: a document moved to another space may already have been ingested there
+            service.delete_sources(removed, source.scope())
+        if refetch:
+            service.process_documents(source.fetch(refetch))
+        return stats
+
+    def sync(self, source: SyncSource) -> Dict[str, object]:
+        session = SessionLocal()
+        started = datetime.now(timezone.utc)
+        try:
+            state = session.get(SyncState, source.name) or SyncState(source=source.name, runs=0)
+            session.commit()
+            service = self.service_factory()
+
+            first_run = state.cursor is None
+            if first_run:
+                documents = _CursorTracker(source.full_load())
+            else:
+                documents = _CursorTracker(source.changed_since(state.cursor - self.overlap))
+            stats: Dict[str, object] = {"source": source.name, "full": first_run}
+            stats.update(service.process_documents(documents))
+
+            if first_run or (state.runs + 1) % self.reconcile_every == 0:
+                stats.update(self._reconcile(session, service, source, documents.seen))
+
+            # Only advanced once everything up to it is committed
+            marks = [mark for mark in (state.cursor, documents.newest) if mark is not None]
+            state.cursor = max(marks) if marks else started
+            state.runs += 1
+            state.last_success_at = started
+            state.last_error = None
+            session.merge(state)
+            session.commit()
+            logger.info(f"Synced {source.name}: {stats}")
+            return stats
+        except Exception as e:
+            session.rollback()
+            state = session.get(SyncState, source.name) or SyncState(source=source.name, runs=0)
+            state.last_error = f"{type(e).__name__}: {e}"
+            session.merge(state)
+            session.commit()
+            raise
+        finally:
+            session.close()
+
+class SyncScheduler:
+    def __init__(self, sources: List[SyncSource], delta_sync: DeltaSync = None,
+                 interval_seconds: float = None, concurrency: int = None):
+        self.sources = sources
+        self.delta_sync = delta_sync or DeltaSync()
+        self.interval = config.SYNC_INTERVAL if interval_seconds is None else interval_seconds
+        concurrency = concurrency or config.SYNC_CONCURRENCY
+        self._slots = {system: threading.BoundedSemaphore(concurrency) for system in {s.system for s in sources}}
+
+    def _run_source(self, source: SyncSource):
+        with self._slots[source.system]:
+            try:
+                return self.delta_sync.sync(source)
+            except Exception as e:
+                logger.error(f"Sync of {source.name} failed: {e}")
+                return {"source": source.name, "error": str(e)}
+
+    def run_once(self) -> List[dict]:
+        if not self.sources:
+            return []
+        with ThreadPoolExecutor(max_workers=len(self.sources), thread_name_prefix="sync") as pool:
+            return list(pool.map(self._run_source, self.sources))
+
+    def run_forever(self, stop: threading.Event = None):
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            started = time.monotonic()
+            self.run_once()
+            stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+def sources_from_config() -> List[SyncSource]:
+    sources: List[SyncSource] = []
+    if config.SYNC_CONFLUENCE_SPACES:
+        loader = SecureConfluenceLoader(config.CONFLUENCE_URL, config.CONFLUENCE_USER, config.CONFLUENCE_API_KEY)
+        sources += [ConfluenceSpaceSync(loader, space) for space in config.SYNC_CONFLUENCE_SPACES]
+    if config.SYNC_JIRA_PROJECTS:
+        loader = SecureJiraLoader(config.JIRA_URL, config.JIRA_USER, config.JIRA_API_KEY)
+        sources += [JiraProjectSync(loader, project) for project in config.SYNC_JIRA_PROJECTS]
+    return sources
@@ -0,0 +1,99 @@
+"""
+Micro-batching of concurrent query embeddings.
+
+Under load every in-flight search embeds its query on its own, one network
+round trip (or one model forward pass) per request. BatchingEmbeddings sits
+under the query-embedding cache (app/embedding_cache.py), so it only ever sees
+misses. It holds each aembed_query call for up to QUERY_EMBED_BATCH_WAIT_MS,
+or until QUERY_EMBED_BATCH_SIZE texts are waiting. It then sends them as one
+aembed_documents call and resolves every waiting request with its vector.
+Identical texts in a batch are embedded once.
+
+A lone request pays at most the wait, and a full batch goes out immediately.
+Batch sizes and queueing delays are exported as rag_query_embed_batch_size
+and rag_query_embed_queue_seconds.
+
+Only use it with models that embed queries and documents the same way
+(OpenAI, the mock). Models that prefix queries with an instruction need
+QUERY_EMBED_BATCH_SIZE=1.
+"""
+from typing import List, Optional, Set, Tuple
+import asyncio
+import time
+
+from langchain_core.embeddings import Embeddings
+
+from app.metrics import QUERY_EMBED_BATCH_SIZE, QUERY_EMBED_QUEUE_SECONDS
+from app import config
+
+# (text, future for its vector, time.perf_counter() when it was queued)
+_Pending = Tuple[str, asyncio.Future, float]
+
+class BatchingEmbeddings(Embeddings):
+    def __init__(self, embeddings: Embeddings, max_batch: int = None, max_wait_ms: float = None):
+        self.embeddings = embeddings
+        self.max_batch = max_batch or config.QUERY_EMBED_BATCH_SIZE
+        self.max_wait_ms = config.QUERY_EMBED_BATCH_WAIT_MS if max_wait_ms is None else max_wait_ms
+        # Queue state belongs to one event loop (tests and scripts run several in turn)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: List[_Pending] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def model(self) -> str:
+        # Cache keys (CachedEmbeddings.model_id) are per underlying model
+        return getattr(self.embeddings, "model", None) or type(self.embeddings).__name__
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        # Synchronous callers have no one to batch with
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        if self.max_batch <= 1:
+            return await self.embeddings.aembed_query(text)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._pending, self._timer = loop, [], None
+        future = loop.create_future()
+        self._pending.append((text, future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_ms / 1000, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = self._loop.create_task(self._embed(batch))
+            # The loop only keeps weak references to tasks
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _embed(self, batch: List[_Pending]):
+        sent = time.perf_counter()
+        for _, _, queued in batch:
+            QUERY_EMBED_QUEUE_SECONDS.observe(sent - queued)
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        QUERY_EMBED_BATCH_SIZE.observe(len(texts))
+        try:
+            vectors = dict(zip(texts, await self.embeddings.aembed_documents(texts)))
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for text, future, _ in batch:
+            # A request that was cancelled while waiting just drops its vector
+            if not future.done():
+                future.set_result(vectors[text])
@@ -0,0 +1,199 @@
+"""
+Query-embedding cache.
+
+Embedding the query is the most expensive network call on the request path and
+our traffic repeats the same questions a lot, so HybridSearchService wraps its
+embeddings in CachedEmbeddings. Entries are keyed by embedding model id plus the
+normalized query text and stored as float32 arrays (6 KB per 1536-dim vector
+instead of ~50 KB as a list of Python floats).
+
+The local tier is a bounded LRU with a TTL. An optional shared tier (Redis, via
+EMBEDDING_CACHE_REDIS_URL) lets all uvicorn workers reuse each other's embeddings.
+"""
+from collections import OrderedDict
+from typing import List, Optional
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.metrics import CACHE_REQUESTS
+from app import config
+
+logger = logging.getLogger(__name__)
+
+def normalize_query(text: str) -> str:
+    # Case and whitespace differences don't change what the user is asking
+    return " ".join(text.casefold().split())
+
+class RedisEmbeddingStore:
+    """Shared tier: raw float32 bytes under a hashed key, expired by Redis."""
+
+    def __init__(self, url: str, ttl_seconds: float, prefix: str = "qemb:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("EMBEDDING_CACHE_REDIS_URL is set but the 'redis' package is not installed") from e
+        self.client = redis.Redis.from_url(url)
+        self.ttl_seconds = int(ttl_seconds)
+        self.prefix = prefix
+
+    def _key(self, key: str) -> str:
+        return self.prefix + hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        raw = self.client.get(self._key(key))
+        if raw is None:
+            return None
+        return np.frombuffer(raw, dtype=np.float32)
+
+    def set(self, key: str, vector: np.ndarray):
+        self.client.set(self._key(key), vector.tobytes(), ex=self.ttl_seconds or None)
+
+class EmbeddingCache:
+    """Thread-safe LRU + TTL cache of float32 vectors, with an optional shared tier."""
+
+    def __init__(self, max_size: int = 10_000, ttl_seconds: float = 3600, shared: Optional[RedisEmbeddingStore] = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.shared = shared
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict() # key -> (expires_at, vector)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, vector = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    CACHE_REQUESTS.inc(cache="embedding", result="hit")
+                    return vector
+                del self._entries[key]
+
+        if self.shared is not None:
+            try:
+                vector = self.shared.get(key)
+            except Exception as e:
+                logger.warning(f"Shared embedding cache read failed: {e}")
+                vector = None
+            if vector is not None:
+                self._store_local(key, vector)
+                with self._lock:
+                    self.shared_hits += 1
+                CACHE_REQUESTS.inc(cache="embedding", result="shared_hit")
+                return vector
+
+        with self._lock:
+            self.misses += 1
+        CACHE_REQUESTS.inc(cache="embedding", result="miss")
+        return None
+
+    def put(self, key: str, vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        vector.setflags(write=False) # shared between requests, must not be mutated
+        self._store_local(key, vector)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, vector)
+            except Exception as e:
+                logger.warning(f"Shared embedding cache write failed: {e}")
+        return vector
+
+    def _store_local(self, key: str, vector: np.ndarray):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+            }
+
+    @classmethod
+    def from_config(cls) -> "EmbeddingCache":
+        shared = None
+        if config.EMBEDDING_CACHE_REDIS_URL:
+            shared = RedisEmbeddingStore(config.EMBEDDING_CACHE_REDIS_URL, config.EMBEDDING_CACHE_TTL)
+        return cls(config.EMBEDDING_CACHE_SIZE, config.EMBEDDING_CACHE_TTL, shared)
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings implementation and caches embed_query results.
+    Returned query vectors are read-only float32 arrays (pgvector accepts them directly).
+    Document embedding (ingestion) is passed through uncached.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model_id: Optional[str] = None):
+        self.embeddings = embeddings
+        self.cache = cache
+        # Vectors from different models are not interchangeable
+        self.model_id = model_id or getattr(embeddings, "model", None) or type(embeddings).__name__
+
+    def _key(self, text: str) -> str:
+        return f"{self.model_id}\x00{normalize_query(text)}"
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        key = self._key(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.cache.put(key, self.embeddings.embed_query(text))
+        return vector
+
+    async def aembed_queries(self, texts: List[str]) -> List[np.ndarray]:
+        """aembed_query for many texts; the misses are embedded in one call."""
+        keys = [self._key(t) for t in texts]
+        if self.cache.shared is None:
+            vectors = [self.cache.get(k) for k in keys]
+        else:
+            vectors = await asyncio.to_thread(lambda: [self.cache.get(k) for k in keys])
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if missing:
+            fresh = dict(zip(missing, await self.embeddings.aembed_documents(missing)))
+            if self.cache.shared is None:
+                stored = {t: self.cache.put(self._key(t), v) for t, v in fresh.items()}
+            else:
+                stored = await asyncio.to_thread(lambda: {t: self.cache.put(self._key(t), v) for t, v in fresh.items()})
+            vectors = [v if v is not None else stored[t] for t, v in zip(texts, vectors)]
+        return vectors
+
+    async def aembed_query(self, text: str) -> np.ndarray:
+        key = self._key(text)
+        if self.cache.shared is None:
+            vector = self.cache.get(key)
+        else:
+            # The shared tier does blocking network I/O
+            vector = await asyncio.to_thread(self.cache.get, key)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            if self.cache.shared is None:
+                vector = self.cache.put(key, vector)
+            else:
+                vector = await asyncio.to_thread(self.cache.put, key, vector)
+        return vector
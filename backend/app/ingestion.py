@@ -1,14 +1,24 @@
-from typing import List
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from itertools import islice
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 import numpy as np
+from sqlalchemy import select, delete
+from sqlalchemy.orm import Session
 from app.database import SessionLocal
-from app.models import DocumentChunk
+from app.models import DocumentChunk, chunk_scope
+from app.acl import metadata_principals, resolve_principals, acl_ids_for
+from app.chunk_embedder import ChunkEmbedder, content_hash
+from app.chunk_writer import DocumentPlan, make_writer
+from app.corpus import bump_generation
+from app import config
 import logging
 
 # Mock Embeddings for Prototype (dimension 1536 to match OpenAI)
 class MockEmbeddings(Embeddings):
+    model = "mock-embedding-1536"
+
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         # Return random vectors normalized
         return [np.random.rand(1536).tolist() for _ in texts]
@@ -16,44 +26,199 @@ class MockEmbeddings(Embeddings):
     def embed_query(self, text: str) -> List[float]:
         return np.random.rand(1536).tolist()
 
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+
+# A split document: the source document, its chunks and their content hashes
+SplitDocument = Tuple[Document, List[Document], List[str]]
+
+_text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+def split_documents(documents: List[Document]) -> List[SplitDocument]:
+    """
+    Dedupes by source_id, splits and hashes the chunks. Pure CPU work with no
+    service state, so the pipeline can run it in worker processes.
+    """
+    # Re-syncs can carry the same page twice; the last version wins
+    by_source: Dict[Any, Document] = {}
+    for n, doc in enumerate(documents):
+        by_source[doc.metadata.get("source_id") or ("__no_source_id__", n)] = doc
+    result = []
+    for doc in by_source.values():
+        chunks = _text_splitter.split_documents([doc])
+        result.append((doc, chunks, [content_hash(c.page_content) for c in chunks]))
+    return result
+
+def current_chunks(rows: Iterable[Any], scope: Tuple[str, str]) -> Tuple[Dict[int, Any], List[int]]:
+    """
+    {chunk_index: row} of a document's stored chunks, and the ids of surplus copies.
+    On a partitioned table (source_id, chunk_index) is only unique per (source, scope_key),
+    so a document that moved space while being ingested elsewhere can be stored twice;
+    the copy in the document's current scope is kept.
+    """
+    current: Dict[int, Any] = {}
+    surplus: List[int] = []
+    for row in sorted(rows, key=lambda r: (r.source, r.scope_key) == scope):
+        if row.chunk_index in current:
+            surplus.append(current[row.chunk_index].id)
+        current[row.chunk_index] = row
+    return current, surplus
+
+def empty_stats() -> Dict[str, int]:
+    return {"documents": 0, "inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    it = iter(items)
+    while batch := list(islice(it, size)):
+        yield batch
+
 class IngestionService:
-    def __init__(self):
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500,
-            chunk_overlap=50
-        )
+    def __init__(self, writer: str = None):
+        self.text_splitter = _text_splitter
         self.embeddings = MockEmbeddings() # Replace with OpenAIEmbeddings() in prod
+        self.embedder = ChunkEmbedder(self.embeddings)
+        self.writer = make_writer(writer)
         self.db = SessionLocal()
 
-    def process_documents(self, documents: List[Document]):
-        logging.info(f"Processing {len(documents)} documents...")
-        
-        chunks_to_save = []
-        
-        for doc in documents:
-            # 1. Split
-            chunks = self.text_splitter.split_documents([doc])
-            
-            # 2. Embed (Batching recommended in real impl)
-            texts = [c.page_content for c in chunks]
-            vectors = self.embeddings.embed_documents(texts)
-            
-            # 3. Prepare for DB
-            for i, chunk in enumerate(chunks):
-                db_chunk = DocumentChunk(
-                    source_id=chunk.metadata.get("source_id"),
-                    chunk_index=i,
-                    content=chunk.page_content,
-                    embedding=vectors[i],
-                    metadata_=chunk.metadata # ACLs are here
-                )
-                chunks_to_save.append(db_chunk)
-        
-        # 4. Save
+    def _existing_chunks(self, session: Session, source_ids: List[str]) -> Dict[str, List[Any]]:
+        """{source_id: [row(id, chunk_index, content_hash, metadata_, source, scope_key)]} in one query."""
+        existing: Dict[str, List[Any]] = {}
+        if not source_ids:
+            return existing
+        rows = session.execute(
+            select(
+                DocumentChunk.id, DocumentChunk.source_id, DocumentChunk.chunk_index,
+                DocumentChunk.content_hash, DocumentChunk.metadata_,
+                DocumentChunk.source, DocumentChunk.scope_key,
+            ).where(DocumentChunk.source_id.in_(source_ids))
+        )
+        for row in rows:
+            existing.setdefault(row.source_id, []).append(row)
+        return existing
+
+    def _plan(self, source_id: Optional[str], chunks: List[Document], hashes: List[str],
+              existing: Dict[int, Any], principal_ids: Dict) -> DocumentPlan:
+        plan = DocumentPlan(source_id=source_id)
+        for i, (chunk, h) in enumerate(zip(chunks, hashes)):
+            source, scope_key = chunk_scope(chunk.metadata)
+            values = {
+                "source_id": source_id,
+                "chunk_index": i,
+                "content": chunk.page_content,
+                "content_hash": h,
+                "metadata_": chunk.metadata, # ACLs are here
+                "acl_ids": acl_ids_for(chunk.metadata, principal_ids),
+                "source": source,
+                "scope_key": scope_key,
+            }
+            current = existing.get(i)
+            if current is None:
+                plan.inserts.append(values)
+                plan.needs_embedding.append(values)
+            elif current.content_hash != h:
+                values["id"] = current.id
+                plan.updates.append(values)
+                plan.needs_embedding.append(values)
+            elif current.metadata_ != chunk.metadata:
+                # Same text (keep the embedding), but title/ACL/space changed.
+                # A new source or space moves the row to its partition.
+                plan.metadata_updates.append({
+                    "id": current.id, "metadata_": values["metadata_"], "acl_ids": values["acl_ids"],
+                    "source": source, "scope_key": scope_key,
+                })
+            else:
+                plan.unchanged += 1
+        if any(idx >= len(chunks) for idx in existing):
+            # The new version of the document is shorter
+            plan.delete_from_index = len(chunks)
+        return plan
+
+    # The stages below are run in-line by process_documents, or on separate
+    # threads connected by bounded queues by app.pipeline.IngestionPipeline.
+
+    def split(self, documents: List[Document]) -> List[SplitDocument]:
+        return split_documents(documents)
+
+    def plan(self, session: Session, split_docs: List[SplitDocument]) -> List[DocumentPlan]:
+        """Diffs split documents against what is stored."""
+        # Encode ACL principals (groups/users) once for the whole batch
+        principal_ids = resolve_principals(
+            session, set().union(*(metadata_principals(doc.metadata) for doc, _, _ in split_docs))
+        )
+        session.commit()
+
+        existing = self._existing_chunks(session, [d.metadata["source_id"] for d, _, _ in split_docs if d.metadata.get("source_id")])
+        session.commit() # don't sit idle in transaction while the batch is embedded
+        plans = []
+        for doc, chunks, hashes in split_docs:
+            source_id = doc.metadata.get("source_id")
+            current, surplus = current_chunks(existing.get(source_id, []) if source_id else [], chunk_scope(doc.metadata))
+            plan = self._plan(source_id, chunks, hashes, current, principal_ids)
+            plan.delete_ids = surplus
+            plans.append(plan)
+        return plans
+
+    def embed(self, plans: List[DocumentPlan]) -> List[DocumentPlan]:
+        """Embeds only new/changed chunks, across all documents (deduped, batched, concurrent)."""
+        to_embed = [values for plan in plans for values in plan.needs_embedding]
+        for values, vector in zip(to_embed, self.embedder.embed([v["content"] for v in to_embed])):
+            values["embedding"] = vector
+        return plans
+
+    def write(self, session: Session, plans: List[DocumentPlan], stats: Dict[str, int]):
+        """COPY/INSERT, committed every INGEST_COMMIT_ROWS rows, never splitting a document."""
+        written = self.writer.write(session, plans)
+        stats["documents"] += len(plans)
+        stats["unchanged"] += sum(plan.unchanged for plan in plans)
+        for key in ("inserted", "updated", "deleted"):
+            stats[key] += written[key]
+
+    def delete_sources(self, source_ids: Iterable[str], where: Iterable = ()) -> int:
+        """
+        Removes every chunk of the given source documents (deleted upstream); returns chunks deleted.
+        `where`: extra clauses limiting the delete, e.g. a sync source's scope, so a document
+        that moved to another space/project keeps the chunks ingested there.
+        """
+        source_ids = list(source_ids)
+        if not source_ids:
+            return 0
         try:
-            self.db.bulk_save_objects(chunks_to_save)
+            deleted = self.db.execute(
+                delete(DocumentChunk).where(DocumentChunk.source_id.in_(source_ids), *where)
+            ).rowcount
+            if deleted:
+                bump_generation(self.db, source_ids)
             self.db.commit()
-            logging.info(f"Saved {len(chunks_to_save)} chunks to DB.")
+        except Exception:
+            self.db.rollback()
+            raise
+        logging.info(f"Deleted {deleted} chunks of {len(source_ids)} removed source documents")
+        return deleted
+
+    def process_documents(self, documents: Iterable[Document], batch_docs: int = None) -> Dict[str, int]:
+        """
+        Idempotent, incremental ingestion keyed by (source_id, chunk_index).
+        Unchanged chunks (same content hash and metadata) are neither re-embedded nor
+        written, changed chunks are updated in place, new ones inserted, and chunks
+        beyond the end of a shortened document deleted.
+
+        Documents are consumed `batch_docs` at a time, so memory is bounded by the
+        batch rather than the corpus. A source document is always written in a
+        single transaction.
+        """
+        stats = empty_stats()
+
+        try:
+            for batch in batched(documents, batch_docs or config.INGEST_BATCH_DOCS):
+                logging.info(f"Processing {len(batch)} documents...")
+                plans = self.embed(self.plan(self.db, self.split(batch)))
+                self.write(self.db, plans, stats)
+
+            logging.info(
+                f"Saved chunks to DB: {stats['inserted']} inserted, {stats['updated']} updated, "
+                f"{stats['deleted']} deleted, {stats['unchanged']} unchanged across {stats['documents']} documents."
+            )
+            return stats
         except Exception as e:
             self.db.rollback()
             logging.error(f"Failed to save chunks: {e}")
@@ -64,17 +229,15 @@ class IngestionService:
 if __name__ == "__main__":
     # Test Run
     from app.loaders import SecureConfluenceLoader, SecureJiraLoader
-    
+    from app.pipeline import IngestionPipeline
+    from itertools import chain
+
     logging.basicConfig(level=logging.INFO)
-    
-    # 1. Load
+
+    # 1. Load (lazily, page by page)
     conf_loader = SecureConfluenceLoader("http://mock", "user", "key")
     jira_loader = SecureJiraLoader("http://mock", "user", "key")
-    
-    docs = []
-    docs.extend(conf_loader.load())
-    docs.extend(jira_loader.load("project=ALL"))
-    
-    # 2. Ingest
-    ingestion = IngestionService()
-    ingestion.process_documents(docs)
+    docs = chain(conf_loader.lazy_load(), jira_loader.lazy_load("project=ALL"))
+
+    # 2. Ingest: load -> split -> embed -> write, connected by bounded queues
+    IngestionPipeline(IngestionService()).run(docs)
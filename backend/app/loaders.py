@@ -1,17 +1,193 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+from datetime import datetime, timezone
 from langchain_core.documents import Document
 # from langchain_community.document_loaders import ConfluenceLoader, JiraLoader
+import html
+import logging
 import os
+import re
+import httpx
+
+from app import config
+
+logger = logging.getLogger(__name__)
+
+MOCK_URL = "http://mock"
+PAGE_SIZE = int(os.getenv("LOADER_PAGE_SIZE", "50"))
+
+_TAG_RE = re.compile(r"<[^>]+>")
+
+# (source_id, allowed_groups, allowed_users), for reconciling permissions without fetching bodies
+PermissionEntry = Tuple[str, List[str], List[str]]
+
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    # Confluence: 2024-05-01T10:00:00.000Z, Jira: 2024-05-01T10:00:00.000+0000
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).astimezone(timezone.utc)
+
+def _storage_to_text(storage: str) -> str:
+    # Confluence "storage" format is XHTML; the splitter only needs the text
+    text = _TAG_RE.sub(" ", storage or "")
+    return " ".join(html.unescape(text).split())
+
+def _read_restrictions(content: Dict[str, Any]) -> Optional[Tuple[List[str], List[str]]]:
+    """(groups, users) of a page's or ancestor's read restrictions, None if they weren't returned."""
+    read = content.get("restrictions", {}).get("read", {}).get("restrictions")
+    if not read or "group" not in read or "user" not in read:
+        return None
+    groups = [f"group:{g['name']}" for g in read["group"].get("results", [])]
+    users = [u.get("username") or u.get("accountId") for u in read["user"].get("results", [])]
+    return groups, users
 
 class SecureConfluenceLoader:
-    def __init__(self, url: str, username: str, api_key: str):
-        self.url = url
+    # The page's own read restrictions and those of its ancestors (inherited by the page)
+    RESTRICTIONS = (
+        "restrictions.read.restrictions.group,restrictions.read.restrictions.user,"
+        "ancestors.restrictions.read.restrictions.group,ancestors.restrictions.read.restrictions.user"
+    )
+    EXPAND = f"body.storage,space,version,{RESTRICTIONS}"
+
+    def __init__(self, url: str, username: str, api_key: str,
+                 page_size: int = PAGE_SIZE, space_groups: Dict[str, List[str]] = None):
+        self.url = url.rstrip("/")
         self.username = username
         self.api_key = api_key
+        self.page_size = page_size
+        # Space key -> groups that can view the space (CONFLUENCE_SPACE_GROUPS). Pages in
+        # unlisted spaces are indexed with no groups: we can't tell who may view them.
+        self.space_groups = config.CONFLUENCE_SPACE_GROUPS if space_groups is None else space_groups
+        self._unmapped_spaces = set()
         # In real impl, we initialize the official loader here
         # self.loader = ConfluenceLoader(...)
 
     def load(self, space_key: str = None, page_ids: List[str] = None) -> List[Document]:
+        return list(self.lazy_load(space_key, page_ids))
+
+    def lazy_load(self, space_key: str = None, page_ids: List[str] = None) -> Iterator[Document]:
+        """
+        Yields pages one at a time, fetching `page_size` pages per API call, so
+        memory doesn't depend on the size of the space.
+        """
+        if self.url == MOCK_URL:
+            yield from (d for d in self._mock_load(space_key) if not page_ids or d.metadata["source_id"] in page_ids)
+            return
+        with self._client() as client:
+            if page_ids:
+                for page_id in page_ids:
+                    resp = client.get(f"/rest/api/content/{page_id}", params={"expand": self.EXPAND})
+                    if resp.status_code == 404:
+                        continue # deleted since it was listed
+                    resp.raise_for_status()
+                    yield self._to_document(resp.json())
+                return
+            params = {"type": "page", "expand": self.EXPAND}
+            if space_key:
+                params["spaceKey"] = space_key
+            for page in self._pages(client, "/rest/api/content", params):
+                yield self._to_document(page)
+
+    def changed_since(self, since: datetime, space_key: str = None) -> Iterator[Document]:
+        """
+        Pages created or edited at or after `since` (CQL lastmodified, minute precision,
+        so the boundary minute is fetched again; re-ingesting it is a no-op).
+        Permission-only changes and deletions don't show up here; see list_permissions.
+        """
+        if self.url == MOCK_URL:
+            yield from self._mock_load(space_key)
+            return
+        cql = f'type = page AND lastmodified >= "{since.astimezone(timezone.utc):%Y-%m-%d %H:%M}"'
+        if space_key:
+            cql = f'space = "{space_key}" AND {cql}'
+        with self._client() as client:
+            for page in self._pages(client, "/rest/api/content/search", {"cql": cql, "expand": self.EXPAND}):
+                yield self._to_document(page)
+
+    def list_permissions(self, space_key: str = None) -> Iterator[PermissionEntry]:
+        """Every page id in the space with its read ACL, without bodies."""
+        if self.url == MOCK_URL:
+            for doc in self._mock_load(space_key):
+                yield doc.metadata["source_id"], doc.metadata["allowed_groups"], doc.metadata["allowed_users"]
+            return
+        params = {"type": "page", "expand": f"space,{self.RESTRICTIONS}"}
+        if space_key:
+            params["spaceKey"] = space_key
+        with self._client() as client:
+            for page in self._pages(client, "/rest/api/content", params):
+                yield (page["id"], *self._acl(page))
+
+    def _client(self) -> httpx.Client:
+        return httpx.Client(base_url=self.url, auth=(self.username, self.api_key), timeout=30)
+
+    def _pages(self, client: httpx.Client, path: str, params: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        params = {**params, "limit": self.page_size}
+        start = 0
+        while True:
+            resp = client.get(path, params={**params, "start": start})
+            resp.raise_for_status()
+            data = resp.json()
+            results = data.get("results", [])
+            yield from results
+            if not results or "next" not in data.get("_links", {}):
+                return
+            start += len(results)
+
+    def _acl(self, page: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+        """
+        Read ACL of a page. A reader needs View permission on the space, and Confluence
+        applies every ancestor's view restrictions on top of the page's own, so a reader
+        must pass each restricted level too. Unrestricted pages (no restrictions anywhere
+        up the tree) get the space's groups; otherwise only the groups allowed at every
+        level and in the space are kept, plus the users allowed at every level. Pages
+        of an unmapped space, or with restrictions missing from the response, get no ACL.
+        """
+        space = page.get("space", {}).get("key")
+        if space not in self.space_groups:
+            if space not in self._unmapped_spaces:
+                self._unmapped_spaces.add(space)
+                logger.warning(f"Confluence space {space} has no CONFLUENCE_SPACE_GROUPS entry; its pages get no access")
+            return [], []
+        space_groups = self.space_groups[space]
+        if "ancestors" not in page:
+            logger.warning(f"Confluence page {page.get('id')}: ancestors not returned, indexing it with no access")
+            return [], []
+        levels = []
+        for content in [*page["ancestors"], page]:
+            acl = _read_restrictions(content)
+            if acl is None:
+                logger.warning(
+                    f"Confluence page {page.get('id')}: read restrictions of {content.get('id')} not returned, "
+                    "indexing it with no access"
+                )
+                return [], []
+            if acl[0] or acl[1]:
+                levels.append(acl)
+        if not levels:
+            return list(space_groups), []
+        # Nearest restricted level first, so the page's own order is kept
+        (groups, users), *outer = reversed(levels)
+        groups = [g for g in groups if g in space_groups and all(g in level[0] for level in outer)]
+        users = [u for u in users if all(u in level[1] for level in outer)]
+        return groups, users
+
+    def _to_document(self, page: Dict[str, Any]) -> Document:
+        groups, users = self._acl(page)
+        metadata = {
+            "source": "confluence",
+            "source_id": page["id"],
+            "title": page["title"],
+            "url": self.url + page.get("_links", {}).get("webui", f"/pages/viewpage.action?pageId={page['id']}"),
+            "space_key": page.get("space", {}).get("key"),
+            "allowed_groups": groups,
+            "allowed_users": users,
+        }
+        updated = _parse_timestamp(page.get("version", {}).get("when"))
+        if updated:
+            metadata["updated_at"] = updated.isoformat()
+        body = page.get("body", {}).get("storage", {}).get("value", "")
+        return Document(page_content=_storage_to_text(body), metadata=metadata)
+
+    def _mock_load(self, space_key: str = None) -> Iterator[Document]:
         """
         Mock implementation that returns documents with ACL metadata.
         In production, this would make API calls to fetch permissions.
@@ -25,7 +201,7 @@ class SecureConfluenceLoader:
                 "space": "HR",
                 "url": f"{self.url}/display/HR/Handbook",
                 # Publicly readable by all employees
-                "permissions": ["group:confluence-users"] 
+                "permissions": ["group:confluence-users"]
             },
             {
                 "id": "1002",
@@ -38,12 +214,11 @@ class SecureConfluenceLoader:
             }
         ]
 
-        documents = []
         for page in mock_pages:
             # FILTER: If user asks for specific space, filter here
             if space_key and page["space"] != space_key:
                 continue
-                
+
             metadata = {
                 "source": "confluence",
                 "source_id": page["id"],
@@ -54,17 +229,136 @@ class SecureConfluenceLoader:
                 "allowed_groups": page["permissions"],
                 "allowed_users": [] # Example if we had specific user grants
             }
-            
-            doc = Document(page_content=page["body"], metadata=metadata)
-            documents.append(doc)
-            
-        return documents
+
+            yield Document(page_content=page["body"], metadata=metadata)
 
 class SecureJiraLoader:
-    def __init__(self, url: str, username: str, api_key: str):
-        self.url = url
-        
+    FIELDS = "summary,description,status,project,security,updated"
+
+    def __init__(self, url: str, username: str, api_key: str,
+                 page_size: int = PAGE_SIZE, project_groups: Dict[str, List[str]] = None):
+        self.url = url.rstrip("/")
+        self.username = username
+        self.api_key = api_key
+        self.page_size = page_size
+        # Project key -> groups with Browse permission (JIRA_PROJECT_GROUPS). Issues in
+        # unlisted projects are indexed with no groups: we can't tell who may browse them.
+        self.project_groups = config.JIRA_PROJECT_GROUPS if project_groups is None else project_groups
+        self._unmapped_projects = set()
+        self._security_levels = set()
+
     def load(self, jql: str) -> List[Document]:
+        return list(self.lazy_load(jql))
+
+    def lazy_load(self, jql: str) -> Iterator[Document]:
+        """Yields issues one at a time, paging through /search `page_size` issues per call."""
+        if self.url == MOCK_URL:
+            yield from self._mock_load(jql)
+            return
+        with self._client() as client:
+            for issue in self._issues(client, jql, self.FIELDS):
+                yield self._to_document(issue)
+
+    def changed_since(self, since: datetime, jql: str) -> Iterator[Document]:
+        """
+        Issues in `jql` updated at or after `since`. Setting an issue security level
+        is an edit, so it bumps `updated`; project permission changes and deletions
+        don't, see list_permissions. JQL dates are in the API user's time zone,
+        which should be UTC.
+        """
+        if self.url == MOCK_URL:
+            yield from self._mock_load(jql)
+            return
+        jql = f'({jql}) AND updated >= "{since.astimezone(timezone.utc):%Y/%m/%d %H:%M}" ORDER BY updated ASC'
+        with self._client() as client:
+            for issue in self._issues(client, jql, self.FIELDS):
+                yield self._to_document(issue)
+
+    def load_keys(self, keys: List[str]) -> Iterator[Document]:
+        """Fetches specific issues (e.g. after their ACL changed), 50 keys per query."""
+        if self.url == MOCK_URL:
+            yield from (d for d in self._mock_load("") if d.metadata["source_id"] in keys)
+            return
+        with self._client() as client:
+            for i in range(0, len(keys), 50):
+                jql = f"key in ({', '.join(keys[i:i + 50])})"
+                for issue in self._issues(client, jql, self.FIELDS):
+                    yield self._to_document(issue)
+
+    def list_permissions(self, jql: str) -> Iterator[PermissionEntry]:
+        """Every issue key in `jql` with its ACL, without descriptions."""
+        if self.url == MOCK_URL:
+            for doc in self._mock_load(jql):
+                yield doc.metadata["source_id"], doc.metadata["allowed_groups"], doc.metadata["allowed_users"]
+            return
+        with self._client() as client:
+            for issue in self._issues(client, jql, "project,security"):
+                yield issue["key"], self._groups(issue["fields"]), []
+
+    def _client(self) -> httpx.Client:
+        return httpx.Client(base_url=self.url, auth=(self.username, self.api_key), timeout=30)
+
+    def _issues(self, client: httpx.Client, jql: str, fields: str) -> Iterator[Dict[str, Any]]:
+        start_at = 0
+        while True:
+            resp = client.get("/rest/api/2/search", params={
+                "jql": jql,
+                "startAt": start_at,
+                "maxResults": self.page_size,
+                "fields": fields,
+            })
+            resp.raise_for_status()
+            data = resp.json()
+            issues = data.get("issues", [])
+            yield from issues
+            start_at += len(issues)
+            if not issues or start_at >= data.get("total", 0):
+                return
+
+    def _groups(self, fields: Dict[str, Any]) -> List[str]:
+        security = fields.get("security")
+        if security:
+            # Only the level's members can see the issue. They can be groups, project
+            # roles, the reporter or the assignee, and the level's name is none of them;
+            # without a way to resolve the members, nobody gets access.
+            if security.get("id") not in self._security_levels:
+                self._security_levels.add(security.get("id"))
+                logger.warning(
+                    f"Jira issue security level {security.get('name')!r} can't be resolved to groups; "
+                    "its issues get no access"
+                )
+            return []
+        project = fields.get("project", {}).get("key")
+        if project not in self.project_groups:
+            if project not in self._unmapped_projects:
+                self._unmapped_projects.add(project)
+                logger.warning(f"Jira project {project} has no JIRA_PROJECT_GROUPS entry; its issues get no access")
+            return []
+        return list(self.project_groups[project])
+
+    def _to_document(self, issue: Dict[str, Any]) -> Document:
+        fields = issue["fields"]
+        project = fields.get("project", {}).get("key")
+        groups = self._groups(fields)
+        content = (
+            f"Summary: {fields.get('summary', '')}\nDescription: {fields.get('description') or ''}\n"
+            f"Status: {fields.get('status', {}).get('name', '')}"
+        )
+        metadata = {
+            "source": "jira",
+            "source_id": issue["key"],
+            "title": issue["key"] + ": " + fields.get("summary", ""),
+            "url": f"{self.url}/browse/{issue['key']}",
+            "project_key": project,
+            "allowed_groups": groups,
+            "allowed_users": []
+        }
+        updated = _parse_timestamp(fields.get("updated"))
+        if updated:
+            metadata["updated_at"] = updated.isoformat()
+        return Document(page_content=content, metadata=metadata)
+
+    def _mock_load(self, jql: str) -> Iterator[Document]:
         """
         Mock implementation for Jira issues with Project Role mapping.
         """
@@ -89,11 +383,10 @@ class SecureJiraLoader:
                 "permissions": ["group:hr-administrators"]
             }
         ]
-        
-        documents = []
+
         for issue in mock_issues:
             content = f"Summary: {issue['summary']}\nDescription: {issue['description']}\nStatus: {issue['status']}"
-            
+
             metadata = {
                 "source": "jira",
                 "source_id": issue["key"],
@@ -103,7 +396,5 @@ class SecureJiraLoader:
                 "allowed_groups": issue["permissions"],
                 "allowed_users": []
             }
-            
-            documents.append(Document(page_content=content, metadata=metadata))
-            
-        return documents
+
+            yield Document(page_content=content, metadata=metadata)
@@ -1,12 +1,49 @@
-from fastapi import FastAPI, HTTPException, Depends
-from .schemas import ChatCompletionRequest, ChatCompletionResponse, ChatCompletionChoice, Message
+from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse, Response
+from typing import AsyncIterator, List, Optional
+from .schemas import (
+    ChatCompletionRequest, ChatCompletionResponse, ChatCompletionChoice, Message,
+    ChatCompletionChunk, ChatCompletionChunkChoice, DeltaMessage,
+    RetrieveRequest, RetrieveResponse, RetrieveBatchRequest, RetrieveBatchResponse, RetrieveBatchItem,
+    RetrievedChunkOut, ScopeFilter,
+)
 from .rag import RAGPipeline
+from .retrieval_backend import RetrievedChunk, SearchScope
+from .database import async_engine
+from . import metrics
+from . import config
+import logging
 import time
 import uuid
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="Internal RAG Agent", version="0.1.0")
 rag_pipeline = RAGPipeline()
 
+metrics.Gauge("rag_db_pool_checked_out", "Async pool connections currently in use", lambda: async_engine.pool.checkedout())
+metrics.Gauge("rag_db_pool_overflow", "Async pool connections opened beyond pool_size", lambda: max(async_engine.pool.overflow(), 0))
+
+@app.middleware("http")
+async def record_timings(request: Request, call_next):
+    timings = metrics.start_request_timing()
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.REQUEST_SECONDS.observe(
+        time.perf_counter() - started,
+        method=request.method, path=getattr(route, "path", "unmatched"), status=response.status_code,
+    )
+    if config.SERVER_TIMING:
+        # For stream=true the stages run after the headers are sent, so only "total" (to headers) shows up
+        timings["total"] = time.perf_counter() - started
+        response.headers["Server-Timing"] = metrics.server_timing_header(timings)
+    return response
+
+@app.on_event("shutdown")
+async def shutdown():
+    await async_engine.dispose()
+
 @app.get("/")
 def read_root():
     return {"status": "ok", "service": "rag-backend"}
@@ -15,31 +52,107 @@ def read_root():
 def health_check():
     return {"status": "healthy"}
 
+@app.get("/stats")
+def stats():
+    """Per-worker cache counters, for sizing the caches."""
+    return {
+        "embedding_cache": rag_pipeline.search_service.embeddings.cache.stats(),
+        "retrieval_cache": rag_pipeline.search_service.cache.stats(),
+        "answer_cache": rag_pipeline.answer_cache.stats(),
+    }
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Per-worker stage latencies, search errors/empty results, cache hits and pool wait (Prometheus text format)."""
+    return Response(metrics.render(), media_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+def resolve_user_groups(user: str) -> List[str]:
+    # Resolve User Context (Mock ACL for now)
+    # In prod, get user from header/token (request.user)
+    # Mapping logic: if user="marketing", groups=["group:marketing"]
+    current_user = user or "guest"
+    user_groups = ["group:everyone"]
+    if current_user == "admin" or current_user == "dev":
+        user_groups.append("group:dev")
+    if current_user == "exec":
+        user_groups.append("group:executives")
+    return user_groups
+
+def search_scope(scope: Optional[ScopeFilter]) -> Optional[SearchScope]:
+    # Canonical key order, so equal filters share cache entries
+    if scope is None:
+        return None
+    return SearchScope(source=scope.source, scope_keys=tuple(sorted(set(scope.keys))))
+
+def _sse(chunk: ChatCompletionChunk) -> str:
+    return f"data: {chunk.model_dump_json(exclude_none=True)}\n\n"
+
+async def stream_chat_completion(request: ChatCompletionRequest, last_query: str, user_groups: List[str]) -> AsyncIterator[str]:
+    """
+    OpenAI-style SSE stream: a role delta, content deltas, a finish chunk, then [DONE].
+    The role delta goes out before retrieval starts so the client sees the
+    response open immediately; time-to-first-token is logged separately from total.
+    """
+    completion_id = f"chatcmpl-{uuid.uuid4()}"
+    created = int(time.time())
+
+    def chunk(delta: DeltaMessage, finish_reason=None) -> str:
+        return _sse(ChatCompletionChunk(
+            id=completion_id,
+            created=created,
+            model=request.model,
+            choices=[ChatCompletionChunkChoice(index=0, delta=delta, finish_reason=finish_reason)],
+        ))
+
+    started = time.perf_counter()
+    first_token_at = None
+    yield chunk(DeltaMessage(role="assistant"))
+
+    async for piece in rag_pipeline.stream_query(
+        last_query, user_groups, ef_search=request.ef_search, probes=request.ivfflat_probes,
+        scope=search_scope(request.scope),
+    ):
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+        yield chunk(DeltaMessage(content=piece))
+
+    yield chunk(DeltaMessage(), finish_reason="stop")
+    yield "data: [DONE]\n\n"
+
+    total = time.perf_counter() - started
+    ttft = (first_token_at - started) if first_token_at else total
+    logger.info(f"stream {completion_id}: ttft={ttft * 1000:.1f}ms total={total * 1000:.1f}ms")
+
 @app.post("/v1/chat/completions", response_model=ChatCompletionResponse)
 async def chat_completions(request: ChatCompletionRequest):
     """
     OpenAI-compatible endpoint to integrate with Kotaemon/OpenWebUI.
+    With stream=true, answers are sent as text/event-stream chat.completion.chunk deltas.
     """
     # 1. Extract latest user query
     user_messages = [m for m in request.messages if m.role == "user"]
     if not user_messages:
         raise HTTPException(status_code=400, detail="No user message found")
-    
+
     last_query = user_messages[-1].content
-    
-    # 2. Resolve User Context (Mock ACL for now)
-    # In prod, get user from header/token (request.user)
-    # Mapping logic: if user="marketing", groups=["group:marketing"]
-    current_user = request.user or "guest"
-    user_groups = ["group:everyone"]
-    if current_user == "admin" or current_user == "dev":
-        user_groups.append("group:dev")
-    if current_user == "exec":
-        user_groups.append("group:executives")
-        
+
+    # 2. Resolve User Context
+    user_groups = resolve_user_groups(request.user)
+
+    if request.stream:
+        return StreamingResponse(
+            stream_chat_completion(request, last_query, user_groups),
+            media_type="text/event-stream",
+            # Keep proxies (nginx) from buffering the stream
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
     # 3. Use RAG Pipeline
-    answer = rag_pipeline.query(last_query, user_groups)
-    
+    answer = await rag_pipeline.query(
+        last_query, user_groups, ef_search=request.ef_search, probes=request.ivfflat_probes,
+        scope=search_scope(request.scope),
+    )
+
     # 4. Format Response (OpenAI style)
     return ChatCompletionResponse(
         id=f"chatcmpl-{uuid.uuid4()}",
@@ -54,3 +167,40 @@ async def chat_completions(request: ChatCompletionRequest):
         ],
         usage={"prompt_tokens": len(last_query), "completion_tokens": len(answer), "total_tokens": len(last_query)+len(answer)}
     )
+
+def _chunk_out(chunk: RetrievedChunk) -> RetrievedChunkOut:
+    return RetrievedChunkOut(
+        id=chunk.id, source_id=chunk.source_id, chunk_index=chunk.chunk_index, content=chunk.content,
+        title=chunk.title, url=chunk.url, score=chunk.score,
+        dense_distance=chunk.dense_distance, sparse_score=chunk.sparse_score,
+    )
+
+@app.post("/v1/retrieve", response_model=RetrieveResponse)
+async def retrieve(request: RetrieveRequest):
+    """Ranked chunks (hybrid search + RRF, ACL-filtered) for one query, without reranking or generation."""
+    user_groups = resolve_user_groups(request.user)
+    results = await rag_pipeline.search_service.search(
+        request.query, user_groups, limit=request.limit, ef_search=request.ef_search, probes=request.ivfflat_probes,
+        scope=search_scope(request.scope),
+    )
+    return RetrieveResponse(query=request.query, results=[_chunk_out(c) for c in results])
+
+@app.post("/v1/retrieve/batch", response_model=RetrieveBatchResponse)
+async def retrieve_batch(request: RetrieveBatchRequest):
+    """
+    /v1/retrieve for many queries of one user: the queries are embedded in one call and,
+    on Postgres, searched in a single SQL statement. data[i] answers queries[i].
+    """
+    if len(request.queries) > config.RETRIEVE_BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=400, detail=f"At most {config.RETRIEVE_BATCH_MAX_QUERIES} queries per batch"
+        )
+    user_groups = resolve_user_groups(request.user)
+    results = await rag_pipeline.search_service.search_many(
+        request.queries, user_groups, limit=request.limit, ef_search=request.ef_search, probes=request.ivfflat_probes,
+        scope=search_scope(request.scope),
+    )
+    return RetrieveBatchResponse(data=[
+        RetrieveBatchItem(index=i, query=query, results=[_chunk_out(c) for c in chunks])
+        for i, (query, chunks) in enumerate(zip(request.queries, results))
+    ])
@@ -0,0 +1,203 @@
+"""
+In-process metrics, served in Prometheus text format at /metrics.
+
+Deliberately tiny (histograms, counters and callback gauges) so the request path
+needs no extra dependency. Values are per worker process, like /stats. Scrape
+each uvicorn worker, or run a single worker per container.
+
+`stage(name)` times a block into rag_stage_seconds{stage=name}. Inside a request
+started with `start_request_timing()` the same durations are also collected
+per request, for the Server-Timing header (see SERVER_TIMING in config).
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import bisect
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: List["_Metric"] = []
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], list] = {} # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            if idx < len(self.buckets):
+                entry[idx] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return entry[-1] if entry else 0
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(entry)) for key, entry in self._values.items())
+        for key, entry in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, entry):
+                cumulative += n
+                le = 'le="%s"' % _format_value(bound)
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            inf = 'le="+Inf"'
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, inf)} {entry[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(entry[-2])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {entry[-1]}"
+
+class Gauge(_Metric):
+    """Read at scrape time from a callback."""
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float]):
+        super().__init__(name, help)
+        self.fn = fn
+
+    def samples(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return
+        yield f"{self.name} {_format_value(value)}"
+
+def render() -> str:
+    """All registered metrics in Prometheus text exposition format."""
+    return "\n".join(m.render() for m in _registry) + "\n"
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Request path
+REQUEST_SECONDS = Histogram("rag_request_seconds", "HTTP request latency", ["method", "path", "status"])
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds",
+    "Latency of one pipeline stage (embed, dense, sparse, fused_query, fusion, search, rerank, generate, ...)",
+    ["stage"],
+)
+SEARCH_ERRORS = Counter("rag_search_errors_total", "Searches that failed and returned no results", ["error"])
+EMPTY_RESULTS = Counter("rag_search_empty_results_total", "Searches that returned no chunks")
+RERANK_BUDGET_EXCEEDED = Counter(
+    "rag_rerank_budget_exceeded_total", "Reranks that ran past RERANK_BUDGET_MS and kept RRF order"
+)
+CONTEXT_TOKENS = Histogram(
+    "rag_context_tokens", "Prompt context tokens per request (app/context.py)",
+    buckets=(128, 256, 512, 1024, 2048, 4096, 8192, 16384),
+)
+CONTEXT_TOKENS_SAVED = Counter(
+    "rag_context_tokens_saved_total", "Context tokens saved by overlap merging and the budget, vs. the verbatim join"
+)
+QUERY_EMBED_BATCH_SIZE = Histogram(
+    "rag_query_embed_batch_size", "Query texts per batched embedding call (app/embedding_batcher.py)",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+QUERY_EMBED_QUEUE_SECONDS = Histogram(
+    "rag_query_embed_queue_seconds", "Time a query waited for its embedding batch to be sent",
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+CACHE_REQUESTS = Counter("rag_cache_requests_total", "Cache lookups by cache and outcome", ["cache", "result"])
+DB_POOL_WAIT_SECONDS = Histogram(
+    "rag_db_pool_wait_seconds", "Time to check out a connection from the async pool (includes connecting)",
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+
+# Per-request timings for Server-Timing: stage -> accumulated seconds
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+def start_request_timing() -> Dict[str, float]:
+    timings: Dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+@contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        timings = _request_timings.get()
+        if timings is not None:
+            # Parallel legs share the dict (asyncio tasks copy the context, not the dict)
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items())
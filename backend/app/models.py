@@ -1,16 +1,55 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime
-from sqlalchemy.dialects.postgresql import JSONB
+from typing import Tuple
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, Computed, Index, UniqueConstraint
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, TSVECTOR
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
 from pgvector.sqlalchemy import Vector
 from .database import Base
+from . import config
+
+# Full-text document for the keyword leg: title (weight A) outranks body (weight B).
+# Must stay immutable (two-argument to_tsvector) to be usable as a generated column.
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('english', coalesce(metadata->>'title', '')), 'A') || "
+    "setweight(to_tsvector('english', content), 'B')"
+)
+
+def chunk_scope(metadata: dict) -> Tuple[str, str]:
+    """(source, scope_key) of a chunk: the source system and its Confluence space / Jira project."""
+    metadata = metadata or {}
+    return (
+        metadata.get("source") or "",
+        metadata.get("space_key") or metadata.get("project_key") or "",
+    )
+
+# Partitioned tables need the partition key in every unique index, primary key included
+PARTITIONED = config.CHUNK_PARTITIONING
+PARTITION_KEY = ("source", "scope_key") if PARTITIONED else ()
 
 class DocumentChunk(Base):
     __tablename__ = "document_chunks"
+    __table_args__ = (
+        Index("ix_document_chunks_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_document_chunks_acl_ids", "acl_ids", postgresql_using="gin"),
+        # Identity of a chunk for idempotent re-ingestion (upsert target). Partitioned, it is only
+        # unique per (source, scope_key): ingestion moves a document's rows when its space changes
+        # and deletes copies left in another scope (app/ingestion.py current_chunks).
+        Index("uq_document_chunks_source_chunk", "source_id", "chunk_index", *PARTITION_KEY, unique=True),
+        Index("ix_document_chunks_scope", "source", "scope_key"),
+        # Partitions themselves are created by app/schema.py (ensure_partitions)
+        {"postgresql_partition_by": "LIST (source)"} if PARTITIONED else {},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     source_id = Column(String, index=True) # e.g., CONF-1234, JIRA-555
     chunk_index = Column(Integer)
     content = Column(Text, nullable=False)
+    content_hash = Column(String(64)) # sha256 hex of content; unchanged chunks skip re-embedding
+
+    # chunk_scope(metadata), as columns so search can filter on them and Postgres can
+    # prune partitions: source is the LIST partition key, scope_key the HASH sub-partition key
+    source = Column(String, primary_key=PARTITIONED, nullable=False, default="", server_default="")
+    scope_key = Column(String, primary_key=PARTITIONED, nullable=False, default="", server_default="")
     
     # 1536 dimensions for OpenAI text-embedding-3-small
     # Adjust to 768 or 384 if using local models (e.g. BGE, BERT)
@@ -19,9 +58,66 @@ class DocumentChunk(Base):
     # Metadata for ACL and citations
     # Example: {"allowed_roles": ["hr"], "url": "...", "title": "..."}
     metadata_ = Column("metadata", JSONB, nullable=False, default={})
+
+    # Integer-encoded ACL: acl_principals ids for metadata allowed_groups + allowed_users.
+    # GIN-indexed; searched with `acl_ids && <caller's group ids>` (see app/acl.py).
+    acl_ids = Column(ARRAY(Integer), nullable=False, default=list, server_default="{}")
+
+    # Stored + GIN-indexed so keyword search is an index scan, not a per-row text parse.
+    # Deferred: only used inside SQL, never worth loading into Python.
+    search_vector = deferred(Column(TSVECTOR, Computed(SEARCH_VECTOR_SQL, persisted=True)))
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    # Rows are still identified by id alone (bulk updates by id, ORM identity)
+    __mapper_args__ = {"primary_key": [id]}
+
     def __repr__(self):
         return f"<DocumentChunk(id={self.id}, source={self.source_id})>"
+
+class AclPrincipal(Base):
+    """Dictionary of ACL principals (groups and users), encoded as small ints on chunks."""
+    __tablename__ = "acl_principals"
+    __table_args__ = (UniqueConstraint("kind", "name", name="uq_acl_principals_kind_name"),)
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False) # "group" or "user"
+    name = Column(String, nullable=False) # e.g. group:executives
+
+    def __repr__(self):
+        return f"<AclPrincipal(id={self.id}, {self.kind}={self.name})>"
+
+class CorpusGeneration(Base):
+    """
+    Single-row counter (id=1) bumped in the same transaction as every write to
+    document_chunks. Caches tag entries with it, so committed ingestion invalidates them.
+    """
+    __tablename__ = "corpus_generation"
+
+    id = Column(Integer, primary_key=True)
+    generation = Column(BigInteger, nullable=False, default=0)
+
+class CorpusChange(Base):
+    """
+    Which source documents each corpus generation wrote or deleted, so a cache
+    that is a few generations behind can drop just the entries citing them.
+    Pruned to the last CORPUS_CHANGE_RETENTION generations.
+    """
+    __tablename__ = "corpus_changes"
+
+    generation = Column(BigInteger, primary_key=True)
+    source_id = Column(String, primary_key=True)
+
+class SyncState(Base):
+    """Per sync source (e.g. confluence:ENG) high-water mark for delta sync (app/delta_sync.py)."""
+    __tablename__ = "sync_state"
+
+    source = Column(String, primary_key=True)
+    cursor = Column(DateTime(timezone=True)) # newest updated_at ingested; next run asks for changes since then
+    runs = Column(Integer, nullable=False, default=0)
+    last_success_at = Column(DateTime(timezone=True))
+    last_error = Column(Text)
+
+    def __repr__(self):
+        return f"<SyncState(source={self.source}, cursor={self.cursor})>"
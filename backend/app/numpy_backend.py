@@ -0,0 +1,382 @@
+"""
+In-process retrieval backend: the corpus exported from Postgres into a directory
+of .npy / .bin files, memory-mapped on open.
+
+- embeddings.npy: float32 (rows, dim) matrix. The dense leg is a blocked matrix
+  product (NUMPY_BLOCK_ROWS rows at a time) with the same distance as the
+  pgvector operator (VECTOR_DISTANCE), i.e. exact search.
+- Keyword index: vocab.json (term -> id) plus postings in CSR form. A posting's
+  weight is 1.0 per title occurrence and 0.4 per body occurrence, the ts_rank
+  weights of the A/B labels in search_vector. Queries follow websearch_to_tsquery:
+  all terms required, `-term` excludes, `or` separates alternatives.
+- ACLs: one bitset over rows per group (acl_bits.npy); the caller's groups are
+  OR-ed into a row mask, like `acl_ids && <caller's group ids>`.
+- Scopes: a code per row (scope_codes.npy) into the manifest's distinct
+  (source, scope_key) pairs; a SearchScope AND-s its codes into the row mask.
+- Strings (content, source_id, title, url) are UTF-8 blobs plus offsets, decoded
+  only for the rows that are returned.
+
+Opening maps the files without reading them, so a worker starts serving at once
+and every worker on the host shares the page cache. The index is a snapshot:
+rebuild it with `python build_numpy_index.py` after ingestion; manifest.json
+records the corpus generation it was exported at.
+
+Tokenizing is simpler than Postgres' english configuration (no stemming), so
+keyword results agree on exact terms, codes and identifiers, not on inflections.
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import asyncio
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+
+from app.acl import _names
+from app.retrieval_backend import RetrievalBackend, RetrievedChunk, SearchScope
+from app import config
+
+FORMAT_VERSION = 2
+STRING_COLUMNS = ("source_id", "title", "url", "content")
+TITLE_WEIGHT = 1.0 # ts_rank weight of label A
+BODY_WEIGHT = 0.4  # ts_rank weight of label B
+
+# PostgreSQL's english stop words (tsearch_data/english.stop)
+STOP_WORDS = frozenset("""
+i me my myself we our ours ourselves you your yours yourself yourselves he him his himself she her hers
+herself it its itself they them their theirs themselves what which who whom this that these those am is
+are was were be been being have has had having do does did doing a an the and but if or because as until
+while of at by for with about against between into through during before after above below to from up
+down in out on off over under again further then once here there when where why how all any both each few
+more most other some such no nor not only own same so than too very s t can will just don should now
+""".split())
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return [t for t in _TOKEN.findall((text or "").lower()) if t not in STOP_WORDS]
+
+def parse_query(query_text: str) -> List[Tuple[List[str], List[str]]]:
+    """websearch-style query -> alternatives of (required terms, excluded terms)."""
+    alternatives, required, excluded = [], [], []
+    for word in query_text.split():
+        if word.lower() == "or":
+            if required:
+                alternatives.append((required, excluded))
+            required, excluded = [], []
+            continue
+        terms = tokenize(word)
+        (excluded if word.startswith("-") else required).extend(terms)
+    if required:
+        alternatives.append((required, excluded))
+    return alternatives
+
+class _StringColumn:
+    """UTF-8 strings stored back to back, with (rows + 1) offsets."""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __getitem__(self, row: int) -> Optional[str]:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return bytes(self.blob[start:end]).decode("utf-8") if end > start else None
+
+def _open_blob(path: str) -> np.ndarray:
+    # np.memmap cannot map an empty file
+    return np.memmap(path, dtype=np.uint8, mode="r") if os.path.getsize(path) else np.zeros(0, dtype=np.uint8)
+
+class NumpyIndex:
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest["version"] != FORMAT_VERSION:
+            raise ValueError(f"{path}: index format {self.manifest['version']}, expected {FORMAT_VERSION}")
+        self.rows = self.manifest["rows"]
+        self.distance = self.manifest["distance"]
+        self.generation = self.manifest["generation"]
+
+        load = lambda name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        self.ids = load("ids")
+        self.chunk_indexes = load("chunk_index")
+        self.embeddings = load("embeddings")
+        self.norms = load("norms")
+        self.acl_bits = load("acl_bits")
+        self.scope_codes = load("scope_codes")
+        self.scopes = [tuple(pair) for pair in self.manifest["scopes"]]
+        self.postings_offsets = load("postings_offsets")
+        self.postings_rows = load("postings_rows")
+        self.postings_weights = load("postings_weights")
+        self.groups = {name: i for i, name in enumerate(self.manifest["groups"])}
+        with open(os.path.join(path, "vocab.json"), encoding="utf-8") as f:
+            self.vocab: Dict[str, int] = json.load(f)
+        self.strings = {
+            name: _StringColumn(_open_blob(os.path.join(path, f"{name}.bin")), load(f"{name}_offsets"))
+            for name in STRING_COLUMNS
+        }
+        self._rows_by_key: Optional[Dict[Tuple[str, int], int]] = None
+
+    def rows_for(self, keys: Iterable[Tuple[str, int]]) -> List[int]:
+        """Rows of the (source_id, chunk_index) keys that exist. The lookup table is built on first use."""
+        if self._rows_by_key is None:
+            source_ids = self.strings["source_id"]
+            self._rows_by_key = {(source_ids[row], int(self.chunk_indexes[row])): row for row in range(self.rows)}
+        return [self._rows_by_key[key] for key in keys if key in self._rows_by_key]
+
+    def visible_rows(self, allowed_groups: List[str], scope: Optional[SearchScope] = None) -> np.ndarray:
+        """Boolean mask of rows readable by any of `allowed_groups` (and inside `scope`, if given)."""
+        bits = [self.acl_bits[self.groups[g]] for g in allowed_groups if g in self.groups]
+        if not bits:
+            return np.zeros(self.rows, dtype=bool)
+        visible = np.unpackbits(np.bitwise_or.reduce(bits), count=self.rows).astype(bool)
+        if scope is not None:
+            codes = [
+                code for code, (source, scope_key) in enumerate(self.scopes)
+                if source == scope.source and (not scope.scope_keys or scope_key in scope.scope_keys)
+            ]
+            visible &= np.isin(self.scope_codes, codes)
+        return visible
+
+    def _distances(self, rows: np.ndarray, matrix: np.ndarray, query: np.ndarray, query_norm: float) -> np.ndarray:
+        dots = matrix @ query
+        if self.distance == "l2":
+            return np.sqrt(np.maximum(self.norms[rows] ** 2 - 2 * dots + query_norm ** 2, 0.0))
+        if self.distance == "cosine":
+            return 1.0 - dots / np.maximum(self.norms[rows] * query_norm, 1e-12)
+        return -dots # negative inner product, like pgvector's <#>
+
+    def dense(self, query_vec: List[float], allowed_groups: List[str], k: int,
+              block_rows: int = None, scope: Optional[SearchScope] = None) -> List[Tuple[int, float]]:
+        """[(row, distance)] of the k closest visible rows, closest first (ties by id)."""
+        block_rows = block_rows or config.NUMPY_BLOCK_ROWS
+        query = np.asarray(query_vec, dtype=np.float32)
+        query_norm = float(np.linalg.norm(query))
+        visible = self.visible_rows(allowed_groups, scope)
+        best_rows, best_distances = [], []
+        for start in range(0, self.rows, block_rows):
+            end = min(start + block_rows, self.rows)
+            mask = visible[start:end]
+            n_visible = int(mask.sum())
+            if not n_visible:
+                continue
+            if n_visible == end - start:
+                rows = np.arange(start, end)
+                matrix = self.embeddings[start:end]
+            else:
+                # Restricted callers: only gather (and multiply) the rows they can read
+                rows = start + np.flatnonzero(mask)
+                matrix = self.embeddings[rows]
+            distances = self._distances(rows, matrix, query, query_norm)
+            if len(rows) > k:
+                keep = np.argpartition(distances, k - 1)[:k]
+                rows, distances = rows[keep], distances[keep]
+            best_rows.append(rows)
+            best_distances.append(distances)
+        if not best_rows:
+            return []
+        rows, distances = np.concatenate(best_rows), np.concatenate(best_distances)
+        order = np.lexsort((self.ids[rows], distances))[:k]
+        return [(int(rows[i]), float(distances[i])) for i in order]
+
+    def _postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        term_id = self.vocab.get(term)
+        if term_id is None:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        start, end = self.postings_offsets[term_id], self.postings_offsets[term_id + 1]
+        return self.postings_rows[start:end], self.postings_weights[start:end]
+
+    def sparse(self, query_text: str, allowed_groups: List[str], k: int,
+               scope: Optional[SearchScope] = None) -> List[Tuple[int, float]]:
+        """[(row, score)] of the k best keyword matches among visible rows, best first (ties by id)."""
+        scores: Dict[int, float] = {}
+        for required, excluded in parse_query(query_text):
+            matched: Optional[np.ndarray] = None
+            total = np.zeros(0, dtype=np.float32)
+            for term in dict.fromkeys(required):
+                rows, weights = self._postings(term)
+                if matched is None:
+                    matched, total = np.asarray(rows), np.asarray(weights, dtype=np.float32)
+                    continue
+                # Postings are sorted by row, so AND is an intersection of sorted arrays
+                common, left, right = np.intersect1d(matched, rows, assume_unique=True, return_indices=True)
+                matched, total = common, total[left] + weights[right]
+            if matched is None or not len(matched):
+                continue
+            for term in excluded:
+                keep = ~np.isin(matched, self._postings(term)[0])
+                matched, total = matched[keep], total[keep]
+            for row, score in zip(matched.tolist(), total.tolist()):
+                scores[row] = max(scores.get(row, 0.0), score)
+        if not scores:
+            return []
+        rows = np.fromiter(scores, dtype=np.int64, count=len(scores))
+        values = np.fromiter(scores.values(), dtype=np.float64, count=len(scores))
+        keep = self.visible_rows(allowed_groups, scope)[rows]
+        rows, values = rows[keep], values[keep]
+        order = np.lexsort((self.ids[rows], -values))[:k]
+        return [(int(rows[i]), float(values[i])) for i in order]
+
+    def chunk(self, row: int, **scores) -> RetrievedChunk:
+        return RetrievedChunk(
+            id=int(self.ids[row]),
+            source_id=self.strings["source_id"][row],
+            chunk_index=int(self.chunk_indexes[row]),
+            content=self.strings["content"][row] or "",
+            title=self.strings["title"][row],
+            url=self.strings["url"][row],
+            **scores,
+        )
+
+def write_index(path: str, rows: Iterable[Dict[str, Any]], n_rows: int, dim: int,
+                generation: int = 0, distance: str = None) -> str:
+    """
+    Writes an index from `rows` (dicts with id, source_id, chunk_index, content,
+    title, url, embedding, allowed_groups and optionally source, scope_key),
+    at most `n_rows` of them, ordered by id.
+    Built next to `path` and swapped in at the end, so open indexes keep working.
+    """
+    distance = distance or config.VECTOR_DISTANCE
+    tmp = f"{path}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    file = lambda name: os.path.join(tmp, name)
+
+    embeddings = np.lib.format.open_memmap(file("embeddings.npy"), mode="w+", dtype=np.float32, shape=(n_rows, dim))
+    ids = np.zeros(n_rows, dtype=np.int64)
+    chunk_indexes = np.zeros(n_rows, dtype=np.int32)
+    scope_codes = np.zeros(n_rows, dtype=np.int32)
+    scopes: Dict[Tuple[str, str], int] = {}
+    offsets = {name: [0] for name in STRING_COLUMNS}
+    blobs = {name: open(file(f"{name}.bin"), "wb") for name in STRING_COLUMNS}
+    postings: Dict[str, Dict[int, float]] = {}
+    group_rows: Dict[str, List[int]] = {}
+
+    n = 0
+    try:
+        for row in rows:
+            if n >= n_rows:
+                raise ValueError(f"More than the expected {n_rows} rows")
+            embeddings[n] = np.asarray(row["embedding"], dtype=np.float32)
+            ids[n] = row["id"]
+            chunk_indexes[n] = row["chunk_index"] or 0
+            scope = (row.get("source") or "", row.get("scope_key") or "")
+            scope_codes[n] = scopes.setdefault(scope, len(scopes))
+            for name in STRING_COLUMNS:
+                data = (row.get(name) or "").encode("utf-8")
+                blobs[name].write(data)
+                offsets[name].append(offsets[name][-1] + len(data))
+            for weight, text in ((TITLE_WEIGHT, row.get("title")), (BODY_WEIGHT, row.get("content"))):
+                for term in tokenize(text):
+                    term_rows = postings.setdefault(term, {})
+                    term_rows[n] = term_rows.get(n, 0.0) + weight
+            for group in _names(row.get("allowed_groups")):
+                group_rows.setdefault(group, []).append(n)
+            n += 1
+    finally:
+        for blob in blobs.values():
+            blob.close()
+    if n != n_rows:
+        raise ValueError(f"Expected {n_rows} rows, got {n}")
+
+    embeddings.flush()
+    np.save(file("norms.npy"), np.linalg.norm(embeddings, axis=1).astype(np.float32))
+    del embeddings
+    np.save(file("ids.npy"), ids)
+    np.save(file("chunk_index.npy"), chunk_indexes)
+    np.save(file("scope_codes.npy"), scope_codes)
+    for name in STRING_COLUMNS:
+        np.save(file(f"{name}_offsets.npy"), np.asarray(offsets[name], dtype=np.int64))
+
+    vocab = sorted(postings)
+    postings_offsets, postings_rows, postings_weights = [0], [], []
+    for term in vocab:
+        term_rows = postings[term] # insertion order = ascending row
+        postings_rows.extend(term_rows)
+        postings_weights.extend(term_rows.values())
+        postings_offsets.append(len(postings_rows))
+    np.save(file("postings_offsets.npy"), np.asarray(postings_offsets, dtype=np.int64))
+    np.save(file("postings_rows.npy"), np.asarray(postings_rows, dtype=np.int32))
+    np.save(file("postings_weights.npy"), np.asarray(postings_weights, dtype=np.float32))
+    with open(file("vocab.json"), "w", encoding="utf-8") as f:
+        json.dump({term: i for i, term in enumerate(vocab)}, f)
+
+    groups = sorted(group_rows)
+    acl_bits = np.zeros((len(groups), (n_rows + 7) // 8), dtype=np.uint8)
+    for i, group in enumerate(groups):
+        mask = np.zeros(n_rows, dtype=bool)
+        mask[group_rows[group]] = True
+        acl_bits[i] = np.packbits(mask)
+    np.save(file("acl_bits.npy"), acl_bits)
+
+    with open(file("manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "version": FORMAT_VERSION, "rows": n_rows, "dim": dim, "distance": distance,
+            "generation": generation, "groups": groups, "scopes": [list(scope) for scope in scopes],
+        }, f)
+
+    if os.path.exists(path):
+        old = f"{path}.old"
+        shutil.rmtree(old, ignore_errors=True)
+        os.rename(path, old)
+        os.rename(tmp, path)
+        shutil.rmtree(old, ignore_errors=True)
+    else:
+        os.rename(tmp, path)
+    return path
+
+def export_postgres(session, path: str, where: Iterable = ()) -> dict:
+    """Snapshots document_chunks (optionally filtered by `where` clauses) into a NumpyIndex at `path`."""
+    from sqlalchemy import func, select
+    from app.corpus import current_generation_sync
+    from app.models import DocumentChunk
+
+    generation = current_generation_sync(session)
+    where = list(where)
+    n_rows = session.scalar(select(func.count()).select_from(DocumentChunk).where(*where))
+    dim = DocumentChunk.embedding.type.dim
+    stmt = select(
+        DocumentChunk.id, DocumentChunk.source_id, DocumentChunk.chunk_index, DocumentChunk.content,
+        DocumentChunk.source, DocumentChunk.scope_key,
+        DocumentChunk.metadata_["title"].astext.label("title"),
+        DocumentChunk.metadata_["url"].astext.label("url"),
+        DocumentChunk.metadata_["allowed_groups"].label("allowed_groups"),
+        DocumentChunk.embedding,
+    ).where(*where).order_by(DocumentChunk.id).execution_options(yield_per=2000)
+
+    def rows() -> Iterator[Dict[str, Any]]:
+        for row in session.execute(stmt):
+            yield row._asdict()
+
+    write_index(path, rows(), n_rows, dim, generation=generation)
+    return {"rows": n_rows, "dim": dim, "generation": generation, "path": path}
+
+class NumpyBackend(RetrievalBackend):
+    name = "numpy"
+
+    def __init__(self, index: NumpyIndex):
+        self.index = index
+        if index.distance != config.VECTOR_DISTANCE:
+            raise ValueError(f"{index.path} was built for {index.distance} distance, VECTOR_DISTANCE is {config.VECTOR_DISTANCE}")
+
+    @classmethod
+    def open(cls, path: str) -> "NumpyBackend":
+        return cls(NumpyIndex(path))
+
+    async def generation(self) -> int:
+        return self.index.generation
+
+    async def dense(self, query_vec, allowed_groups, k, ef_search=None, probes=None, scope=None):
+        # Exact search: ef_search / probes have nothing to tune. The matrix products release the GIL.
+        hits = await asyncio.to_thread(self.index.dense, query_vec, allowed_groups, k, scope=scope)
+        return [self.index.chunk(row, dense_distance=distance) for row, distance in hits]
+
+    async def sparse(self, query_text, allowed_groups, k, scope=None):
+        hits = await asyncio.to_thread(self.index.sparse, query_text, allowed_groups, k, scope)
+        return [self.index.chunk(row, sparse_score=score) for row, score in hits]
+
+    async def fetch_chunks(self, keys, allowed_groups):
+        rows = await asyncio.to_thread(self.index.rows_for, keys)
+        visible = self.index.visible_rows(allowed_groups)
+        return [self.index.chunk(row) for row in rows if visible[row]]
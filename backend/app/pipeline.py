@@ -0,0 +1,269 @@
+"""
+Streaming ingestion: load -> split -> embed -> write as threads connected by
+bounded queues.
+
+Each queue holds at most `queue_size` batches of `batch_docs` documents, so a
+slow stage (usually embedding) makes the loader wait instead of buffering the
+whole source in memory, and peak memory stays flat however large the corpus.
+The first batch is written while later pages are still being fetched.
+
+With `split_workers` > 1 the split stage (splitting and hashing, pure CPU)
+fans batches out over a process pool, keeping up to two batches per worker in
+flight and passing results on in input order.
+
+With a Checkpoint, the source_ids of every committed batch are appended to a
+file, and a later run skips them, so an interrupted crawl resumes where it
+stopped.
+
+The embed stage diffs against the database before embedding. If a source_id
+shows up again while an earlier version of it is still queued for writing, it
+waits for the writer to catch up so the diff isn't stale.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from queue import Queue, Empty, Full
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+import logging
+import os
+import threading
+import time
+
+from langchain_core.documents import Document
+
+from app.database import SessionLocal
+from app.ingestion import IngestionService, batched, empty_stats, split_documents
+from app import config
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+class Checkpoint:
+    """Append-only file of source_ids whose chunks are committed, one per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Set[str] = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.done = {line.rstrip("\n") for line in f if line.strip()}
+
+    def __contains__(self, source_id: str) -> bool:
+        return source_id in self.done
+
+    def __len__(self) -> int:
+        return len(self.done)
+
+    def mark(self, source_ids: Iterable[str]):
+        new = [s for s in source_ids if s and s not in self.done]
+        if not new:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(f"{s}\n" for s in new))
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.update(new)
+
+    def reset(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.done = set()
+
+class StageStats:
+    def __init__(self):
+        self.batches = 0
+        self.items = 0
+        self.busy_seconds = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "items_per_sec": self.items / self.busy_seconds if self.busy_seconds else 0.0,
+        }
+
+class IngestionPipeline:
+    STAGES = ("load", "split", "embed", "write")
+    UNITS = {"load": "documents", "split": "documents", "embed": "chunks embedded", "write": "rows written"}
+
+    def __init__(self, service: IngestionService, batch_docs: int = None, queue_size: int = None,
+                 split_workers: int = 1, checkpoint: Optional[Checkpoint] = None):
+        self.service = service
+        self.batch_docs = batch_docs or config.INGEST_BATCH_DOCS
+        self.queue_size = queue_size or config.INGEST_QUEUE_SIZE
+        self.split_workers = split_workers
+        self.checkpoint = checkpoint
+        self.skipped = 0
+        self.stage_stats = {name: StageStats() for name in self.STAGES}
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._planned: Set[str] = set()
+
+    def _put(self, q: Queue, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _get(self, q: Queue):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except Empty:
+                continue
+        return _DONE
+
+    def _fail(self, e: BaseException):
+        if self._error is None:
+            self._error = e
+        self._stop.set()
+
+    def _stage(self, name: str, inbox: Queue, outbox: Queue, fn: Callable[[Any], Any], count: Callable[[Any], int]):
+        stats = self.stage_stats[name]
+        try:
+            while True:
+                item = self._get(inbox)
+                if item is _DONE:
+                    break
+                started = time.perf_counter()
+                result = fn(item)
+                stats.busy_seconds += time.perf_counter() - started
+                stats.batches += 1
+                stats.items += count(result)
+                if not self._put(outbox, result):
+                    return
+            self._put(outbox, _DONE)
+        except BaseException as e:
+            logger.error(f"Ingestion stage '{name}' failed: {e}")
+            self._fail(e)
+
+    def _load(self, documents: Iterable[Document], outbox: Queue):
+        stats = self.stage_stats["load"]
+        try:
+            started = time.perf_counter()
+            if self.checkpoint is not None and len(self.checkpoint):
+                documents = self._skip_checkpointed(documents)
+            for batch in batched(documents, self.batch_docs):
+                stats.busy_seconds += time.perf_counter() - started
+                stats.batches += 1
+                stats.items += len(batch)
+                if not self._put(outbox, batch):
+                    return
+                started = time.perf_counter()
+            self._put(outbox, _DONE)
+        except BaseException as e:
+            logger.error(f"Ingestion stage 'load' failed: {e}")
+            self._fail(e)
+
+    def _skip_checkpointed(self, documents: Iterable[Document]):
+        for doc in documents:
+            if doc.metadata.get("source_id") in self.checkpoint:
+                self.skipped += 1
+                continue
+            yield doc
+
+    def _split_parallel(self, inbox: Queue, outbox: Queue):
+        """Split stage on a process pool; results stay in input order."""
+        stats = self.stage_stats["split"]
+        try:
+            with ProcessPoolExecutor(max_workers=self.split_workers) as pool:
+                pending = deque()
+                started = time.perf_counter()
+                done = False
+                while not done or pending:
+                    if pending and (done or len(pending) >= 2 * self.split_workers or pending[0].done()):
+                        result = pending.popleft().result()
+                        stats.batches += 1
+                        stats.items += len(result)
+                        if not self._put(outbox, result):
+                            return
+                        continue
+                    try:
+                        item = inbox.get(timeout=0.05)
+                    except Empty:
+                        if self._stop.is_set():
+                            return
+                        continue
+                    if item is _DONE:
+                        done = True
+                    else:
+                        pending.append(pool.submit(split_documents, item))
+                # Wall-clock time with the whole pool busy, not per-worker CPU time
+                stats.busy_seconds = time.perf_counter() - started
+            self._put(outbox, _DONE)
+        except BaseException as e:
+            logger.error(f"Ingestion stage 'split' failed: {e}")
+            self._fail(e)
+
+    def _wait_for_writer(self, write_queue: Queue):
+        while write_queue.unfinished_tasks and not self._stop.is_set():
+            time.sleep(0.05)
+
+    def run(self, documents: Iterable[Document]) -> Dict[str, int]:
+        """Ingests `documents` (any iterable, typically a loader's lazy_load()); returns process_documents-style stats."""
+        split_queue, embed_queue, write_queue = (Queue(maxsize=self.queue_size) for _ in range(3))
+        plan_session = SessionLocal()
+
+        def plan_and_embed(split_docs):
+            source_ids = {doc.metadata["source_id"] for doc, _, _ in split_docs if doc.metadata.get("source_id")}
+            if source_ids & self._planned:
+                self._wait_for_writer(write_queue)
+            self._planned |= source_ids
+            return self.service.embed(self.service.plan(plan_session, split_docs))
+
+        threads = [
+            threading.Thread(target=self._load, args=(documents, split_queue), name="ingest-load", daemon=True),
+            threading.Thread(target=self._split_parallel, name="ingest-split", daemon=True, args=(split_queue, embed_queue))
+            if self.split_workers > 1 else
+            threading.Thread(target=self._stage, name="ingest-split", daemon=True, args=(
+                "split", split_queue, embed_queue, self.service.split, len)),
+            threading.Thread(target=self._stage, name="ingest-embed", daemon=True, args=(
+                "embed", embed_queue, write_queue, plan_and_embed,
+                lambda plans: sum(len(p.needs_embedding) for p in plans))),
+        ]
+        for t in threads:
+            t.start()
+
+        stats = empty_stats()
+        write_stats = self.stage_stats["write"]
+        try:
+            while True:
+                plans = self._get(write_queue)
+                if plans is _DONE:
+                    break
+                try:
+                    started = time.perf_counter()
+                    before = stats["inserted"] + stats["updated"]
+                    self.service.write(self.service.db, plans, stats)
+                    write_stats.busy_seconds += time.perf_counter() - started
+                    write_stats.batches += 1
+                    write_stats.items += stats["inserted"] + stats["updated"] - before
+                    if self.checkpoint is not None:
+                        self.checkpoint.mark(plan.source_id for plan in plans)
+                finally:
+                    write_queue.task_done()
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._stop.set()
+            for t in threads:
+                t.join()
+            plan_session.close()
+            self.service.db.close()
+
+        if self._error is not None:
+            raise self._error
+        if self.skipped:
+            logger.info(f"Skipped {self.skipped} documents already in the checkpoint")
+        for name in self.STAGES:
+            s = self.stage_stats[name].as_dict()
+            logger.info(f"{name:<5}: {s['items']} {self.UNITS[name]} in {s['batches']} batches, {s['items_per_sec']:.0f}/s")
+        logger.info(
+            f"Saved chunks to DB: {stats['inserted']} inserted, {stats['updated']} updated, "
+            f"{stats['deleted']} deleted, {stats['unchanged']} unchanged across {stats['documents']} documents."
+        )
+        return stats
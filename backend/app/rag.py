@@ -1,43 +1,94 @@
-from typing import List
-from app.search_service import HybridSearchService
-from app.models import DocumentChunk
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+from app.search_service import HybridSearchService, RetrievedChunk, SearchScope
+from app.rerank import Reranker
+from app.context import Context, ContextBuilder
+from app.answer_cache import AnswerCache, CachedAnswer
+from app.metrics import stage, CACHE_REQUESTS
+from app import config
+import asyncio
 import logging
+import re
 
 logger = logging.getLogger(__name__)
 
 class RAGPipeline:
     def __init__(self):
         self.search_service = HybridSearchService()
+        self.reranker = Reranker.from_config()
+        self.context_builder = ContextBuilder()
+        self.answer_cache = AnswerCache.from_config()
+
+    async def _cached_answer(self, user_query: str, user_groups: List[str],
+                             scope: Optional[SearchScope] = None) -> Tuple[Optional[CachedAnswer], Optional[tuple]]:
+        """
+        Looks the query up in the semantic answer cache, after evicting answers that
+        a re-ingested or new source may have changed. Returns (hit, token for _cache_answer); the query
+        embedding is cached, so the search on a miss doesn't embed again, and the
+        generation read here is handed to the search (see _generation).
+        """
+        if self.answer_cache.max_size <= 0:
+            return None, None
+        with stage("answer_cache"):
+            query_vec = await self.search_service.embeddings.aembed_query(user_query)
+            backend = self.search_service.backend
+            generation = await backend.generation()
+            if self.answer_cache.generation is not None and generation != self.answer_cache.generation:
+                changed = await backend.changed_sources(self.answer_cache.generation, generation)
+                visibility = await backend.source_visibility(changed) if changed else {}
+                evicted = self.answer_cache.sync(generation, changed, visibility)
+                logger.info(f"answer cache: generation {generation}, evicted {evicted} answers")
+            else:
+                self.answer_cache.sync(generation, set())
+            cached = self.answer_cache.get(user_groups, query_vec, scope)
+        CACHE_REQUESTS.inc(cache="answer", result="miss" if cached is None else "hit")
+        return cached, (query_vec, generation, scope)
+
+    @staticmethod
+    def _generation(token: Optional[tuple]) -> Optional[int]:
+        # One generation read per request: the retrieval cache uses the one the answer
+        # cache was synced to, so an answer is never stored under an older generation
+        # than the results it cites.
+        return token[1] if token is not None else None
+
+    def _cache_answer(self, token: Optional[tuple], user_query: str, user_groups: List[str], answer: str,
+                      docs: List[RetrievedChunk], context: Optional[Context]):
+        if token is None or not docs:
+            return
+        query_vec, generation, scope = token
+        # Cite what the prompt actually contained, neighbours included
+        cited = [c for p in context.passages for c in p.chunks] if context is not None else docs
+        self.answer_cache.put(user_groups, query_vec, user_query, answer, cited, generation, scope)
         
-    def rerank(self, query: str, docs: List[DocumentChunk]) -> List[DocumentChunk]:
+    def rerank(self, query: str, docs: List[RetrievedChunk]) -> List[RetrievedChunk]:
         """
-        Mock Reranker. In prod, use CrossEncoder (e.g. bge-reranker).
-        Here we just return the docs as-is (assuming Fusion did a good enough job)
-        or maybe perform a simple keyword boost check.
+        Keeps the RERANK_TOP_N best of the retrieved candidates according to the
+        configured scorer (app/rerank.py), or their RRF order if it runs out of time.
         """
-        # Simple prototype logic: Boost exact matches in title
-        # This is just to demonstrate 'reranking' logic step exists.
-        def score(doc):
-            s = 0
-            if query.lower() in doc.content.lower():
-                s += 1
-            if "title" in doc.metadata_ and query.lower() in doc.metadata_["title"].lower():
-                s += 2
-            return s
-            
-        # We only re-sort if we have a tie-breaker, but RRF is robust.
-        # Let's just return list for now to keep it simple as detailed in plan.
-        return docs
+        return self.reranker.rerank(query, docs)
+
+    async def _rerank(self, query: str, docs: List[RetrievedChunk]) -> List[RetrievedChunk]:
+        with stage("rerank"):
+            if self.reranker.offload:
+                # Model inference; keep the event loop free for other requests
+                return await asyncio.to_thread(self.rerank, query, docs)
+            return self.rerank(query, docs)
 
-    def generate_answer(self, query: str, context_docs: List[DocumentChunk]) -> str:
+    async def build_context(self, docs: List[RetrievedChunk], user_groups: List[str]) -> Context:
+        """Merged, overlap-free passages within CONTEXT_TOKEN_BUDGET (app/context.py)."""
+        with stage("context"):
+            return await self.context_builder.build(docs, user_groups, self.search_service.backend)
+
+    def generate_answer(self, query: str, context_docs: List[RetrievedChunk], context: Optional[Context] = None) -> str:
         """
         Mock Generation. In prod, call OpenAI/LLM.
         """
         if not context_docs:
             return "I cannot find any information about that in the internal knowledge base."
             
-        # Context construction
-        context_str = "\n\n".join([f"Source: {d.metadata_.get('title', 'Unknown')}\nContent: {d.content}" for d in context_docs])
+        # Context construction (the prompt gets context.text; the verbatim join is only a fallback)
+        context_str = context.text if context is not None else "\n\n".join(
+            [f"Source: {d.title or 'Unknown'}\nContent: {d.content}" for d in context_docs]
+        )
         
         # PROTOTYPE MOCK RESPONSE
         # Check if the context contains the answer (conceptually)
@@ -51,19 +102,77 @@ class RAGPipeline:
                 found_answers.append("Error 0x80040 is related to VPN timeouts.")
 
         if found_answers:
-             return f"Based on the internal documents:\n" + " ".join(found_answers) + "\n\nSources:\n" + "\n".join([f"- {d.metadata_.get('source_id')}" for d in context_docs])
+             return f"Based on the internal documents:\n" + " ".join(found_answers) + "\n\nSources:\n" + "\n".join([f"- {d.source_id}" for d in context_docs])
         
         # Fallback - If no specific knowledge extracted, assume not found (Strict Mock)
         return "I cannot find any information about that in the internal knowledge base."
 
-    def query(self, user_query: str, user_groups: List[str]) -> str:
-        # 1. Retrieve (Hybrid)
-        retrieved_docs = self.search_service.search(user_query, user_groups)
+    def generate_answer_stream(self, query: str, context_docs: List[RetrievedChunk],
+                               context: Optional[Context] = None) -> Iterator[str]:
+        """
+        Yields the answer in token-sized pieces.
+        In prod, iterate the LLM's streaming response (stream=True) here instead.
+        """
+        with stage("generate"):
+            answer = self.generate_answer(query, context_docs, context)
+        for piece in re.findall(r"\S+\s*", answer):
+            yield piece
+
+    async def stream_query(
+        self,
+        user_query: str,
+        user_groups: List[str],
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        scope: Optional[SearchScope] = None,
+    ) -> AsyncIterator[str]:
+        """Same pipeline as query(), but yields answer pieces as they are generated."""
+        cached, token = await self._cached_answer(user_query, user_groups, scope)
+        if cached is not None:
+            for piece in re.findall(r"\S+\s*", cached.answer):
+                yield piece
+            return
+
+        retrieved_docs = await self.search_service.search(
+            user_query, user_groups, limit=config.RERANK_CANDIDATES, ef_search=ef_search, probes=probes,
+            scope=scope, generation=self._generation(token),
+        )
+        reranked_docs = await self._rerank(user_query, retrieved_docs)
+        context = await self.build_context(reranked_docs, user_groups)
+        pieces = []
+        for piece in self.generate_answer_stream(user_query, reranked_docs, context):
+            pieces.append(piece)
+            yield piece
+        self._cache_answer(token, user_query, user_groups, "".join(pieces), reranked_docs, context)
+
+    async def query(
+        self,
+        user_query: str,
+        user_groups: List[str],
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        scope: Optional[SearchScope] = None,
+    ) -> str:
+        # 0. A paraphrase of a question this group set already asked (in this scope)?
+        cached, token = await self._cached_answer(user_query, user_groups, scope)
+        if cached is not None:
+            return cached.answer
+
+        # 1. Retrieve (Hybrid) - async, so other requests keep flowing while we wait on the DB
+        retrieved_docs = await self.search_service.search(
+            user_query, user_groups, limit=config.RERANK_CANDIDATES, ef_search=ef_search, probes=probes,
+            scope=scope, generation=self._generation(token),
+        )
         
         # 2. Rerank
-        reranked_docs = self.rerank(user_query, retrieved_docs)
-        
-        # 3. Generate
-        answer = self.generate_answer(user_query, reranked_docs)
+        reranked_docs = await self._rerank(user_query, retrieved_docs)
         
+        # 3. Pack the context
+        context = await self.build_context(reranked_docs, user_groups)
+
+        # 4. Generate
+        with stage("generate"):
+            answer = self.generate_answer(user_query, reranked_docs, context)
+
+        self._cache_answer(token, user_query, user_groups, answer, reranked_docs, context)
         return answer
@@ -0,0 +1,195 @@
+"""
+Reranking stage between retrieval and generation.
+
+RAGPipeline retrieves RERANK_CANDIDATES chunks (fused RRF order), the Reranker
+scores them in one batch and keeps the best RERANK_TOP_N for the prompt.
+
+Scorers:
+- lexical (default): BM25 over the candidate set, computed as one NumPy
+  term-frequency matrix, plus RERANK_TITLE_BOOST x BM25 of the title. IDF comes
+  from the candidates themselves, so it needs no corpus statistics.
+- cross-encoder: a local sentence-transformers CrossEncoder (CROSS_ENCODER_MODEL),
+  run in batches of RERANK_BATCH_SIZE off the event loop. Optional dependency.
+
+Each request gets RERANK_BUDGET_MS. Scorers check the deadline between batches;
+when it passes, the candidates keep their RRF order (counted in
+rag_rerank_budget_exceeded_total). Scores are cached per (scorer, query, chunk
+id, content), so repeated questions only score chunks they haven't seen.
+
+Chunks may be shared with the retrieval cache, so they are never modified:
+reranked results are copies with rerank_score set.
+"""
+from collections import OrderedDict
+from dataclasses import replace
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+import math
+import threading
+import time
+
+import numpy as np
+
+from app.embedding_cache import normalize_query
+from app.metrics import CACHE_REQUESTS, RERANK_BUDGET_EXCEEDED
+from app.numpy_backend import tokenize
+from app.retrieval_backend import RetrievedChunk
+from app import config
+
+RERANKERS = ("lexical", "cross-encoder", "none")
+
+class Scorer:
+    name: str
+    offload = False # blocking enough to run in a worker thread
+
+    def score(self, query: str, docs: Sequence[RetrievedChunk], deadline: Optional[float] = None) -> Optional[np.ndarray]:
+        """One relevance score per doc (higher = better), or None if `deadline` (time.monotonic()) passed."""
+        raise NotImplementedError
+
+def _term_frequencies(terms: List[str], texts: Sequence[Optional[str]]) -> Tuple[np.ndarray, np.ndarray]:
+    """(len(texts) x len(terms)) term counts and the token length of each text."""
+    column = {term: j for j, term in enumerate(terms)}
+    tf = np.zeros((len(texts), len(terms)), dtype=np.float32)
+    lengths = np.zeros(len(texts), dtype=np.float32)
+    for i, text in enumerate(texts):
+        tokens = tokenize(text)
+        lengths[i] = len(tokens)
+        for token in tokens:
+            j = column.get(token)
+            if j is not None:
+                tf[i, j] += 1
+    return tf, lengths
+
+def bm25(tf: np.ndarray, lengths: np.ndarray, k1: float = 1.2, b: float = 0.75) -> np.ndarray:
+    """BM25 of every row of a term-frequency matrix, with IDF from the rows themselves."""
+    n = tf.shape[0]
+    df = (tf > 0).sum(axis=0)
+    idf = np.log1p((n - df + 0.5) / (df + 0.5))
+    avg_length = lengths.mean() if n and lengths.mean() > 0 else 1.0
+    norm = k1 * (1 - b + b * lengths / avg_length)
+    return ((tf * (k1 + 1)) / (tf + norm[:, None]) * idf).sum(axis=1)
+
+class LexicalScorer(Scorer):
+    name = "lexical"
+
+    def __init__(self, title_boost: float = None):
+        self.title_boost = config.RERANK_TITLE_BOOST if title_boost is None else title_boost
+
+    def score(self, query, docs, deadline=None):
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not docs:
+            return np.zeros(len(docs), dtype=np.float32)
+        body = bm25(*_term_frequencies(terms, [d.content for d in docs]))
+        title = bm25(*_term_frequencies(terms, [d.title for d in docs]))
+        return body + self.title_boost * title
+
+class CrossEncoderScorer(Scorer):
+    name = "cross-encoder"
+    offload = True
+
+    def __init__(self, model_name: str = None, batch_size: int = None):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError("RERANKER=cross-encoder needs the 'sentence-transformers' package") from e
+        self.model_name = model_name or config.CROSS_ENCODER_MODEL
+        self.name = f"cross-encoder:{self.model_name}"
+        self.model = CrossEncoder(self.model_name)
+        self.batch_size = batch_size or config.RERANK_BATCH_SIZE
+
+    def score(self, query, docs, deadline=None):
+        pairs = [(query, f"{d.title}\n{d.content}" if d.title else d.content) for d in docs]
+        scores = []
+        for start in range(0, len(pairs), self.batch_size):
+            if deadline is not None and time.monotonic() > deadline:
+                return None
+            batch = pairs[start:start + self.batch_size]
+            scores.extend(self.model.predict(batch, batch_size=len(batch), show_progress_bar=False))
+        return np.asarray(scores, dtype=np.float32)
+
+class ScoreCache:
+    """Thread-safe LRU of rerank scores."""
+
+    def __init__(self, max_size: int = 10_000):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Hashable, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: List[Hashable]) -> List[Optional[float]]:
+        with self._lock:
+            found = []
+            for key in keys:
+                value = self._entries.get(key)
+                if value is not None:
+                    self._entries.move_to_end(key)
+                found.append(value)
+            return found
+
+    def put_many(self, items: Dict[Hashable, float]):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            for key, value in items.items():
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+def make_scorer(kind: str = None) -> Optional[Scorer]:
+    kind = kind or config.RERANKER
+    if kind == "lexical":
+        return LexicalScorer()
+    if kind == "cross-encoder":
+        return CrossEncoderScorer()
+    if kind == "none":
+        return None
+    raise ValueError(f"Unknown RERANKER {kind!r}, expected one of {RERANKERS}")
+
+class Reranker:
+    def __init__(self, scorer: Optional[Scorer] = None, top_n: int = None, budget_ms: float = None,
+                 cache: Optional[ScoreCache] = None):
+        self.scorer = scorer
+        self.top_n = top_n or config.RERANK_TOP_N
+        self.budget_ms = config.RERANK_BUDGET_MS if budget_ms is None else budget_ms
+        self.cache = cache if cache is not None else ScoreCache(config.RERANK_CACHE_SIZE)
+
+    @classmethod
+    def from_config(cls) -> "Reranker":
+        return cls(make_scorer())
+
+    @property
+    def offload(self) -> bool:
+        return self.scorer is not None and self.scorer.offload
+
+    def _key(self, query: str, doc: RetrievedChunk) -> Hashable:
+        return (self.scorer.name, query, doc.id, hash(doc.content))
+
+    def rerank(self, query: str, docs: List[RetrievedChunk]) -> List[RetrievedChunk]:
+        """The top_n docs by rerank score (ties keep RRF order); RRF order if no scorer or over budget."""
+        if self.scorer is None or not docs:
+            return docs[:self.top_n]
+        deadline = time.monotonic() + self.budget_ms / 1000 if self.budget_ms > 0 else None
+
+        query_key = normalize_query(query)
+        keys = [self._key(query_key, d) for d in docs]
+        scores = self.cache.get_many(keys)
+        missing = [i for i, s in enumerate(scores) if s is None]
+        CACHE_REQUESTS.inc(len(docs) - len(missing), cache="rerank", result="hit")
+        CACHE_REQUESTS.inc(len(missing), cache="rerank", result="miss")
+
+        if missing:
+            fresh = self.scorer.score(query, [docs[i] for i in missing], deadline)
+            if fresh is None or (deadline is not None and time.monotonic() > deadline):
+                RERANK_BUDGET_EXCEEDED.inc()
+                if fresh is not None:
+                    # Late, but still worth keeping for the next time this question comes in
+                    self.cache.put_many({keys[i]: float(s) for i, s in zip(missing, fresh)})
+                return docs[:self.top_n]
+            new = {}
+            for i, s in zip(missing, fresh):
+                scores[i] = new[keys[i]] = float(s)
+            self.cache.put_many(new)
+
+        order = sorted(range(len(docs)), key=lambda i: (-scores[i], i))[:self.top_n]
+        return [replace(docs[i], rerank_score=scores[i]) for i in order]
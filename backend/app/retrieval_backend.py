@@ -0,0 +1,140 @@
+"""
+Retrieval backends: where the dense and keyword legs actually run.
+
+HybridSearchService (app/search_service.py) embeds the query, caches results
+and hands the legs to a RetrievalBackend:
+- postgres: pgvector ANN + tsvector keyword search, ACLs via acl_ids (default);
+- numpy: an in-process index exported from Postgres into memory-mapped files
+  (app/numpy_backend.py), for small tenants and edge deployments without a database.
+
+Both return RetrievedChunks and fuse the legs with the same reciprocal_rank_fusion.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.metrics import stage
+from app import config
+
+RETRIEVAL_BACKENDS = ("postgres", "numpy")
+
+@dataclass(slots=True)
+class RetrievedChunk:
+    """
+    What retrieval hands to rerank/generation: a column projection of
+    DocumentChunk (no embedding, no full metadata) plus per-leg scores.
+    """
+    id: int
+    source_id: Optional[str]
+    chunk_index: Optional[int]
+    content: str
+    title: Optional[str] = None
+    url: Optional[str] = None
+    dense_distance: Optional[float] = None # vector distance, lower = closer
+    sparse_score: Optional[float] = None   # keyword relevance, higher = better
+    score: float = 0.0                     # fused RRF score
+    rerank_score: Optional[float] = None   # set on the copies app/rerank.py returns
+
+@dataclass(frozen=True)
+class SearchScope:
+    """
+    Restricts retrieval to one source system ("confluence", "jira") and optionally
+    some of its spaces / projects (DocumentChunk.source / scope_key). On a
+    partitioned document_chunks, Postgres only scans the matching partitions.
+    """
+    source: str
+    scope_keys: Tuple[str, ...] = ()
+
+    def covers(self, source: str, scope_key: str) -> bool:
+        return source == self.source and (not self.scope_keys or scope_key in self.scope_keys)
+
+@dataclass(frozen=True)
+class SourceVisibility:
+    """Where a stored source document lives (DocumentChunk.source / scope_key) and the groups that can read it."""
+    source: str
+    scope_key: str
+    groups: frozenset
+
+def reciprocal_rank_fusion(ranked_lists: Iterable[List[Any]], k: int = 60) -> List[Dict[str, Any]]:
+    """
+    Fuses several ranked lists of docs (anything with an `id`) into one.
+    Returns [{"doc": ..., "score": ...}] sorted by fused score DESC.
+    """
+    fused_scores = {}
+    for ranked in ranked_lists:
+        for rank, doc in enumerate(ranked):
+            if doc.id not in fused_scores:
+                fused_scores[doc.id] = {"doc": doc, "score": 0.0}
+            fused_scores[doc.id]["score"] += 1.0 / (k + rank + 1)
+
+    # Sort by fused score DESC
+    return sorted(fused_scores.values(), key=lambda x: x["score"], reverse=True)
+
+def fuse_legs(dense_results: List[RetrievedChunk], sparse_results: List[RetrievedChunk], limit: int) -> List[RetrievedChunk]:
+    """RRF over both legs; the top `limit` chunks carry their fused score and both leg scores."""
+    fused = reciprocal_rank_fusion([dense_results, sparse_results], k=config.RRF_K)
+    sparse_scores = {c.id: c.sparse_score for c in sparse_results}
+    results = []
+    for item in fused[:limit]:
+        chunk = item["doc"]
+        chunk.score = item["score"]
+        if chunk.sparse_score is None:
+            chunk.sparse_score = sparse_scores.get(chunk.id)
+        results.append(chunk)
+    return results
+
+class RetrievalBackend:
+    name: str
+
+    async def generation(self) -> int:
+        """Corpus generation the backend currently serves (tags retrieval cache entries)."""
+        raise NotImplementedError
+
+    async def changed_sources(self, since: int, generation: int) -> Optional[Set[str]]:
+        """Source ids changed in generations (since, generation], or None if unknown (assume everything)."""
+        return None
+
+    async def source_visibility(self, source_ids: Iterable[str]) -> Optional[Dict[str, SourceVisibility]]:
+        """Scope and readers of the stored documents among `source_ids` (deleted ones are left out), None if unknown."""
+        return None
+
+    async def dense(self, query_vec: List[float], allowed_groups: List[str], k: int,
+                    ef_search: Optional[int] = None, probes: Optional[int] = None,
+                    scope: Optional[SearchScope] = None) -> List[RetrievedChunk]:
+        """Closest `k` chunks visible to `allowed_groups` (within `scope`), closest first, with dense_distance set."""
+        raise NotImplementedError
+
+    async def sparse(self, query_text: str, allowed_groups: List[str], k: int,
+                     scope: Optional[SearchScope] = None) -> List[RetrievedChunk]:
+        """Best `k` keyword matches visible to `allowed_groups` (within `scope`), with sparse_score set."""
+        raise NotImplementedError
+
+    async def fetch_chunks(self, keys: List[Tuple[str, int]], allowed_groups: List[str]) -> List[RetrievedChunk]:
+        """The chunks with these (source_id, chunk_index) keys that `allowed_groups` may read, in one lookup."""
+        raise NotImplementedError
+
+    async def retrieve(self, query_text: str, query_vec: List[float], allowed_groups: List[str], limit: int,
+                       ef_search: Optional[int] = None, probes: Optional[int] = None,
+                       scope: Optional[SearchScope] = None) -> List[RetrievedChunk]:
+        """Both legs (2 * limit candidates each), fused with RRF."""
+        with stage("dense"):
+            dense_results = await self.dense(query_vec, allowed_groups, limit * 2, ef_search, probes, scope)
+        with stage("sparse"):
+            sparse_results = await self.sparse(query_text, allowed_groups, limit * 2, scope)
+        with stage("fusion"):
+            return fuse_legs(dense_results, sparse_results, limit)
+
+    async def retrieve_many(self, queries: List[Tuple[str, List[float]]], allowed_groups: List[str], limit: int,
+                            ef_search: Optional[int] = None, probes: Optional[int] = None,
+                            scope: Optional[SearchScope] = None) -> List[List[RetrievedChunk]]:
+        """retrieve() for each (query_text, query_vec), in order. Backends override this to batch the round trips."""
+        return [await self.retrieve(t, v, allowed_groups, limit, ef_search, probes, scope) for t, v in queries]
+
+def make_backend(kind: str = None, mode: Optional[str] = None) -> RetrievalBackend:
+    kind = kind or config.RETRIEVAL_BACKEND
+    if kind == "postgres":
+        from app.search_service import PostgresBackend
+        return PostgresBackend(mode)
+    if kind == "numpy":
+        from app.numpy_backend import NumpyBackend
+        return NumpyBackend.open(config.NUMPY_INDEX_PATH)
+    raise ValueError(f"Unknown RETRIEVAL_BACKEND {kind!r}, expected one of {RETRIEVAL_BACKENDS}")
@@ -0,0 +1,81 @@
+"""
+Retrieval result cache in front of HybridSearchService.search.
+
+Keys include the canonical (frozen) set of the caller's groups, so a result
+list is only ever served to callers with exactly the same ACL view. Every
+entry is tagged with the corpus generation (app/corpus.py) it was computed at;
+once ingestion commits a new generation the whole cache is dropped, so stale
+chunks are never served after a write.
+"""
+from collections import OrderedDict
+from typing import Hashable, List, Optional, Tuple
+import threading
+import time
+
+from app.embedding_cache import normalize_query
+from app import config
+
+CacheKey = Tuple[str, frozenset, int, Hashable]
+
+class RetrievalCache:
+    def __init__(self, max_size: int = 2048, ttl_seconds: float = 300):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.generation = None
+        self._entries: "OrderedDict[CacheKey, tuple]" = OrderedDict() # key -> (expires_at, results)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(query_text: str, allowed_groups: List[str], limit: int, options: Hashable = None) -> CacheKey:
+        # options: anything else that changes the result list (e.g. ANN recall knobs)
+        return (normalize_query(query_text), frozenset(allowed_groups), limit, options)
+
+    def _sync_generation(self, generation: int):
+        if generation != self.generation:
+            if self.generation is not None:
+                self.invalidations += 1
+            self._entries.clear()
+            self.generation = generation
+
+    def get(self, key: CacheKey, generation: int) -> Optional[list]:
+        with self._lock:
+            self._sync_generation(generation)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(entry[1])
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: CacheKey, generation: int, results: list):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._sync_generation(generation)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, tuple(results))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "generation": self.generation,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    @classmethod
+    def from_config(cls) -> "RetrievalCache":
+        return cls(config.RETRIEVAL_CACHE_SIZE, config.RETRIEVAL_CACHE_TTL)
@@ -0,0 +1,392 @@
+"""
+Schema management that create_all() does not cover: the ANN index on
+document_chunks.embedding, columns added to existing tables and the partitions
+of a partitioned document_chunks (CHUNK_PARTITIONING).
+Used by init_db.py and reset_db.py.
+"""
+from typing import List, Optional
+import re
+from sqlalchemy import text, cast, func
+from sqlalchemy.engine import Connection
+from sqlalchemy.types import UserDefinedType
+from app.models import SEARCH_VECTOR_SQL, DocumentChunk, PARTITIONED, PARTITION_KEY
+from app.acl import CHUNK_PRINCIPALS_SQL
+from app import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+VECTOR_INDEX_NAME = "ix_document_chunks_embedding_ann"
+
+# VECTOR_DISTANCE -> (pgvector opclass, pgvector.sqlalchemy comparator method)
+VECTOR_DISTANCES = {
+    "l2": ("vector_l2_ops", "l2_distance"),
+    "cosine": ("vector_cosine_ops", "cosine_distance"),
+    "ip": ("vector_ip_ops", "max_inner_product"),
+}
+VECTOR_INDEX_TYPES = ("hnsw", "ivfflat", "none")
+
+# VECTOR_QUANTIZATION: what the ANN index is built on. The table keeps the full
+# vector either way; search takes RESCORE_MULTIPLIER x k candidates from the
+# compact index and reorders them by the exact distance.
+# halfvec: 16-bit floats, half the index size, same distance operators.
+# binary:  1 bit per dimension (binary_quantize), 1/32 of the size, Hamming distance.
+VECTOR_QUANTIZATIONS = ("none", "halfvec", "binary")
+EMBEDDING_DIM = DocumentChunk.embedding.type.dim
+
+# VECTOR_DISTANCE -> operator, for expressions the pgvector comparator doesn't cover (halfvec)
+DISTANCE_OPERATORS = {"l2": "<->", "cosine": "<=>", "ip": "<#>"}
+
+class HalfVec(UserDefinedType):
+    cache_ok = True
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+
+    def get_col_spec(self, **kw):
+        return f"halfvec({self.dim})"
+
+class Bit(UserDefinedType):
+    cache_ok = True
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+
+    def get_col_spec(self, **kw):
+        return f"bit({self.dim})"
+
+def _check_quantization(quantization: str):
+    if quantization not in VECTOR_QUANTIZATIONS:
+        raise ValueError(f"Unknown VECTOR_QUANTIZATION {quantization!r}, expected one of {VECTOR_QUANTIZATIONS}")
+
+def quantize(vector, quantization: str):
+    """The indexed expression for `vector` (the embedding column or a vector-typed bind)."""
+    _check_quantization(quantization)
+    if quantization == "halfvec":
+        return cast(vector, HalfVec())
+    if quantization == "binary":
+        return cast(func.binary_quantize(vector), Bit())
+    return vector
+
+def quantized_distance(vector, query_vector, quantization: str):
+    """Coarse distance that the index on quantize(embedding) can serve, closest first."""
+    if quantization == "binary":
+        return quantize(vector, "binary").op("<~>")(quantize(query_vector, "binary")) # Hamming
+    operator = DISTANCE_OPERATORS[config.VECTOR_DISTANCE]
+    return quantize(vector, quantization).op(operator)(quantize(query_vector, quantization))
+
+def _opclass(quantization: str) -> str:
+    if quantization == "binary":
+        return "bit_hamming_ops"
+    opclass = VECTOR_DISTANCES[config.VECTOR_DISTANCE][0]
+    return opclass.replace("vector_", "halfvec_") if quantization == "halfvec" else opclass
+
+def vector_index_spec(quantization: Optional[str] = None) -> str:
+    """
+    Canonical description of the configured index, e.g. "hnsw vector_l2_ops m=16 ef_construction=64"
+    (the opclass also encodes VECTOR_QUANTIZATION: halfvec_l2_ops, bit_hamming_ops).
+    Stored as the index comment so we can tell whether an existing index matches the config.
+    """
+    quantization = quantization or config.VECTOR_QUANTIZATION
+    if config.VECTOR_INDEX not in VECTOR_INDEX_TYPES:
+        raise ValueError(f"Unknown VECTOR_INDEX {config.VECTOR_INDEX!r}, expected one of {VECTOR_INDEX_TYPES}")
+    if config.VECTOR_DISTANCE not in VECTOR_DISTANCES:
+        raise ValueError(f"Unknown VECTOR_DISTANCE {config.VECTOR_DISTANCE!r}, expected one of {tuple(VECTOR_DISTANCES)}")
+    _check_quantization(quantization)
+
+    opclass = _opclass(quantization)
+    if config.VECTOR_INDEX == "hnsw":
+        return f"hnsw {opclass} m={config.HNSW_M} ef_construction={config.HNSW_EF_CONSTRUCTION}"
+    if config.VECTOR_INDEX == "ivfflat":
+        return f"ivfflat {opclass} lists={config.IVFFLAT_LISTS}"
+    return "none"
+
+def _create_vector_index_sql(spec: str) -> str:
+    method, opclass, *params = spec.split()
+    with_clause = ", ".join(params)
+    # Must be the same expression as quantize(DocumentChunk.embedding, ...) for the planner to use it
+    if opclass.startswith("halfvec_"):
+        expression = f"(embedding::halfvec({EMBEDDING_DIM}))"
+    elif opclass.startswith("bit_"):
+        expression = f"(binary_quantize(embedding)::bit({EMBEDDING_DIM}))"
+    else:
+        expression = "embedding"
+    return (
+        f"CREATE INDEX {VECTOR_INDEX_NAME} ON document_chunks "
+        f"USING {method} ({expression} {opclass}) WITH ({with_clause})"
+    )
+
+def vector_index_size(conn: Connection) -> int:
+    """Bytes on disk of the ANN index (0 if there is none), summed over the partition indexes."""
+    return conn.execute(
+        text("SELECT coalesce(sum(pg_relation_size(relid)), 0) FROM pg_partition_tree(to_regclass(:name))"),
+        {"name": VECTOR_INDEX_NAME},
+    ).scalar()
+
+def drop_vector_index(conn: Connection):
+    conn.execute(text(f"DROP INDEX IF EXISTS {VECTOR_INDEX_NAME}"))
+
+def ensure_vector_index(conn: Connection, rebuild: bool = False, quantization: Optional[str] = None):
+    """
+    Creates the configured ANN index, or rebuilds it when its build parameters,
+    method, opclass or quantization changed (or when rebuild=True, e.g. after a bulk load for IVFFlat).
+    """
+    spec = vector_index_spec(quantization)
+    existing = conn.execute(
+        # 'I': the parent index of a partitioned table
+        text("SELECT obj_description(oid, 'pg_class') FROM pg_class WHERE relname = :name AND relkind IN ('i', 'I')"),
+        {"name": VECTOR_INDEX_NAME},
+    ).first()
+
+    if existing is not None and existing[0] == spec and not rebuild:
+        logger.info(f"Vector index up to date ({spec}).")
+        return
+
+    drop_vector_index(conn)
+    if spec == "none":
+        logger.info("Vector index disabled (VECTOR_INDEX=none); dense search will scan.")
+        return
+
+    if spec.startswith("ivfflat"):
+        rows = conn.execute(text("SELECT count(*) FROM document_chunks")).scalar()
+        if rows == 0:
+            # IVFFlat picks its list centroids from existing rows; an index built on an
+            # empty table has useless lists. Rebuild with init_db.py --rebuild-vector-index after loading.
+            logger.warning("Building IVFFlat index on an empty table; rebuild it after ingestion.")
+
+    if config.VECTOR_INDEX_BUILD_MEMORY:
+        conn.execute(text("SELECT set_config('maintenance_work_mem', :mem, true)"), {"mem": config.VECTOR_INDEX_BUILD_MEMORY})
+
+    logger.info(f"Building vector index ({spec})...")
+    conn.execute(text(_create_vector_index_sql(spec)))
+    conn.execute(text(f"COMMENT ON INDEX {VECTOR_INDEX_NAME} IS '{spec}'"))
+
+def ensure_search_vector(conn: Connection):
+    """
+    Adds the stored tsvector column and its GIN index to a document_chunks table
+    created before they existed (create_all() never alters existing tables).
+    Adding a stored generated column rewrites the table once.
+    """
+    conn.execute(text(
+        "ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_document_chunks_search_vector "
+        "ON document_chunks USING gin (search_vector)"
+    ))
+
+def ensure_acl_ids(conn: Connection):
+    """
+    Adds the integer-encoded ACL column + GIN index to an older document_chunks
+    table and backfills it (and acl_principals) from the JSONB metadata.
+    """
+    conn.execute(text(
+        "ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS acl_ids integer[] NOT NULL DEFAULT '{}'"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_document_chunks_acl_ids ON document_chunks USING gin (acl_ids)"
+    ))
+    conn.execute(text(f"""
+        INSERT INTO acl_principals (kind, name)
+        SELECT DISTINCT kind, name FROM ({CHUNK_PRINCIPALS_SQL}) cp
+        ON CONFLICT DO NOTHING
+    """))
+    result = conn.execute(text(f"""
+        UPDATE document_chunks c SET acl_ids = enc.ids
+        FROM (
+            SELECT cp.chunk_id, array_agg(DISTINCT ap.id ORDER BY ap.id) AS ids
+            FROM ({CHUNK_PRINCIPALS_SQL}) cp
+            JOIN acl_principals ap ON ap.kind = cp.kind AND ap.name = cp.name
+            GROUP BY cp.chunk_id
+        ) enc
+        WHERE c.id = enc.chunk_id AND c.acl_ids IS DISTINCT FROM enc.ids
+    """))
+    if result.rowcount:
+        logger.info(f"Backfilled acl_ids for {result.rowcount} chunks.")
+
+def ensure_chunk_identity(conn: Connection):
+    """
+    Adds content_hash and the unique (source_id, chunk_index) index to an older table
+    (plus PARTITION_KEY if it is partitioned: its unique indexes must include it).
+    Older versions inserted a fresh copy of every chunk on each run, so duplicates
+    are removed first (the newest copy of each chunk is kept).
+    """
+    conn.execute(text("ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS content_hash varchar(64)"))
+    exists = conn.execute(text("SELECT to_regclass('uq_document_chunks_source_chunk') IS NOT NULL")).scalar()
+    if not exists:
+        result = conn.execute(text("""
+            DELETE FROM document_chunks a USING document_chunks b
+            WHERE a.source_id = b.source_id AND a.chunk_index = b.chunk_index AND a.id < b.id
+        """))
+        if result.rowcount:
+            logger.info(f"Removed {result.rowcount} duplicate chunks.")
+        partition_key = PARTITION_KEY if is_partitioned(conn) else ()
+        columns = ", ".join(("source_id", "chunk_index", *partition_key))
+        conn.execute(text(f"CREATE UNIQUE INDEX uq_document_chunks_source_chunk ON document_chunks ({columns})"))
+    conn.execute(text(
+        "UPDATE document_chunks SET content_hash = encode(sha256(convert_to(content, 'UTF8')), 'hex') "
+        "WHERE content_hash IS NULL"
+    ))
+
+def ensure_chunk_scope(conn: Connection):
+    """
+    Adds the source / scope_key columns (see chunk_scope) and their index to an
+    older document_chunks table, backfilled from the JSONB metadata.
+    """
+    conn.execute(text("ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS source varchar NOT NULL DEFAULT ''"))
+    conn.execute(text("ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS scope_key varchar NOT NULL DEFAULT ''"))
+    result = conn.execute(text("""
+        UPDATE document_chunks SET
+            source = coalesce(metadata->>'source', ''),
+            scope_key = coalesce(metadata->>'space_key', metadata->>'project_key', '')
+        WHERE (source, scope_key) IS DISTINCT FROM
+              (coalesce(metadata->>'source', ''), coalesce(metadata->>'space_key', metadata->>'project_key', ''))
+    """))
+    if result.rowcount:
+        logger.info(f"Backfilled source/scope_key for {result.rowcount} chunks.")
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_document_chunks_scope ON document_chunks (source, scope_key)"
+    ))
+
+def is_partitioned(conn: Connection) -> bool:
+    return bool(conn.execute(
+        text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('document_chunks')")
+    ).scalar())
+
+def partition_name(source: Optional[str] = None) -> str:
+    """document_chunks_<source> (document_chunks_default for everything else); its HASH sub-partitions add _p<i>."""
+    if source is None:
+        return "document_chunks_default"
+    return "document_chunks_" + re.sub(r"[^a-z0-9_]", "_", source.lower())
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+def _exists(conn: Connection, name: str) -> bool:
+    return bool(conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar())
+
+def _in_default(conn: Connection, source: str) -> bool:
+    """Whether rows of `source` sit in the default partition (so its own one can't be attached)."""
+    default = partition_name()
+    return _exists(conn, default) and bool(conn.execute(
+        text(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE source = :source)"), {"source": source}
+    ).scalar())
+
+def _create_source_partition(conn: Connection, source: str) -> List[str]:
+    name = partition_name(source)
+    sub = " PARTITION BY HASH (scope_key)" if config.CHUNK_SCOPE_PARTITIONS > 0 else ""
+    conn.execute(text(
+        f"CREATE TABLE {name} PARTITION OF document_chunks FOR VALUES IN ({_literal(source)}){sub}"
+    ))
+    created = [name]
+    for i in range(config.CHUNK_SCOPE_PARTITIONS):
+        conn.execute(text(
+            f"CREATE TABLE {name}_p{i} PARTITION OF {name} "
+            f"FOR VALUES WITH (MODULUS {config.CHUNK_SCOPE_PARTITIONS}, REMAINDER {i})"
+        ))
+        created.append(f"{name}_p{i}")
+    return created
+
+def ensure_partitions(conn: Connection) -> List[str]:
+    """
+    Creates the missing partitions of a partitioned document_chunks: one LIST
+    partition per CHUNK_PARTITION_SOURCES entry (HASH-partitioned on scope_key
+    into CHUNK_SCOPE_PARTITIONS if set) and the default partition. Partitions
+    inherit the parent's indexes, ANN and GIN included, and each gets its own.
+    Returns the names of the partitions created.
+
+    Raises if a source's rows already sit in the default partition (e.g. the source
+    was added to CHUNK_PARTITION_SOURCES after ingesting it): Postgres can't attach a
+    partition the default one has rows for, and `init_db.py --partition` moves them.
+    """
+    if not is_partitioned(conn):
+        return []
+    created = []
+    for source in config.CHUNK_PARTITION_SOURCES:
+        if _exists(conn, partition_name(source)):
+            continue
+        if _in_default(conn, source):
+            raise ValueError(
+                f"Rows for source {source!r} are in {partition_name()}, so {partition_name(source)} can't be "
+                "created; run `CHUNK_PARTITIONING=true python init_db.py --partition` to move them into it"
+            )
+        created += _create_source_partition(conn, source)
+    default = partition_name()
+    if not _exists(conn, default):
+        conn.execute(text(f"CREATE TABLE {default} PARTITION OF document_chunks DEFAULT"))
+        created.append(default)
+    if created:
+        logger.info(f"Created partitions: {', '.join(created)}")
+    return created
+
+def split_default_partition(conn: Connection) -> int:
+    """
+    Moves the rows of every CHUNK_PARTITION_SOURCES entry without a partition out of
+    the default partition into a new one of its own: the default partition is detached,
+    the source's partition created, the rows re-inserted (ids kept) and the default
+    partition attached again, all in the caller's transaction. Returns the rows moved.
+    """
+    sources = [s for s in config.CHUNK_PARTITION_SOURCES if not _exists(conn, partition_name(s)) and _in_default(conn, s)]
+    if not sources:
+        return 0
+    default = partition_name()
+    columns = ", ".join(c.name for c in DocumentChunk.__table__.columns if c.computed is None)
+    conn.execute(text(f"ALTER TABLE document_chunks DETACH PARTITION {default}"))
+    moved = 0
+    for source in sources:
+        _create_source_partition(conn, source)
+        moved += conn.execute(text(
+            f"INSERT INTO document_chunks ({columns}) SELECT {columns} FROM {default} WHERE source = :source"
+        ), {"source": source}).rowcount
+        conn.execute(text(f"DELETE FROM {default} WHERE source = :source"), {"source": source})
+    conn.execute(text(f"ALTER TABLE document_chunks ATTACH PARTITION {default} DEFAULT"))
+    logger.info(f"Moved {moved} chunks out of {default} into their partitions: {', '.join(sources)}.")
+    return moved
+
+def partition_document_chunks(conn: Connection) -> int:
+    """
+    Migrates a plain document_chunks table to the partitioned layout (needs
+    CHUNK_PARTITIONING=true so the model describes it): the old table is renamed,
+    the partitioned one created with ensure_partitions, the rows copied over
+    (ids kept) and the old table dropped, all in the caller's transaction.
+    On an already partitioned table, moves the rows of sources added to
+    CHUNK_PARTITION_SOURCES since out of the default partition (split_default_partition).
+    Secondary indexes are built on the partitions as rows arrive; rebuild the ANN
+    index afterwards with ensure_vector_index. Returns the number of rows moved.
+    """
+    if not PARTITIONED:
+        raise ValueError("Set CHUNK_PARTITIONING=true to partition document_chunks")
+    if is_partitioned(conn):
+        logger.info("document_chunks is already partitioned.")
+        return split_default_partition(conn)
+    ensure_chunk_scope(conn)
+
+    old = "document_chunks_unpartitioned"
+    conn.execute(text(f"ALTER TABLE document_chunks RENAME TO {old}"))
+    # Free the index, constraint and sequence names for the new table
+    indexes = conn.execute(text(
+        "SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = CAST(:old AS regclass) AND NOT indisprimary"
+    ), {"old": old}).scalars().all()
+    for index in indexes:
+        conn.execute(text(f"DROP INDEX {index}"))
+    pkey = conn.execute(text(
+        "SELECT conname FROM pg_constraint WHERE conrelid = CAST(:old AS regclass) AND contype = 'p'"
+    ), {"old": old}).scalar()
+    if pkey:
+        conn.execute(text(f"ALTER TABLE {old} RENAME CONSTRAINT {pkey} TO {old}_pkey"))
+    sequence = conn.execute(text("SELECT pg_get_serial_sequence(:old, 'id')"), {"old": old}).scalar()
+    if sequence:
+        conn.execute(text(f"ALTER SEQUENCE {sequence} RENAME TO {old}_id_seq"))
+
+    DocumentChunk.__table__.create(conn)
+    ensure_partitions(conn)
+    columns = ", ".join(c.name for c in DocumentChunk.__table__.columns if c.computed is None)
+    moved = conn.execute(text(f"INSERT INTO document_chunks ({columns}) SELECT {columns} FROM {old}")).rowcount
+    conn.execute(text(
+        "SELECT setval(pg_get_serial_sequence('document_chunks', 'id'), coalesce(max(id), 0) + 1, false) "
+        "FROM document_chunks"
+    ))
+    conn.execute(text(f"DROP TABLE {old}"))
+    logger.info(f"Moved {moved} chunks into the partitioned document_chunks.")
+    return moved
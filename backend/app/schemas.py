@@ -1,6 +1,11 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 
+class ScopeFilter(BaseModel):
+    """Search only one source system, optionally only some of its spaces (Confluence) / projects (Jira)."""
+    source: str = Field(min_length=1)   # "confluence", "jira"
+    keys: List[str] = []                # e.g. ["ENG", "OPS"]; empty = the whole source
+
 class Message(BaseModel):
     role: str
     content: str
@@ -12,6 +17,10 @@ class ChatCompletionRequest(BaseModel):
     stream: bool = False
     # Custom fields for our internal Auth/ACL
     user: Optional[str] = "anonymous"
+    # Custom retrieval knobs: higher = better recall, slower dense search
+    ef_search: Optional[int] = Field(default=None, ge=1, le=1000)   # HNSW
+    ivfflat_probes: Optional[int] = Field(default=None, ge=1)       # IVFFlat
+    scope: Optional[ScopeFilter] = None
 
 class ChatCompletionChoice(BaseModel):
     index: int
@@ -25,3 +34,62 @@ class ChatCompletionResponse(BaseModel):
     model: str
     choices: List[ChatCompletionChoice]
     usage: Dict[str, int]
+
+# Streaming (stream=true): text/event-stream of chat.completion.chunk objects, then [DONE]
+class DeltaMessage(BaseModel):
+    role: Optional[str] = None
+    content: Optional[str] = None
+
+class ChatCompletionChunkChoice(BaseModel):
+    index: int
+    delta: DeltaMessage
+    finish_reason: Optional[str] = None
+
+class ChatCompletionChunk(BaseModel):
+    id: str
+    object: str = "chat.completion.chunk"
+    created: int
+    model: str
+    choices: List[ChatCompletionChunkChoice]
+
+# Retrieval only (/v1/retrieve, /v1/retrieve/batch): ranked chunks, no generation
+class RetrieveRequest(BaseModel):
+    query: str
+    user: Optional[str] = "anonymous"
+    limit: int = Field(default=5, ge=1, le=100)
+    ef_search: Optional[int] = Field(default=None, ge=1, le=1000)
+    ivfflat_probes: Optional[int] = Field(default=None, ge=1)
+    scope: Optional[ScopeFilter] = None
+
+class RetrieveBatchRequest(BaseModel):
+    queries: List[str] = Field(min_length=1)
+    user: Optional[str] = "anonymous"
+    limit: int = Field(default=5, ge=1, le=100)
+    ef_search: Optional[int] = Field(default=None, ge=1, le=1000)
+    ivfflat_probes: Optional[int] = Field(default=None, ge=1)
+    scope: Optional[ScopeFilter] = None
+
+class RetrievedChunkOut(BaseModel):
+    id: int
+    source_id: Optional[str] = None
+    chunk_index: Optional[int] = None
+    content: str
+    title: Optional[str] = None
+    url: Optional[str] = None
+    score: float                          # fused RRF score
+    dense_distance: Optional[float] = None
+    sparse_score: Optional[float] = None
+
+class RetrieveResponse(BaseModel):
+    object: str = "retrieval"
+    query: str
+    results: List[RetrievedChunkOut]
+
+class RetrieveBatchItem(BaseModel):
+    index: int
+    query: str
+    results: List[RetrievedChunkOut]
+
+class RetrieveBatchResponse(BaseModel):
+    object: str = "list"
+    data: List[RetrieveBatchItem]
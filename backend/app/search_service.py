@@ -1,71 +1,438 @@
-from typing import List, Dict, Any
-from sqlalchemy import text, func
-from app.database import SessionLocal
+from typing import List, Optional, Sequence, Tuple, Union
+from contextlib import asynccontextmanager
+import asyncio
+import time
+from sqlalchemy import select, func, literal, union_all, text, cast, null, true, values, column, Float, Integer, Text, tuple_
+from sqlalchemy.sql.elements import ColumnElement
+from pgvector.sqlalchemy import Vector
+from app.database import AsyncSessionLocal
 from app.models import DocumentChunk
 from app.ingestion import MockEmbeddings
+from app.embedding_cache import CachedEmbeddings, EmbeddingCache
+from app.embedding_batcher import BatchingEmbeddings
+from app.retrieval_cache import RetrievalCache
+from app.corpus import current_generation, changed_sources, source_visibility
+from app.schema import VECTOR_DISTANCES, EMBEDDING_DIM, quantized_distance
+from app.acl import group_filter
+from app.retrieval_backend import (
+    RetrievalBackend, RetrievedChunk, SearchScope, reciprocal_rank_fusion, fuse_legs, make_backend,
+)
+from app.metrics import stage, SEARCH_ERRORS, EMPTY_RESULTS, CACHE_REQUESTS, DB_POOL_WAIT_SECONDS
+from app import config
 import logging
 
 logger = logging.getLogger(__name__)
 
+SEARCH_MODES = ("sequential", "parallel", "fused")
+HNSW_DEFAULT_EF_SEARCH = 40 # pgvector's hnsw.ef_search default
+HNSW_MAX_EF_SEARCH = 1000   # pgvector rejects larger values (the API's ef_search has the same bound)
+
+# Columns fetched for every hit; metadata keys are extracted server-side
+RESULT_COLUMNS = (
+    DocumentChunk.id,
+    DocumentChunk.source_id,
+    DocumentChunk.chunk_index,
+    DocumentChunk.content,
+    DocumentChunk.metadata_["title"].astext.label("title"),
+    DocumentChunk.metadata_["url"].astext.label("url"),
+)
+
+def _chunk_from_row(row) -> RetrievedChunk:
+    return RetrievedChunk(
+        id=row.id,
+        source_id=row.source_id,
+        chunk_index=row.chunk_index,
+        content=row.content,
+        title=row.title,
+        url=row.url,
+        dense_distance=getattr(row, "dense_distance", None),
+        sparse_score=getattr(row, "sparse_score", None),
+        score=getattr(row, "score", None) or 0.0,
+    )
+
+def _correlated(stmt, correlate):
+    return stmt.correlate(correlate) if correlate is not None else stmt
+
+class PostgresBackend(RetrievalBackend):
+    """Both legs in Postgres: pgvector ANN and the GIN-indexed tsvector, ACLs via acl_ids."""
+    name = "postgres"
+
+    def __init__(self, mode: Optional[str] = None, quantization: Optional[str] = None,
+                 rescore_multiplier: Optional[int] = None):
+        self.mode = mode or config.SEARCH_MODE
+        if self.mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode {self.mode!r}, expected one of {SEARCH_MODES}")
+        # Must match the index (vector_index_spec), otherwise the coarse pass scans the table
+        self.quantization = quantization or config.VECTOR_QUANTIZATION
+        self.rescore_multiplier = rescore_multiplier or config.RESCORE_MULTIPLIER
+
+    def _acl_clause(self, allowed_groups: List[str]):
+        # Same rows as metadata->'allowed_groups' ?| :groups, but served by the GIN index on acl_ids
+        return group_filter(allowed_groups)
+
+    def _filters(self, allowed_groups: List[str], scope: Optional[SearchScope]) -> list:
+        """WHERE clauses shared by every leg: the ACL, plus the scope (which prunes partitions)."""
+        clauses = [self._acl_clause(allowed_groups)]
+        if scope is not None:
+            clauses.append(DocumentChunk.source == scope.source)
+            if scope.scope_keys:
+                clauses.append(DocumentChunk.scope_key.in_(scope.scope_keys))
+        return clauses
+
+    @staticmethod
+    def _query_vector(query_vec):
+        # A bound vector, or the (already vector-typed) column of a batch query list
+        if isinstance(query_vec, ColumnElement):
+            return query_vec
+        return cast(literal(query_vec, Vector(EMBEDDING_DIM)), Vector(EMBEDDING_DIM))
+
+    def _distance(self, query_vec: List[float]):
+        # The operator must match the ANN index opclass (VECTOR_DISTANCE), otherwise
+        # the planner cannot use the index and falls back to a sequential scan.
+        # All three (l2, cosine, negative inner product) order ASC = closest first.
+        method = VECTOR_DISTANCES[config.VECTOR_DISTANCE][1]
+        return getattr(DocumentChunk.embedding, method)(query_vec)
+
+    @asynccontextmanager
+    async def _session(self):
+        """AsyncSession with its connection checked out up front, so pool waits are measured."""
+        async with AsyncSessionLocal() as session:
+            started = time.perf_counter()
+            await session.connection()
+            DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+            yield session
+
+    async def _apply_ann_params(self, session, ef_search: Optional[int], probes: Optional[int], k: int = 0):
+        """
+        Per-transaction recall/latency knobs for the ANN index (SET LOCAL semantics).
+        An HNSW scan returns at most ef_search rows, so it is raised to the number of
+        candidates the dense leg asks for (k rows, times RESCORE_MULTIPLIER when quantized),
+        up to pgvector's limit of HNSW_MAX_EF_SEARCH; past it the leg gets fewer rows.
+        """
+        ef_search = ef_search or config.HNSW_EF_SEARCH
+        probes = probes or config.IVFFLAT_PROBES
+        candidates = self._candidates(k)
+        if config.VECTOR_INDEX == "hnsw" and candidates > (ef_search or HNSW_DEFAULT_EF_SEARCH):
+            ef_search = candidates
+        if ef_search:
+            ef_search = min(ef_search, HNSW_MAX_EF_SEARCH)
+            await session.execute(text("SELECT set_config('hnsw.ef_search', :v, true)"), {"v": str(int(ef_search))})
+        if probes:
+            await session.execute(text("SELECT set_config('ivfflat.probes', :v, true)"), {"v": str(int(probes))})
+
+    def _candidates(self, k: int) -> int:
+        return k * self.rescore_multiplier if self.quantization != "none" else k
+
+    def _dense_leg(self, query_vec: List[float], allowed_groups: List[str], k: int,
+                   scope: Optional[SearchScope] = None, correlate=None):
+        """
+        Dense candidates (RESULT_COLUMNS, dense_distance, rank), closest first.
+        With a quantized index: the top RESCORE_MULTIPLIER * k by quantized distance
+        (an index scan over the compact vectors), reordered by the exact distance.
+        `correlate`: the batch query list query_vec comes from (see _batch_statement).
+        """
+        distance = self._distance(query_vec)
+        if self.quantization != "none":
+            coarse = quantized_distance(DocumentChunk.embedding, self._query_vector(query_vec), self.quantization)
+            candidates = _correlated(select(DocumentChunk.id).where(
+                *self._filters(allowed_groups, scope)
+            ).order_by(coarse).limit(self._candidates(k)), correlate).subquery("coarse")
+            return _correlated(select(
+                *RESULT_COLUMNS,
+                distance.label("dense_distance"),
+                func.row_number().over(order_by=distance).label("rank"),
+            ).join(
+                candidates, candidates.c.id == DocumentChunk.id
+            ).order_by(distance).limit(k), correlate)
+        return _correlated(select(
+            *RESULT_COLUMNS,
+            distance.label("dense_distance"),
+            func.row_number().over(order_by=distance).label("rank"),
+        ).where(
+            *self._filters(allowed_groups, scope)
+        ).order_by(distance).limit(k), correlate)
+
+    def _sparse_leg(self, query_text: str, allowed_groups: List[str], k: int,
+                    scope: Optional[SearchScope] = None, correlate=None):
+        """Keyword candidates (RESULT_COLUMNS, sparse_score, rank), best ts_rank_cd first."""
+        # websearch_to_tsquery accepts free text ("quoted phrases", -exclusions) without syntax errors.
+        # search_vector is a stored, GIN-indexed column (title weighted above body).
+        tsquery = func.websearch_to_tsquery('english', query_text)
+        relevance = func.ts_rank_cd(DocumentChunk.search_vector, tsquery)
+        return _correlated(select(
+            *RESULT_COLUMNS,
+            relevance.label("sparse_score"),
+            func.row_number().over(order_by=(relevance.desc(), DocumentChunk.id)).label("rank"),
+        ).where(
+            *self._filters(allowed_groups, scope),
+            DocumentChunk.search_vector.op('@@')(tsquery)
+        ).order_by(relevance.desc(), DocumentChunk.id).limit(k), correlate)
+
+    def _fused_statement(self, query_text: str, query_vec: List[float], allowed_groups: List[str], limit: int,
+                         scope: Optional[SearchScope] = None, correlate=None):
+        """
+        Both legs as subqueries plus RRF scoring, so retrieval is a single round trip.
+        (Subqueries rather than CTEs so the statement also works inside a LATERAL join;
+        Postgres inlines single-use CTEs anyway, the plan is the same.)
+        """
+        dense = self._dense_leg(query_vec, allowed_groups, limit * 2, scope, correlate)
+        sparse = self._sparse_leg(query_text, allowed_groups, limit * 2, scope, correlate)
+        dense = dense.with_only_columns(
+            DocumentChunk.id, dense.selected_columns.rank, dense.selected_columns.dense_distance
+        ).subquery("dense")
+        sparse = sparse.with_only_columns(
+            DocumentChunk.id, sparse.selected_columns.rank, sparse.selected_columns.sparse_score
+        ).subquery("sparse")
+
+        no_score = cast(null(), Float)
+        candidates = union_all(
+            select(dense.c.id, dense.c.rank, dense.c.dense_distance, no_score.label("sparse_score")),
+            select(sparse.c.id, sparse.c.rank, no_score.label("dense_distance"), sparse.c.sparse_score),
+        ).subquery("candidates")
+        fused = select(
+            candidates.c.id,
+            func.sum(literal(1.0) / (config.RRF_K + candidates.c.rank)).label("score"),
+            func.min(candidates.c.dense_distance).label("dense_distance"),
+            func.max(candidates.c.sparse_score).label("sparse_score"),
+        ).group_by(candidates.c.id).subquery("fused")
+
+        return select(
+            *RESULT_COLUMNS, fused.c.dense_distance, fused.c.sparse_score, fused.c.score
+        ).join(
+            fused, fused.c.id == DocumentChunk.id
+        ).order_by(fused.c.score.desc(), DocumentChunk.id).limit(limit)
+
+    async def _run_leg(self, name: str, stmt, ef_search: Optional[int] = None, probes: Optional[int] = None,
+                       k: int = 0) -> List[RetrievedChunk]:
+        async with self._session() as session:
+            await self._apply_ann_params(session, ef_search, probes, k)
+            with stage(name):
+                return [_chunk_from_row(row) for row in await session.execute(stmt)]
+
+    async def generation(self) -> int:
+        async with self._session() as session:
+            return await current_generation(session)
+
+    async def changed_sources(self, since, generation):
+        async with self._session() as session:
+            return await changed_sources(session, since, generation)
+
+    async def source_visibility(self, source_ids):
+        async with self._session() as session:
+            return await source_visibility(session, source_ids)
+
+    async def dense(self, query_vec, allowed_groups, k, ef_search=None, probes=None, scope=None):
+        async with self._session() as session:
+            await self._apply_ann_params(session, ef_search, probes, k)
+            stmt = self._dense_leg(query_vec, allowed_groups, k, scope)
+            return [_chunk_from_row(row) for row in await session.execute(stmt)]
+
+    async def sparse(self, query_text, allowed_groups, k, scope=None):
+        async with self._session() as session:
+            stmt = self._sparse_leg(query_text, allowed_groups, k, scope)
+            return [_chunk_from_row(row) for row in await session.execute(stmt)]
+
+    async def fetch_chunks(self, keys: List[Tuple[str, int]], allowed_groups: List[str]) -> List[RetrievedChunk]:
+        if not keys:
+            return []
+        # Served by the unique (source_id, chunk_index) index
+        stmt = select(*RESULT_COLUMNS).where(
+            tuple_(DocumentChunk.source_id, DocumentChunk.chunk_index).in_(keys),
+            self._acl_clause(allowed_groups),
+        )
+        async with self._session() as session:
+            return [_chunk_from_row(row) for row in await session.execute(stmt)]
+
+    async def retrieve(
+        self,
+        query_text: str,
+        query_vec: List[float],
+        allowed_groups: List[str],
+        limit: int,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        scope: Optional[SearchScope] = None,
+    ) -> List[RetrievedChunk]:
+        if self.mode == "fused":
+            # 2. Dense + Sparse + RRF in one statement
+            async with self._session() as session:
+                await self._apply_ann_params(session, ef_search, probes, limit * 2)
+                stmt = self._fused_statement(query_text, query_vec, allowed_groups, limit, scope)
+                with stage("fused_query"):
+                    return [_chunk_from_row(row) for row in await session.execute(stmt)]
+
+        # 2. Vector Search (Dense) and 3. Keyword Search (Sparse)
+        dense_stmt = self._dense_leg(query_vec, allowed_groups, limit * 2, scope)
+        sparse_stmt = self._sparse_leg(query_text, allowed_groups, limit * 2, scope)
+        if self.mode == "parallel":
+            # One connection per leg, so latency is max(dense, sparse) instead of the sum
+            dense_results, sparse_results = await asyncio.gather(
+                self._run_leg("dense", dense_stmt, ef_search, probes, limit * 2), self._run_leg("sparse", sparse_stmt)
+            )
+        else:
+            async with self._session() as session:
+                await self._apply_ann_params(session, ef_search, probes, limit * 2)
+                with stage("dense"):
+                    dense_results = [_chunk_from_row(row) for row in await session.execute(dense_stmt)]
+                with stage("sparse"):
+                    sparse_results = [_chunk_from_row(row) for row in await session.execute(sparse_stmt)]
+
+        # 4. Reciprocal Rank Fusion (RRF)
+        with stage("fusion"):
+            return fuse_legs(dense_results, sparse_results, limit)
+
+    def _batch_statement(self, queries: Sequence[Tuple[str, List[float]]], allowed_groups: List[str], limit: int,
+                         scope: Optional[SearchScope] = None):
+        """
+        The fused statement for every query at once: a VALUES list of (ord, text, vector)
+        LATERAL-joined to the per-query dense + sparse + RRF subquery. Rows come back
+        as (ord, hit columns...), best first within each ord.
+        """
+        rows = values(
+            column("ord", Integer), column("query_text", Text), column("query_vec", Vector(EMBEDDING_DIM)),
+            name="batch",
+        ).data([(i, text_, vector) for i, (text_, vector) in enumerate(queries)])
+        # Plain VALUES parameters arrive untyped; cast once so the legs compare vector to vector
+        batch = select(
+            rows.c.ord, rows.c.query_text, cast(rows.c.query_vec, Vector(EMBEDDING_DIM)).label("query_vec")
+        ).subquery("queries")
+        hits = self._fused_statement(
+            batch.c.query_text, batch.c.query_vec, allowed_groups, limit, scope, correlate=batch
+        ).lateral("hits")
+        return select(batch.c.ord, hits).select_from(batch).join(hits, true()).order_by(
+            batch.c.ord, hits.c.score.desc(), hits.c.id
+        )
+
+    async def retrieve_many(self, queries, allowed_groups, limit, ef_search=None, probes=None, scope=None):
+        if not queries:
+            return []
+        results: List[List[RetrievedChunk]] = [[] for _ in queries]
+        async with self._session() as session:
+            await self._apply_ann_params(session, ef_search, probes, limit * 2)
+            stmt = self._batch_statement(queries, allowed_groups, limit, scope)
+            with stage("batch_query"):
+                for row in await session.execute(stmt):
+                    results[row.ord].append(_chunk_from_row(row))
+        return results
+
 class HybridSearchService:
-    def __init__(self):
-        self.embeddings = MockEmbeddings()
+    def __init__(self, mode: Optional[str] = None, backend: Optional[RetrievalBackend] = None):
+        # Replace MockEmbeddings with OpenAIEmbeddings() in prod; the cache wraps either.
+        # Cache misses of concurrent requests are embedded together (app/embedding_batcher.py).
+        self.embeddings = CachedEmbeddings(BatchingEmbeddings(MockEmbeddings()), EmbeddingCache.from_config())
+        self.cache = RetrievalCache.from_config()
+        self.backend = backend or make_backend(mode=mode)
 
-    def search(self, query_text: str, allowed_groups: List[str], limit: int = 5) -> List[DocumentChunk]:
+    async def search(
+        self,
+        query_text: str,
+        allowed_groups: List[str],
+        limit: int = 5,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        scope: Optional[SearchScope] = None,
+        generation: Optional[int] = None,
+    ) -> List[RetrievedChunk]:
         """
         Performs Hybrid Search (Vector + Keyword) with ACL filtering.
         Uses Reciprocal Rank Fusion (RRF) to combine results.
+        The legs run in self.backend (Postgres unless RETRIEVAL_BACKEND says otherwise),
+        without blocking the event loop.
+        ef_search / probes trade recall for latency on the Postgres dense leg (HNSW / IVFFlat);
+        None falls back to HNSW_EF_SEARCH / IVFFLAT_PROBES, then the server default.
+        scope limits the search to one source (and optionally some of its spaces / projects);
+        on a partitioned document_chunks only their partitions are scanned.
+        Results are cached per (query, exact group set, limit, knobs, scope) until the next ingestion.
+        generation: the corpus generation the caller already read for this request (saves
+        a round trip and keeps both caches on the same generation); read here if None.
         """
-        session = SessionLocal()
         try:
-            # 1. Vector Search (Dense)
-            query_vec = self.embeddings.embed_query(query_text)
-            # Use l2_distance (Euclidean) or cosine_distance
-            # Note: pgvector < 0.5.0 uses operators, 0.5.0+ has functions but operators still work
-            # For cosine similarity we often want 1 - cosine_distance.
-            # Here we just order by distance ASC (closest first).
-            dense_results = session.query(DocumentChunk).filter(
-                text("metadata->'allowed_groups' ?| :groups")
-            ).order_by(
-                DocumentChunk.embedding.l2_distance(query_vec)
-            ).params(groups=allowed_groups).limit(limit * 2).all()
-
-            # 2. Keyword Search (Sparse)
-            # Using basic ILIKE for prototype simplicity or plain to_tsvector call
-            # Ideally: filter(DocumentChunk.content.op("@@")(func.websearch_to_tsquery(query_text)))
-            # But let's check if 'english' config exists. Default postgres usually has it.
-            sparse_results = session.query(DocumentChunk).filter(
-                text("metadata->'allowed_groups' ?| :groups"),
-                func.to_tsvector('english', DocumentChunk.content).op('@@')(func.websearch_to_tsquery('english', query_text))
-            ).params(groups=allowed_groups).limit(limit * 2).all()
-
-            # 3. Reciprocal Rank Fusion (RRF)
-            fused_scores = {}
-            k = 60 # RRF constant
-
-            # Rank Dense
-            for rank, doc in enumerate(dense_results):
-                if doc.id not in fused_scores:
-                    fused_scores[doc.id] = {"doc": doc, "score": 0.0}
-                fused_scores[doc.id]["score"] += 1.0 / (k + rank + 1)
-
-            # Rank Sparse
-            for rank, doc in enumerate(sparse_results):
-                if doc.id not in fused_scores:
-                    fused_scores[doc.id] = {"doc": doc, "score": 0.0}
-                fused_scores[doc.id]["score"] += 1.0 / (k + rank + 1)
-
-            # Sort by fused score DESC
-            sorted_results = sorted(
-                fused_scores.values(), 
-                key=lambda x: x["score"], 
-                reverse=True
-            )
-            
-            return [item["doc"] for item in sorted_results[:limit]]
-            
+            with stage("search"):
+                cache_key = None
+                if self.cache.max_size > 0:
+                    cache_key = RetrievalCache.key(query_text, allowed_groups, limit, (ef_search, probes, scope))
+                    with stage("cache_lookup"):
+                        if generation is None:
+                            generation = await self.backend.generation()
+                        cached = self.cache.get(cache_key, generation)
+                    CACHE_REQUESTS.inc(cache="retrieval", result="miss" if cached is None else "hit")
+                    if cached is not None:
+                        return cached
+
+                results = await self._search(query_text, allowed_groups, limit, ef_search, probes, scope)
+
+                if cache_key is not None:
+                    self.cache.put(cache_key, generation, results)
+                if not results:
+                    EMPTY_RESULTS.inc()
+                return results
+
         except Exception as e:
-            logger.error(f"Search failed: {e}")
+            # Answering "not found" beats failing the request, but it must not go unnoticed
+            SEARCH_ERRORS.inc(error=type(e).__name__)
+            logger.exception(f"Search failed: {e}")
             return []
-        finally:
-            session.close()
+
+    async def search_many(
+        self,
+        query_texts: List[str],
+        allowed_groups: List[str],
+        limit: int = 5,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        scope: Optional[SearchScope] = None,
+    ) -> List[List[RetrievedChunk]]:
+        """
+        search() for many queries of one caller, results in the same order.
+        Cached result lists are served as usual; the remaining queries are embedded in
+        one call and retrieved together (backend.retrieve_many: one SQL statement on Postgres).
+        """
+        results: List[Optional[List[RetrievedChunk]]] = [None] * len(query_texts)
+        try:
+            with stage("search"):
+                keys = [None] * len(query_texts)
+                if self.cache.max_size > 0:
+                    with stage("cache_lookup"):
+                        generation = await self.backend.generation()
+                        for i, query_text in enumerate(query_texts):
+                            keys[i] = RetrievalCache.key(query_text, allowed_groups, limit, (ef_search, probes, scope))
+                            results[i] = self.cache.get(keys[i], generation)
+                            CACHE_REQUESTS.inc(cache="retrieval", result="miss" if results[i] is None else "hit")
+
+                pending = list(dict.fromkeys(q for q, r in zip(query_texts, results) if r is None))
+                if pending:
+                    with stage("embed"):
+                        vectors = await self.embeddings.aembed_queries(pending)
+                    fetched = dict(zip(pending, await self.backend.retrieve_many(
+                        list(zip(pending, vectors)), allowed_groups, limit, ef_search, probes, scope
+                    )))
+                    for i, query_text in enumerate(query_texts):
+                        if results[i] is None:
+                            results[i] = list(fetched[query_text])
+                            if keys[i] is not None:
+                                self.cache.put(keys[i], generation, results[i])
+                            if not results[i]:
+                                EMPTY_RESULTS.inc()
+                return results
+
+        except Exception as e:
+            SEARCH_ERRORS.inc(error=type(e).__name__)
+            logger.exception(f"Batch search failed: {e}")
+            return [[] for _ in query_texts]
+
+    async def _search(
+        self,
+        query_text: str,
+        allowed_groups: List[str],
+        limit: int,
+        ef_search: Optional[int],
+        probes: Optional[int],
+        scope: Optional[SearchScope] = None,
+    ) -> List[RetrievedChunk]:
+        # 1. Embed the query (cached). Real embedding clients do network I/O, so go through
+        # the async API (the default implementation offloads to a thread).
+        with stage("embed"):
+            query_vec = await self.embeddings.aembed_query(query_text)
+
+        # 2. Both legs + RRF in the configured backend
+        return await self.backend.retrieve(query_text, query_vec, allowed_groups, limit, ef_search, probes, scope)
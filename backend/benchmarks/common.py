@@ -0,0 +1,18 @@
+"""Shared helpers for the benchmark scripts."""
+from typing import Dict, List
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/mean in milliseconds for a list of durations in seconds."""
+    return {
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": (sum(latencies) / len(latencies) * 1000) if latencies else 0.0,
+    }
@@ -0,0 +1,85 @@
+"""
+Closed-loop load test for /v1/chat/completions.
+
+Fires requests from N concurrent clients against a single running uvicorn worker
+and reports throughput and latency percentiles per concurrency level. Run it once
+against the old (blocking) build and once against the current one to compare
+how concurrency scales per worker:
+
+    uvicorn app.main:app --workers 1 --port 8000
+    PYTHONPATH=backend python -m benchmarks.concurrency --levels 1,8,32,64 --out async.json
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.common import latency_summary
+
+QUESTIONS = [
+    ("dev", "How to fix login error?"),
+    ("exec", "Project Secret X status"),
+    ("dev", "Is the login bug (JIRA-555) fixed?"),
+    ("intern", "What does error 0x80040 mean?"),
+]
+
+async def run_level(base_url: str, concurrency: int, requests_per_client: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    errors = 0
+
+    async def client_loop(client: httpx.AsyncClient, worker_id: int):
+        nonlocal errors
+        for i in range(requests_per_client):
+            user, question = QUESTIONS[(worker_id + i) % len(QUESTIONS)]
+            payload = {
+                "model": "rag-agent",
+                "messages": [{"role": "user", "content": question}],
+                "user": user,
+            }
+            start = time.perf_counter()
+            try:
+                resp = await client.post(f"{base_url}/v1/chat/completions", json=payload)
+                resp.raise_for_status()
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client, w) for w in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        **latency_summary(latencies),
+    }
+
+async def main(args):
+    results = []
+    for level in [int(x) for x in args.levels.split(",")]:
+        stats = await run_level(args.base_url, level, args.requests_per_client)
+        results.append(stats)
+        print(
+            f"c={stats['concurrency']:>4}  rps={stats['throughput_rps']:8.1f}  "
+            f"p50={stats['p50_ms']:7.1f}ms  p95={stats['p95_ms']:7.1f}ms  "
+            f"p99={stats['p99_ms']:7.1f}ms  errors={stats['errors']}"
+        )
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"base_url": args.base_url, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--levels", default="1,4,16,32,64")
+    parser.add_argument("--requests-per-client", type=int, default=20)
+    parser.add_argument("--out", help="Write results as JSON to this path")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,138 @@
+"""Synthetic documents for ingestion and retrieval benchmarks."""
+from typing import Iterator, List, Sequence, Tuple
+import random
+
+import numpy as np
+from langchain_core.documents import Document
+
+WORDS = (
+    "vpn router handshake timeout reboot deploy release pipeline kubernetes cluster node "
+    "database index query latency cache invoice payroll salary benefits onboarding laptop "
+    "password reset access badge incident outage postmortem roadmap launch budget forecast "
+    "contract vendor security audit compliance policy backup restore migration upgrade"
+).split()
+
+def synthetic_documents(n: int, seed: int = 0, paragraphs: int = 6, groups: Sequence[str] = ("group:everyone",),
+                        prefix: str = "SYN-") -> Iterator[Document]:
+    """Yields n reproducible documents of ~`paragraphs` x 400 characters, one of `groups` each."""
+    rng = random.Random(seed)
+    for i in range(n):
+        body: List[str] = []
+        for _ in range(paragraphs):
+            body.append(" ".join(rng.choice(WORDS) for _ in range(55)) + ".")
+        yield Document(
+            page_content="\n\n".join(body),
+            metadata={
+                "source": "synthetic",
+                "source_id": f"{prefix}{i}",
+                "title": f"Synthetic document {i}: {rng.choice(WORDS)} {rng.choice(WORDS)}",
+                "allowed_groups": [groups[i % len(groups)]],
+                "allowed_users": [],
+            },
+        )
+
+# ACL profiles: share of chunks readable by everyone, and how restricted chunks pick groups
+ACL_PROFILES = {
+    "public": {"everyone": 1.0},
+    "zipf": {"everyone": 0.5},       # half public, the rest spread over groups with Zipf popularity
+    "restricted": {"everyone": 0.1}, # most content behind small groups
+}
+
+class SyntheticCorpus:
+    """
+    Clustered synthetic chunks with ACLs, for retrieval benchmarks that need a
+    realistic ANN workload (random uniform vectors have no neighbourhood structure).
+
+    Each chunk belongs to one of `topics` clusters: its vector is the topic centroid
+    plus noise, and its text mixes topic-specific terms with common words, so both
+    the dense and the keyword leg have something to find. Everything is derived
+    from `seed`, so the same arguments always produce the same corpus and queries.
+    """
+
+    def __init__(self, n_chunks: int, seed: int = 0, topics: int = 256, groups: int = 50,
+                 acl: str = "zipf", dim: int = 1536, chunks_per_doc: int = 10, prefix: str = "BENCH-"):
+        if acl not in ACL_PROFILES:
+            raise ValueError(f"Unknown ACL profile {acl!r}, expected one of {tuple(ACL_PROFILES)}")
+        self.n_chunks = n_chunks
+        self.seed = seed
+        self.topics = topics
+        self.acl = acl
+        self.dim = dim
+        self.chunks_per_doc = chunks_per_doc
+        self.prefix = prefix
+        self.groups = [f"group:bench-{g}" for g in range(groups)]
+        weights = 1.0 / np.arange(1, groups + 1) ** 1.1
+        self.group_weights = weights / weights.sum()
+        rng = np.random.default_rng(seed)
+        self.centroids = rng.standard_normal((topics, dim)).astype(np.float32)
+        self.centroids /= np.linalg.norm(self.centroids, axis=1, keepdims=True)
+
+    def _topic_terms(self, topic: int) -> List[str]:
+        return [f"topic{topic}term{j}" for j in range(5)]
+
+    def _vectors(self, rng, topics, noise: float) -> np.ndarray:
+        vectors = self.centroids[topics] + noise * rng.standard_normal((len(topics), self.dim)).astype(np.float32) / np.sqrt(self.dim)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def _chunk_groups(self, rng) -> List[str]:
+        if rng.random() < ACL_PROFILES[self.acl]["everyone"]:
+            return ["group:everyone"]
+        n = 1 if rng.random() < 0.8 else 2
+        return sorted(set(rng.choice(self.groups, size=n, p=self.group_weights).tolist()))
+
+    def user_groups(self, rng) -> List[str]:
+        """A caller's group set: everyone plus 0-3 groups, popular groups more likely."""
+        n = int(rng.integers(0, 4))
+        return ["group:everyone"] + sorted(set(rng.choice(self.groups, size=n, p=self.group_weights).tolist())) if n else ["group:everyone"]
+
+    def documents(self, block: int = 1000) -> Iterator[Tuple[str, List[dict]]]:
+        """Yields (source_id, chunk rows) with content, metadata and float32 embedding."""
+        doc_chunks: List[dict] = []
+        for start in range(0, self.n_chunks, block):
+            rng = np.random.default_rng([self.seed, start])
+            n = min(block, self.n_chunks - start)
+            topics = rng.integers(0, self.topics, size=n)
+            vectors = self._vectors(rng, topics, noise=1.0)
+            for offset in range(n):
+                i = start + offset
+                doc = i // self.chunks_per_doc
+                topic = int(topics[offset])
+                terms = self._topic_terms(topic)
+                # ~30% topic terms, the rest common words
+                picks = rng.integers(0, 10 * len(WORDS), size=60)
+                words = [terms[p % len(terms)] if p < 3 * len(WORDS) else WORDS[p % len(WORDS)] for p in picks.tolist()]
+                source_id = f"{self.prefix}{doc}"
+                doc_chunks.append({
+                    "source_id": source_id,
+                    "chunk_index": i % self.chunks_per_doc,
+                    "content": " ".join(words),
+                    "metadata_": {
+                        "source": "benchmark",
+                        "source_id": source_id,
+                        "title": f"Synthetic {terms[0]} document {doc}",
+                        "allowed_groups": self._chunk_groups(rng),
+                        "allowed_users": [],
+                    },
+                    "embedding": vectors[offset],
+                    "source": "benchmark",
+                    "scope_key": "",
+                })
+                if i % self.chunks_per_doc == self.chunks_per_doc - 1 or i == self.n_chunks - 1:
+                    yield source_id, doc_chunks
+                    doc_chunks = []
+
+    def queries(self, n: int, seed: int = 1) -> List[Tuple[str, np.ndarray, List[str]]]:
+        """
+        (query text, query vector, caller groups): two topic terms plus a common word,
+        near the topic centroid. Repeated texts get the same vector.
+        """
+        rng = np.random.default_rng([self.seed, seed, 7])
+        topics = rng.integers(0, self.topics, size=n)
+        vectors = self._vectors(rng, topics, noise=0.5)
+        queries, seen = [], {}
+        for q, topic in enumerate(topics):
+            terms = self._topic_terms(int(topic))
+            text = f"{terms[int(rng.integers(0, 5))]} {terms[int(rng.integers(0, 5))]} {WORDS[int(rng.integers(0, len(WORDS)))]}"
+            vector = seen.setdefault(text, vectors[q])
+            queries.append((text, vector, self.user_groups(rng)))
+        return queries
@@ -0,0 +1,92 @@
+"""
+Closed-loop load test of query-embedding micro-batching (app/embedding_batcher.py).
+
+N concurrent users each embed unique questions (so the query cache never hits)
+against a simulated embedding endpoint. Each call costs a fixed round trip plus
+a small per-text cost, and at most --slots calls run at once, like a
+rate-limited API or a local model on one GPU. Every level runs once with
+batching off and once on, and the report has throughput and latency for both.
+
+    PYTHONPATH=backend python -m benchmarks.embedding_batching --users 1,16,50,100 --out results/embed_batching.json
+"""
+from typing import List
+import argparse
+import asyncio
+import json
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.embedding_batcher import BatchingEmbeddings
+from benchmarks.common import latency_summary
+
+class SimulatedEmbeddings(Embeddings):
+    """Sleeps call_ms + item_ms per text, with at most `slots` calls in flight."""
+
+    def __init__(self, call_ms: float, item_ms: float, slots: int, dim: int = 1536):
+        self.call_ms = call_ms
+        self.item_ms = item_ms
+        self.slots = threading.BoundedSemaphore(slots)
+        self.dim = dim
+        self.calls = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self.slots:
+            self.calls += 1
+            time.sleep((self.call_ms + self.item_ms * len(texts)) / 1000)
+        return [np.full(self.dim, hash(t) % 1000, dtype=np.float32) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+async def run_level(embeddings: Embeddings, users: int, duration: float) -> dict:
+    latencies: List[float] = []
+    deadline = time.perf_counter() + duration
+
+    async def user(user_id: int):
+        i = 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            await embeddings.aembed_query(f"user {user_id} question {i}")
+            latencies.append(time.perf_counter() - started)
+            i += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(u) for u in range(users)))
+    elapsed = time.perf_counter() - started
+    return {"users": users, "requests": len(latencies), "throughput_qps": len(latencies) / elapsed,
+            **latency_summary(latencies)}
+
+def main(args):
+    report = {"call_ms": args.call_ms, "item_ms": args.item_ms, "slots": args.slots,
+              "max_batch": args.max_batch, "max_wait_ms": args.max_wait_ms, "levels": []}
+    for users in args.users:
+        level = {"users": users}
+        for name, max_batch in (("unbatched", 1), ("batched", args.max_batch)):
+            model = SimulatedEmbeddings(args.call_ms, args.item_ms, args.slots)
+            embeddings = BatchingEmbeddings(model, max_batch=max_batch, max_wait_ms=args.max_wait_ms)
+            result = asyncio.run(run_level(embeddings, users, args.duration))
+            result["embedding_calls"] = model.calls
+            result["mean_batch_size"] = result["requests"] / max(model.calls, 1)
+            level[name] = result
+            print(f"users={users:>4} {name:>9}: {result['throughput_qps']:8.1f} q/s  "
+                  f"p50={result['p50_ms']:7.1f}ms  p99={result['p99_ms']:7.1f}ms  calls={model.calls}")
+        level["speedup"] = level["batched"]["throughput_qps"] / max(level["unbatched"]["throughput_qps"], 1e-9)
+        report["levels"].append(level)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=lambda s: [int(x) for x in s.split(",")], default=[1, 16, 50, 100])
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per run")
+    parser.add_argument("--call-ms", type=float, default=20.0, help="simulated round trip per embedding call")
+    parser.add_argument("--item-ms", type=float, default=0.2, help="simulated cost per text")
+    parser.add_argument("--slots", type=int, default=4, help="embedding calls in flight at once")
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--out")
+    main(parser.parse_args())
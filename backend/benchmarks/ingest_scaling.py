@@ -0,0 +1,48 @@
+"""
+Scaling of the CPU-bound split stage (splitting + chunk hashing) with worker processes.
+
+Runs app.ingestion.split_documents over a synthetic corpus on a process pool of
+each size and reports documents/s and speedup over one worker. No database or
+embedding calls are involved:
+
+    PYTHONPATH=backend python -m benchmarks.ingest_scaling --docs 20000 --workers 1 2 4 8
+"""
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+import time
+
+from app.ingestion import batched, split_documents
+from benchmarks.corpus import synthetic_documents
+
+def run(docs: int, workers: int, batch_docs: int) -> dict:
+    batches = list(batched(synthetic_documents(docs), batch_docs))
+    started = time.perf_counter()
+    chunks = 0
+    if workers == 1:
+        for batch in batches:
+            chunks += sum(len(c) for _, c, _ in split_documents(batch))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for result in pool.map(split_documents, batches):
+                chunks += sum(len(c) for _, c, _ in result)
+    elapsed = time.perf_counter() - started
+    return {"workers": workers, "documents": docs, "chunks": chunks, "seconds": elapsed, "documents_per_sec": docs / elapsed}
+
+def main(args):
+    results = [run(args.docs, w, args.batch_docs) for w in args.workers]
+    base = results[0]["documents_per_sec"]
+    for r in results:
+        r["speedup"] = r["documents_per_sec"] / base
+        print(f"workers={r['workers']:<3} {r['documents_per_sec']:9.0f} docs/s  speedup x{r['speedup']:.2f}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--batch-docs", type=int, default=200)
+    parser.add_argument("--out", help="write results as JSON")
+    main(parser.parse_args())
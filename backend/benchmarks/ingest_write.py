@@ -0,0 +1,120 @@
+"""
+Write-path throughput: INSERT executemany (orm) vs binary COPY (copy).
+
+Each writer runs in its own subprocess so peak RSS is measured per writer.
+Chunks are synthetic (random 1536-dim vectors) and are deleted afterwards:
+
+    PYTHONPATH=backend python -m benchmarks.ingest_write --chunks 20000 --writers orm copy
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+SOURCE_PREFIX = "BENCH-WRITE-"
+CHUNKS_PER_DOC = 10
+
+def synthetic_plans(n_chunks: int):
+    from app.chunk_embedder import content_hash
+    from app.chunk_writer import DocumentPlan
+
+    rng = np.random.default_rng(0)
+    for doc in range(0, n_chunks, CHUNKS_PER_DOC):
+        plan = DocumentPlan(source_id=f"{SOURCE_PREFIX}{doc}")
+        for i in range(min(CHUNKS_PER_DOC, n_chunks - doc)):
+            content = f"benchmark chunk {doc}-{i} " * 20
+            plan.inserts.append({
+                "source_id": plan.source_id,
+                "chunk_index": i,
+                "content": content,
+                "content_hash": content_hash(content),
+                "embedding": rng.random(1536, dtype=np.float32).tolist(),
+                "metadata_": {"source_id": plan.source_id, "title": "bench", "allowed_groups": ["group:everyone"]},
+                "acl_ids": [],
+                "source": "",
+                "scope_key": "",
+            })
+        yield plan
+
+def cleanup():
+    from app.database import SessionLocal
+    from app.models import DocumentChunk
+
+    session = SessionLocal()
+    session.query(DocumentChunk).filter(DocumentChunk.source_id.like(f"{SOURCE_PREFIX}%")).delete(synchronize_session=False)
+    session.commit()
+    session.close()
+
+def run_writer(writer_kind: str, n_chunks: int, plan_batch: int) -> dict:
+    """Runs in the child process: writes n_chunks, reports rows/s and peak RSS."""
+    from app.chunk_writer import make_writer
+    from app.database import SessionLocal
+
+    cleanup()
+    writer = make_writer(writer_kind)
+    session = SessionLocal()
+    written, elapsed = 0, 0.0
+    batch = []
+
+    def flush():
+        nonlocal written, elapsed
+        start = time.perf_counter()
+        written += writer.write(session, batch)["inserted"]
+        elapsed += time.perf_counter() - start
+        batch.clear()
+
+    # Plans are generated and written in bounded batches, like process_documents
+    for plan in synthetic_plans(n_chunks):
+        batch.append(plan)
+        if len(batch) >= plan_batch:
+            flush()
+    if batch:
+        flush()
+    session.close()
+    cleanup()
+
+    return {
+        "writer": writer_kind,
+        "fell_back": writer_kind == "copy" and not writer.copy_enabled,
+        "rows": written,
+        "seconds": elapsed,
+        "rows_per_sec": written / elapsed if elapsed else 0.0,
+        # ru_maxrss is KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def main(args):
+    if args.child:
+        print(json.dumps(run_writer(args.child, args.chunks, args.plan_batch)))
+        return
+
+    results = []
+    for writer in args.writers:
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.ingest_write", "--child", writer,
+             "--chunks", str(args.chunks), "--plan-batch", str(args.plan_batch)],
+            check=True, capture_output=True, text=True,
+        )
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(
+            f"{writer:<5} {result['rows']:>7} rows  {result['rows_per_sec']:9.0f} rows/s  "
+            f"peak RSS {result['peak_rss_mb']:7.1f} MB{'  (fell back to INSERT)' if result['fell_back'] else ''}"
+        )
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--writers", nargs="+", default=["orm", "copy"], choices=["orm", "copy"])
+    parser.add_argument("--plan-batch", type=int, default=500, help="documents handed to the writer at a time")
+    parser.add_argument("--out", help="write results as JSON")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    main(parser.parse_args())
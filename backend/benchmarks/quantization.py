@@ -0,0 +1,97 @@
+"""
+Index size, build time, recall and latency of the quantized ANN indexes
+(VECTOR_QUANTIZATION none / halfvec / binary) on the synthetic benchmark corpus.
+
+Loads the corpus once (or reuses one left by `benchmarks.suite --keep`, with
+--skip-load), then for each quantization rebuilds the index and, for each
+RESCORE_MULTIPLIER, measures dense recall@k against exact search and
+single-client latency. The configured index is restored at the end.
+
+    PYTHONPATH=backend python -m benchmarks.quantization --chunks 100000 \\
+        --quantization none,halfvec,binary --multiplier 2,4,8 --out results/quantization.json
+"""
+from typing import List
+import argparse
+import asyncio
+import json
+import time
+
+from sqlalchemy import text
+
+from app import config
+from app.database import engine, async_engine
+from app.schema import ensure_vector_index, vector_index_size, vector_index_spec
+from app.search_service import PostgresBackend
+from benchmarks.corpus import ACL_PROFILES, SyntheticCorpus
+from benchmarks.suite import ExactPostgresBackend, cleanup, int_list, load_corpus, make_service, measure_latency, measure_recall
+
+def rebuild_index(quantization: str) -> dict:
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        ensure_vector_index(conn, rebuild=True, quantization=quantization)
+        conn.commit()
+        size = vector_index_size(conn)
+    return {"spec": vector_index_spec(quantization), "build_seconds": time.perf_counter() - started, "index_bytes": size}
+
+async def measure(queries, quantization: str, multiplier: int, k: int, ef_search) -> dict:
+    vectors = {text_: vector for text_, vector, _ in queries}
+    backend = PostgresBackend("sequential", quantization=quantization, rescore_multiplier=multiplier)
+    ann = make_service(backend, vectors)
+    exact = make_service(ExactPostgresBackend("sequential"), vectors)
+    try:
+        recall = await measure_recall(queries, ann, exact, k, ef_search)
+        latency = await measure_latency(ann, queries, k, 1, ef_search)
+    finally:
+        await async_engine.dispose()
+    return {"rescore_multiplier": multiplier, **recall, "latency": latency}
+
+def main(args):
+    corpus = SyntheticCorpus(args.chunks, seed=args.seed, acl=args.acl)
+    queries = corpus.queries(args.queries, seed=args.seed + 1)
+    report = {"corpus": {"chunks": args.chunks, "acl": args.acl, "seed": args.seed}, "k": args.k, "runs": []}
+    try:
+        if not args.skip_load:
+            report["load"] = load_corpus(corpus)
+        with engine.connect() as conn:
+            report["table_bytes"] = conn.execute(text("SELECT pg_table_size('document_chunks')")).scalar()
+
+        for quantization in args.quantization:
+            index = rebuild_index(quantization)
+            multipliers = [1] if quantization == "none" else args.multiplier
+            for multiplier in multipliers:
+                run = {"quantization": quantization, **index,
+                       **asyncio.run(measure(queries, quantization, multiplier, args.k, args.ef_search))}
+                report["runs"].append(run)
+                lat = run["latency"]
+                print(f"{quantization:<8} x{multiplier:<3} index={index['index_bytes'] / 2**20:8.1f} MiB  "
+                      f"build={index['build_seconds']:6.1f}s  dense recall@{args.k}={run[f'dense_recall_at_{args.k}']:.3f}  "
+                      f"hybrid recall@{args.k}={run[f'hybrid_recall_at_{args.k}']:.3f}  "
+                      f"p50={lat['p50_ms']:6.2f}ms  p99={lat['p99_ms']:6.2f}ms")
+    finally:
+        with engine.connect() as conn:
+            ensure_vector_index(conn)
+            conn.commit()
+        if not args.keep:
+            cleanup(corpus.prefix)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+def str_list(value: str) -> List[str]:
+    return [v for v in value.split(",") if v]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--acl", choices=list(ACL_PROFILES), default="zipf")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--quantization", type=str_list, default=["none", "halfvec", "binary"])
+    parser.add_argument("--multiplier", type=int_list, default=[2, 4, 8], help="RESCORE_MULTIPLIER values")
+    parser.add_argument("--ef-search", type=int, help="hnsw.ef_search (raised to the candidate count when lower)")
+    parser.add_argument("--skip-load", action="store_true", help="reuse the corpus left by `benchmarks.suite --keep`")
+    parser.add_argument("--keep", action="store_true", help="leave the corpus in place")
+    parser.add_argument("--out", help="write results as JSON")
+    main(parser.parse_args())
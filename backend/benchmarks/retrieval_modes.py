@@ -0,0 +1,74 @@
+"""
+Compares HybridSearchService retrieval modes (sequential / parallel / fused)
+against whatever corpus is currently loaded in Postgres.
+
+    PYTHONPATH=backend python -m benchmarks.retrieval_modes --iterations 200 --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List
+
+from app.database import async_engine
+from app.search_service import HybridSearchService, SEARCH_MODES
+from benchmarks.common import latency_summary
+
+QUERIES = [
+    ("0x80040", ["group:everyone"]),
+    ("login page 500 error", ["group:everyone", "group:dev"]),
+    ("Project Secret X launch", ["group:everyone", "group:executives"]),
+    ("VPN handshake timeout router", ["group:everyone"]),
+]
+
+async def bench_mode(mode: str, iterations: int, concurrency: int, limit: int, ef_search=None) -> Dict[str, float]:
+    service = HybridSearchService(mode=mode)
+    latencies: List[float] = []
+
+    # Warm up the pool and the plan cache
+    for query, groups in QUERIES:
+        await service.search(query, groups, limit=limit, ef_search=ef_search)
+
+    async def worker(worker_id: int):
+        for i in range(worker_id, iterations, concurrency):
+            query, groups = QUERIES[i % len(QUERIES)]
+            start = time.perf_counter()
+            await service.search(query, groups, limit=limit, ef_search=ef_search)
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "mode": mode,
+        "ef_search": ef_search,
+        "iterations": len(latencies),
+        "qps": len(latencies) / elapsed if elapsed else 0.0,
+        **latency_summary(latencies),
+    }
+
+async def main(args):
+    results = []
+    try:
+        for mode in args.modes.split(","):
+            stats = await bench_mode(mode, args.iterations, args.concurrency, args.limit, args.ef_search)
+            results.append(stats)
+            print(
+                f"{stats['mode']:<10}  qps={stats['qps']:8.1f}  p50={stats['p50_ms']:6.2f}ms  "
+                f"p95={stats['p95_ms']:6.2f}ms  p99={stats['p99_ms']:6.2f}ms"
+            )
+    finally:
+        await async_engine.dispose()
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"concurrency": args.concurrency, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default=",".join(SEARCH_MODES))
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--ef-search", type=int, help="Per-request hnsw.ef_search")
+    parser.add_argument("--out", help="Write results as JSON to this path")
+    asyncio.run(main(parser.parse_args()))
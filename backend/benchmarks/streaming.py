@@ -0,0 +1,70 @@
+"""
+Time-to-first-token vs total latency for streamed chat completions.
+
+Measures, per request, when the first content delta arrives (TTFT) and when
+[DONE] arrives (total), at a given concurrency, against a running server:
+
+    PYTHONPATH=backend python -m benchmarks.streaming --requests 100 --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import List
+
+import httpx
+
+from benchmarks.common import latency_summary
+from benchmarks.concurrency import QUESTIONS
+
+async def timed_stream(client: httpx.AsyncClient, base_url: str, user: str, question: str):
+    payload = {
+        "model": "rag-agent",
+        "messages": [{"role": "user", "content": question}],
+        "user": user,
+        "stream": True,
+    }
+    start = time.perf_counter()
+    ttft = None
+    async with client.stream("POST", f"{base_url}/v1/chat/completions", json=payload) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            data = line[len("data: "):]
+            if data == "[DONE]":
+                break
+            if ttft is None and json.loads(data)["choices"][0]["delta"].get("content"):
+                ttft = time.perf_counter() - start
+    total = time.perf_counter() - start
+    return (ttft if ttft is not None else total), total
+
+async def main(args):
+    ttfts: List[float] = []
+    totals: List[float] = []
+
+    async def worker(worker_id: int):
+        for i in range(worker_id, args.requests, args.concurrency):
+            user, question = QUESTIONS[i % len(QUESTIONS)]
+            ttft, total = await timed_stream(client, args.base_url, user, question)
+            ttfts.append(ttft)
+            totals.append(total)
+
+    async with httpx.AsyncClient(timeout=60) as client:
+        await asyncio.gather(*(worker(w) for w in range(args.concurrency)))
+
+    results = {"ttft": latency_summary(ttfts), "total": latency_summary(totals), "requests": len(totals)}
+    for name in ("ttft", "total"):
+        stats = results[name]
+        print(f"{name:<6} p50={stats['p50_ms']:7.1f}ms  p95={stats['p95_ms']:7.1f}ms  p99={stats['p99_ms']:7.1f}ms")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--out", help="Write results as JSON to this path")
+    asyncio.run(main(parser.parse_args()))
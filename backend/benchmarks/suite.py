@@ -0,0 +1,304 @@
+"""
+Reproducible retrieval benchmark on a synthetic corpus.
+
+1. Generates a clustered corpus of --chunks chunks with an ACL profile
+   (benchmarks/corpus.py) and bulk-loads it with binary COPY. The ANN index is
+   dropped during the load and rebuilt afterwards, and load and index-build
+   throughput are reported.
+2. Runs HybridSearchService.search for --queries generated queries, each with
+   its own caller group set, at every --concurrency level and --ef-search value.
+   Reports latency percentiles and QPS.
+3. Computes recall@k against exact ground truth: the same search with index
+   scans disabled (exact distances), for the dense leg alone and for the fused
+   hybrid result.
+4. Optionally (--numpy-index DIR) exports the corpus into the in-process NumPy
+   backend and reports its agreement with exact Postgres results (dense and
+   hybrid overlap@k) and its latency/QPS at the same concurrency levels.
+5. Optionally (--ingest-docs) measures end-to-end ingestion throughput through
+   the streaming pipeline (split, embed with the mock model, diff, write).
+
+Results go to --out as JSON together with the corpus, index and search settings,
+so runs can be compared after index or query changes. Point it at a scratch
+database: it replaces the ANN index, and only its own BENCH-* rows are removed
+afterwards (--keep leaves them for the next run with --skip-load).
+
+    PYTHONPATH=backend python -m benchmarks.suite --chunks 100000 --acl zipf --queries 200 \\
+        --k 10 --concurrency 1,8,32 --ef-search 40,100 --out results/hnsw-100k.json
+"""
+from typing import Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from sqlalchemy import text
+
+from app import config
+from app.acl import acl_ids_for, resolve_principals
+from app.chunk_embedder import content_hash
+from app.chunk_writer import CopyChunkWriter, DocumentPlan
+from app.database import SessionLocal, engine, async_engine
+from app.embedding_cache import CachedEmbeddings, EmbeddingCache
+from app.models import DocumentChunk
+from app.retrieval_cache import RetrievalCache
+from app.schema import drop_vector_index, ensure_vector_index, vector_index_size, vector_index_spec
+from app.numpy_backend import NumpyBackend, export_postgres
+from app.search_service import HybridSearchService, PostgresBackend
+from benchmarks.common import latency_summary
+from benchmarks.corpus import ACL_PROFILES, SyntheticCorpus, synthetic_documents
+
+class QueryVectors(Embeddings):
+    """Returns the corpus' query vectors for the benchmark's query texts."""
+
+    def __init__(self, vectors: Dict[str, np.ndarray]):
+        self.vectors = vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.vectors[text]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.vectors[t] for t in texts]
+
+class ExactPostgresBackend(PostgresBackend):
+    """Ground truth: identical statements, but the planner may not use the ANN index."""
+
+    def __init__(self, mode: Optional[str] = None):
+        # Full vectors only: a quantized coarse pass would make the ground truth approximate
+        super().__init__(mode, quantization="none")
+
+    async def _apply_ann_params(self, session, ef_search, probes, k=0):
+        # HNSW/IVFFlat are plain index scans; GIN (keyword leg, ACL filter) uses bitmap scans and is unaffected
+        await session.execute(text("SELECT set_config('enable_indexscan', 'off', true)"))
+
+def make_service(backend, vectors: Dict[str, np.ndarray]):
+    service = HybridSearchService(backend=backend)
+    # Nothing cached: every query has to do the full work
+    service.embeddings = CachedEmbeddings(QueryVectors(vectors), EmbeddingCache(max_size=0))
+    service.cache = RetrievalCache(max_size=0)
+    return service
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def cleanup(prefix: str):
+    session = SessionLocal()
+    session.query(DocumentChunk).filter(DocumentChunk.source_id.like(f"{prefix}%")).delete(synchronize_session=False)
+    session.commit()
+    session.close()
+
+def load_corpus(corpus: SyntheticCorpus, plan_batch: int = 500) -> dict:
+    cleanup(corpus.prefix)
+    with engine.connect() as conn:
+        drop_vector_index(conn)
+        conn.commit()
+
+    session = SessionLocal()
+    principal_ids = resolve_principals(
+        session, {("group", g) for g in corpus.groups + ["group:everyone"]}
+    )
+    session.commit()
+    writer = CopyChunkWriter()
+    rows, started, plans = 0, time.perf_counter(), []
+    for source_id, chunks in corpus.documents():
+        plan = DocumentPlan(source_id=source_id)
+        for chunk in chunks:
+            chunk["content_hash"] = content_hash(chunk["content"])
+            chunk["acl_ids"] = acl_ids_for(chunk["metadata_"], principal_ids)
+            plan.inserts.append(chunk)
+        plans.append(plan)
+        if len(plans) >= plan_batch:
+            rows += writer.write(session, plans)["inserted"]
+            plans = []
+    if plans:
+        rows += writer.write(session, plans)["inserted"]
+    load_seconds = time.perf_counter() - started
+    session.close()
+
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        if config.VECTOR_INDEX_BUILD_MEMORY:
+            conn.execute(text("SELECT set_config('maintenance_work_mem', :v, false)"), {"v": config.VECTOR_INDEX_BUILD_MEMORY})
+        ensure_vector_index(conn, rebuild=True)
+        conn.execute(text("ANALYZE document_chunks"))
+        conn.commit()
+        index_bytes = vector_index_size(conn)
+        table_bytes = conn.execute(text("SELECT pg_table_size('document_chunks')")).scalar()
+    index_seconds = time.perf_counter() - started
+    return {
+        "rows": rows,
+        "load_seconds": load_seconds,
+        "load_rows_per_sec": rows / load_seconds if load_seconds else 0.0,
+        "copy_fell_back": not writer.copy_enabled,
+        "index_build_seconds": index_seconds,
+        "index_bytes": index_bytes,
+        "table_bytes": table_bytes,
+    }
+
+def measure_ingestion(n_docs: int) -> dict:
+    from app.ingestion import IngestionService
+    from app.pipeline import IngestionPipeline
+
+    prefix = "BENCH-INGEST-"
+    cleanup(prefix)
+    pipeline = IngestionPipeline(IngestionService())
+    started = time.perf_counter()
+    stats = pipeline.run(synthetic_documents(n_docs, prefix=prefix))
+    elapsed = time.perf_counter() - started
+    cleanup(prefix)
+    return {
+        "documents": stats["documents"],
+        "chunks": stats["inserted"],
+        "seconds": elapsed,
+        "documents_per_sec": stats["documents"] / elapsed if elapsed else 0.0,
+        "chunks_per_sec": stats["inserted"] / elapsed if elapsed else 0.0,
+        "stages": {name: s.as_dict() for name, s in pipeline.stage_stats.items()},
+    }
+
+async def dense_ids(service: HybridSearchService, vector, groups: List[str], k: int, ef_search=None) -> List[int]:
+    return [c.id for c in await service.backend.dense(vector, groups, k, ef_search)]
+
+def recall(found: List[int], truth: List[int]) -> float:
+    if not truth:
+        return 1.0
+    return len(set(found) & set(truth)) / len(truth)
+
+async def measure_recall(queries, ann: HybridSearchService, exact: HybridSearchService, k: int, ef_search) -> dict:
+    dense, hybrid, truth_sizes = [], [], []
+    for text_, vector, groups in queries:
+        truth_dense = await dense_ids(exact, vector, groups, k)
+        found_dense = await dense_ids(ann, vector, groups, k, ef_search)
+        truth_hybrid = [c.id for c in await exact._search(text_, groups, k, None, None)]
+        found_hybrid = [c.id for c in await ann._search(text_, groups, k, ef_search, None)]
+        dense.append(recall(found_dense, truth_dense))
+        hybrid.append(recall(found_hybrid, truth_hybrid))
+        truth_sizes.append(len(truth_dense))
+    return {
+        f"dense_recall_at_{k}": float(np.mean(dense)),
+        f"hybrid_recall_at_{k}": float(np.mean(hybrid)),
+        "dense_recall_min": float(np.min(dense)),
+        "mean_visible_results": float(np.mean(truth_sizes)),
+    }
+
+async def measure_latency(service: HybridSearchService, queries, k: int, concurrency: int, ef_search) -> dict:
+    latencies: List[float] = []
+
+    async def worker(worker_id: int):
+        for i in range(worker_id, len(queries), concurrency):
+            text_, _, groups = queries[i]
+            start = time.perf_counter()
+            await service.search(text_, groups, limit=k, ef_search=ef_search)
+            latencies.append(time.perf_counter() - start)
+
+    for text_, _, groups in queries[:min(10, len(queries))]:
+        await service.search(text_, groups, limit=k, ef_search=ef_search) # warm pool and plans
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {"concurrency": concurrency, "queries": len(latencies), "qps": len(latencies) / elapsed if elapsed else 0.0,
+            **latency_summary(latencies)}
+
+async def run_queries(args, corpus: SyntheticCorpus) -> List[dict]:
+    queries = corpus.queries(args.queries, seed=args.seed + 1)
+    vectors = {text_: vector for text_, vector, _ in queries}
+    ann = make_service(PostgresBackend(args.mode), vectors)
+    exact = make_service(ExactPostgresBackend(args.mode), vectors)
+    results = []
+    try:
+        for ef_search in args.ef_search or [None]:
+            entry = {"ef_search": ef_search, **await measure_recall(queries, ann, exact, args.k, ef_search), "latency": []}
+            for concurrency in args.concurrency:
+                entry["latency"].append(await measure_latency(ann, queries, args.k, concurrency, ef_search))
+            results.append(entry)
+            print(f"ef_search={ef_search}: dense recall@{args.k}={entry[f'dense_recall_at_{args.k}']:.3f} "
+                  f"hybrid recall@{args.k}={entry[f'hybrid_recall_at_{args.k}']:.3f}")
+            for lat in entry["latency"]:
+                print(f"  c={lat['concurrency']:<3} qps={lat['qps']:8.1f}  p50={lat['p50_ms']:6.2f}ms  "
+                      f"p95={lat['p95_ms']:6.2f}ms  p99={lat['p99_ms']:6.2f}ms")
+    finally:
+        await async_engine.dispose()
+    return results
+
+async def run_numpy(args, corpus: SyntheticCorpus) -> dict:
+    """Exports the corpus to --numpy-index and compares the NumPy backend with exact Postgres search."""
+    started = time.perf_counter()
+    with SessionLocal() as session:
+        export = export_postgres(session, args.numpy_index, [DocumentChunk.source_id.like(f"{corpus.prefix}%")])
+    export["seconds"] = time.perf_counter() - started
+    started = time.perf_counter()
+    backend = NumpyBackend.open(args.numpy_index)
+    export["open_seconds"] = time.perf_counter() - started
+
+    queries = corpus.queries(args.queries, seed=args.seed + 1)
+    vectors = {text_: vector for text_, vector, _ in queries}
+    local = make_service(backend, vectors)
+    exact = make_service(ExactPostgresBackend(args.mode), vectors)
+    try:
+        agreement = await measure_recall(queries, local, exact, args.k, None)
+        latency = [await measure_latency(local, queries, args.k, c, None) for c in args.concurrency]
+    finally:
+        await async_engine.dispose()
+    print(f"numpy: dense agreement@{args.k}={agreement[f'dense_recall_at_{args.k}']:.3f} "
+          f"hybrid agreement@{args.k}={agreement[f'hybrid_recall_at_{args.k}']:.3f}, opened in {export['open_seconds'] * 1000:.1f}ms")
+    for lat in latency:
+        print(f"  c={lat['concurrency']:<3} qps={lat['qps']:8.1f}  p50={lat['p50_ms']:6.2f}ms  p99={lat['p99_ms']:6.2f}ms")
+    return {"export": export, **agreement, "latency": latency}
+
+def main(args):
+    corpus = SyntheticCorpus(args.chunks, seed=args.seed, acl=args.acl)
+    report = {
+        "git": git_revision(),
+        "host": platform.node(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "corpus": {"chunks": args.chunks, "acl": args.acl, "seed": args.seed, "topics": corpus.topics, "groups": len(corpus.groups)},
+        "index": vector_index_spec(),
+        "search": {
+            "mode": args.mode, "k": args.k, "queries": args.queries, "rrf_k": config.RRF_K,
+            "quantization": config.VECTOR_QUANTIZATION, "rescore_multiplier": config.RESCORE_MULTIPLIER,
+        },
+    }
+    try:
+        if not args.skip_load:
+            report["load"] = load_corpus(corpus)
+            print(f"Loaded {report['load']['rows']} chunks at {report['load']['load_rows_per_sec']:.0f} rows/s, "
+                  f"index built in {report['load']['index_build_seconds']:.1f}s")
+        report["results"] = asyncio.run(run_queries(args, corpus))
+        if args.numpy_index:
+            report["numpy"] = asyncio.run(run_numpy(args, corpus))
+        if args.ingest_docs:
+            report["ingestion"] = measure_ingestion(args.ingest_docs)
+            print(f"Ingestion: {report['ingestion']['documents_per_sec']:.1f} docs/s, "
+                  f"{report['ingestion']['chunks_per_sec']:.1f} chunks/s")
+    finally:
+        if not args.keep:
+            cleanup(corpus.prefix)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+def int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=10000, help="corpus size (10k to 5M)")
+    parser.add_argument("--acl", choices=list(ACL_PROFILES), default="zipf")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--mode", default=config.SEARCH_MODE, help="Postgres search mode (sequential/parallel/fused)")
+    parser.add_argument("--concurrency", type=int_list, default=[1, 8])
+    parser.add_argument("--ef-search", type=int_list, help="hnsw.ef_search values to sweep")
+    parser.add_argument("--numpy-index", help="also export to this directory and compare the NumPy backend")
+    parser.add_argument("--ingest-docs", type=int, default=0, help="also measure pipeline ingestion of N documents")
+    parser.add_argument("--skip-load", action="store_true", help="reuse the corpus left by a previous --keep run")
+    parser.add_argument("--keep", action="store_true", help="leave the corpus in place")
+    parser.add_argument("--out", help="write results as JSON")
+    main(parser.parse_args())
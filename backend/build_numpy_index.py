@@ -0,0 +1,32 @@
+"""
+Exports document_chunks into the memory-mapped index served by
+RETRIEVAL_BACKEND=numpy (see app/numpy_backend.py). Re-run after ingestion;
+the new index replaces the old one when complete.
+
+    python build_numpy_index.py                         # all chunks -> NUMPY_INDEX_PATH
+    python build_numpy_index.py --out /srv/idx --source-prefix CONF-
+"""
+from app.database import SessionLocal
+from app.models import DocumentChunk
+from app.numpy_backend import export_postgres
+from app import config
+import argparse
+import json
+import logging
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=config.NUMPY_INDEX_PATH, help="index directory")
+    parser.add_argument("--source-prefix", help="only export chunks whose source_id starts with this (e.g. one tenant)")
+    args = parser.parse_args()
+
+    where = [DocumentChunk.source_id.like(f"{args.source_prefix}%")] if args.source_prefix else []
+    started = time.perf_counter()
+    with SessionLocal() as session:
+        report = export_postgres(session, args.out, where)
+    report["seconds"] = round(time.perf_counter() - started, 2)
+    print(json.dumps(report, indent=2))
@@ -1,12 +1,17 @@
 from app.database import engine, Base
-from app.models import DocumentChunk
+from app.models import DocumentChunk, PARTITIONED
+from app.schema import (
+    ensure_vector_index, ensure_search_vector, ensure_acl_ids, ensure_chunk_identity, ensure_chunk_scope,
+    ensure_partitions, partition_document_chunks, is_partitioned,
+)
 from sqlalchemy import text
+import argparse
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def init_db():
+def init_db(rebuild_vector_index: bool = False, partition: bool = False):
     logger.info("Creating tables...")
     try:
         # Create vector extension if it doesn't exist (requires superuser, usually 'postgres')
@@ -18,8 +23,35 @@ def init_db():
             
         Base.metadata.create_all(bind=engine)
         logger.info("Tables created successfully.")
+
+        with engine.connect() as conn:
+            # Upgrade tables created by older versions
+            ensure_search_vector(conn)
+            ensure_acl_ids(conn)
+            ensure_chunk_identity(conn)
+            ensure_chunk_scope(conn)
+            if partition:
+                # Rewrites the table; the ANN index is rebuilt below
+                partition_document_chunks(conn)
+            elif PARTITIONED and not is_partitioned(conn):
+                logger.warning("CHUNK_PARTITIONING is set but document_chunks isn't partitioned; run with --partition.")
+            ensure_partitions(conn)
+            # ANN index: created if missing, rebuilt if VECTOR_INDEX/HNSW_*/IVFFLAT_* changed
+            ensure_vector_index(conn, rebuild=rebuild_vector_index)
+            conn.commit()
     except Exception as e:
         logger.error(f"Error creating tables: {e}")
 
 if __name__ == "__main__":
-    init_db()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--rebuild-vector-index", action="store_true",
+        help="Rebuild the ANN index even if its config is unchanged (e.g. IVFFlat after a bulk load)"
+    )
+    parser.add_argument(
+        "--partition", action="store_true",
+        help="Move an existing document_chunks into the partitioned layout (CHUNK_PARTITIONING=true), "
+             "or the rows of sources added to CHUNK_PARTITION_SOURCES out of the default partition"
+    )
+    args = parser.parse_args()
+    init_db(rebuild_vector_index=args.rebuild_vector_index, partition=args.partition)
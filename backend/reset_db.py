@@ -1,5 +1,6 @@
 from app.database import engine, Base
 from app.models import DocumentChunk
+from app.schema import ensure_vector_index, ensure_partitions
 from sqlalchemy import text
 import logging
 
@@ -17,6 +18,11 @@ def reset_db():
             conn.commit()
             
         Base.metadata.create_all(bind=engine)
+
+        with engine.connect() as conn:
+            ensure_partitions(conn)
+            ensure_vector_index(conn)
+            conn.commit()
         logger.info("Tables created successfully.")
     except Exception as e:
         logger.error(f"Error creating tables: {e}")
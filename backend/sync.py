@@ -0,0 +1,32 @@
+"""
+Delta-sync worker: keeps the index in step with the Confluence spaces and Jira
+projects in SYNC_CONFLUENCE_SPACES / SYNC_JIRA_PROJECTS (see app/delta_sync.py).
+
+    python sync.py            # every SYNC_INTERVAL seconds until stopped
+    python sync.py --once     # a single run, e.g. from cron
+"""
+from app.delta_sync import SyncScheduler, sources_from_config
+import argparse
+import json
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true", help="run every source once and exit")
+    args = parser.parse_args()
+
+    sources = sources_from_config()
+    if not sources:
+        parser.error("no sources configured: set SYNC_CONFLUENCE_SPACES and/or SYNC_JIRA_PROJECTS")
+    scheduler = SyncScheduler(sources)
+    if args.once:
+        print(json.dumps(scheduler.run_once(), indent=2, default=str))
+    else:
+        logger.info(f"Syncing {[s.name for s in sources]} every {scheduler.interval:.0f}s")
+        try:
+            scheduler.run_forever()
+        except KeyboardInterrupt:
+            pass
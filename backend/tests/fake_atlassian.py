@@ -0,0 +1,169 @@
+"""
+Local stand-in for the Confluence and Jira REST APIs, serving only the endpoints
+and fields the loaders use, with real start/limit and startAt/maxResults paging.
+
+    with FakeAtlassian(pages=120, issues=75) as server:
+        SecureConfluenceLoader(server.url, "user", "key", space_groups=SPACE_GROUPS).lazy_load()
+"""
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import json
+import re
+import threading
+
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+# View permission of the fake spaces, as configured with CONFLUENCE_SPACE_GROUPS
+SPACE_GROUPS = {
+    "HR": ["group:hr", "group:executives"],
+    "ENG": ["group:confluence-users", "group:executives"],
+}
+
+def _stamp(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+def make_page(n: int) -> dict:
+    restricted = n % 5 == 0
+    return {
+        "id": str(5000 + n),
+        "type": "page",
+        "title": f"Fake page {n}",
+        "space": {"key": "ENG" if n % 2 else "HR"},
+        "body": {"storage": {"value": f"<p>Fake page {n} body about topic {n % 7}.</p><p>More &amp; more text.</p>"}},
+        "restrictions": {"read": {"restrictions": {
+            "group": {"results": [{"name": "executives"}] if restricted else []},
+            "user": {"results": []},
+        }}},
+        "version": {"number": 1, "when": _stamp(EPOCH + timedelta(hours=n))},
+        "_links": {"webui": f"/spaces/ENG/pages/{5000 + n}"},
+    }
+
+def make_issue(n: int) -> dict:
+    return {
+        "key": f"FAKE-{n}",
+        "fields": {
+            "summary": f"Fake issue {n}",
+            "description": None if n % 3 == 0 else f"Description of fake issue {n}",
+            "status": {"name": "Done" if n % 2 else "Open"},
+            "project": {"key": "FAKE"},
+            "security": {"id": "10000", "name": "hr-administrators"} if n % 10 == 0 else None,
+            "updated": (EPOCH + timedelta(hours=n)).strftime("%Y-%m-%dT%H:%M:%S.000+0000"),
+        },
+    }
+
+class FakeAtlassian:
+    def __init__(self, pages: int = 0, issues: int = 0):
+        self.pages = [make_page(n) for n in range(pages)]
+        self.parents = {} # page id -> parent page id
+        self.issues = [make_issue(n) for n in range(issues)]
+        self.requests = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+                fake.requests.append((parsed.path, params))
+                page_id = re.fullmatch(r"/rest/api/content/(\d+)", parsed.path)
+                if parsed.path == "/rest/api/content":
+                    body = fake._content(params)
+                elif parsed.path == "/rest/api/content/search":
+                    body = fake._content(params, fake._cql(params["cql"]))
+                elif page_id:
+                    body = next((p for p in fake.pages if p["id"] == page_id.group(1)), None)
+                    if body is None:
+                        self.send_error(404)
+                        return
+                    body = fake._expand(body)
+                elif parsed.path == "/rest/api/2/search":
+                    body = fake._search(params)
+                else:
+                    self.send_error(404)
+                    return
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    # Upstream changes, for sync tests
+
+    def edit_page(self, n: int, body: str, when: datetime):
+        page = self.pages[n]
+        page["body"]["storage"]["value"] = f"<p>{body}</p>"
+        page["version"] = {"number": page["version"]["number"] + 1, "when": _stamp(when)}
+
+    def restrict_page(self, n: int, groups):
+        # Restriction changes don't create a new page version
+        self.pages[n]["restrictions"]["read"]["restrictions"]["group"]["results"] = [{"name": g} for g in groups]
+
+    def move_page(self, n: int, space: str, when: datetime):
+        # Moving a page to another space creates a new version
+        page = self.pages[n]
+        page["space"] = {"key": space}
+        page["version"] = {"number": page["version"]["number"] + 1, "when": _stamp(when)}
+
+    def set_parent(self, n: int, parent: int):
+        self.parents[str(5000 + n)] = str(5000 + parent)
+
+    def delete_page(self, n: int):
+        self.pages = [p for p in self.pages if p["id"] != str(5000 + n)]
+
+    def _cql(self, cql: str):
+        space = re.search(r'space = "([^"]+)"', cql)
+        since = re.search(r'lastmodified >= "([^"]+)"', cql)
+        since = datetime.strptime(since.group(1), "%Y-%m-%d %H:%M").replace(tzinfo=timezone.utc) if since else None
+        return [
+            p for p in self.pages
+            if (not space or p["space"]["key"] == space.group(1))
+            and (not since or datetime.strptime(p["version"]["when"], "%Y-%m-%dT%H:%M:%S.000Z").replace(tzinfo=timezone.utc) >= since)
+        ]
+
+    def _expand(self, page: dict) -> dict:
+        # ancestors (root first) with their read restrictions, as expand=ancestors.restrictions... returns them
+        by_id = {p["id"]: p for p in self.pages}
+        ancestors, parent = [], self.parents.get(page["id"])
+        while parent in by_id:
+            ancestors.insert(0, {"id": parent, "title": by_id[parent]["title"], "restrictions": by_id[parent]["restrictions"]})
+            parent = self.parents.get(parent)
+        return {**page, "ancestors": ancestors}
+
+    def _content(self, params: dict, pages: list = None) -> dict:
+        pages = self.pages if pages is None else pages
+        if "spaceKey" in params:
+            pages = [p for p in pages if p["space"]["key"] == params["spaceKey"]]
+        start, limit = int(params.get("start", 0)), int(params.get("limit", 25))
+        results = [self._expand(p) for p in pages[start:start + limit]]
+        links = {"base": self.url}
+        if start + limit < len(pages):
+            links["next"] = f"/rest/api/content?start={start + limit}&limit={limit}"
+        return {"results": results, "start": start, "limit": limit, "size": len(results), "_links": links}
+
+    def _search(self, params: dict) -> dict:
+        issues = self.issues
+        keys = re.search(r"key in \(([^)]*)\)", params.get("jql", ""))
+        if keys:
+            wanted = {k.strip() for k in keys.group(1).split(",")}
+            issues = [i for i in issues if i["key"] in wanted]
+        since = re.search(r'updated >= "([^"]+)"', params.get("jql", ""))
+        if since:
+            since = datetime.strptime(since.group(1), "%Y/%m/%d %H:%M").strftime("%Y-%m-%dT%H:%M")
+            issues = [i for i in issues if i["fields"]["updated"][:16] >= since]
+        start, limit = int(params.get("startAt", 0)), int(params.get("maxResults", 50))
+        return {"startAt": start, "maxResults": limit, "total": len(issues), "issues": issues[start:start + limit]}
+
+    def __enter__(self) -> "FakeAtlassian":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -66,3 +66,27 @@ def test_acl_filtering_query():
     assert len(secret_docs_admin) > 0
     
     session.close()
+
+@pytest.mark.parametrize("user_groups", [
+    ["group:interns"],
+    ["group:executives"],
+    ["group:confluence-users"],
+    ["group:rd-team", "group:confluence-users"],
+    [],
+])
+def test_encoded_acl_matches_jsonb_filter(user_groups):
+    """
+    The integer-encoded acl_ids filter must return exactly the rows the
+    original JSONB `?|` filter returns, for any group set.
+    """
+    from app.acl import group_filter
+
+    session = SessionLocal()
+    jsonb_ids = {
+        r.id for r in session.query(DocumentChunk).filter(
+            text("metadata->'allowed_groups' ?| :groups")
+        ).params(groups=user_groups)
+    }
+    encoded_ids = {r.id for r in session.query(DocumentChunk).filter(group_filter(user_groups))}
+    assert encoded_ids == jsonb_ids
+    session.close()
@@ -0,0 +1,105 @@
+import numpy as np
+from app.answer_cache import AnswerCache
+from app.retrieval_backend import RetrievedChunk, SearchScope, SourceVisibility
+
+def chunk(id, source_id):
+    return RetrievedChunk(id=id, source_id=source_id, chunk_index=0, content=f"chunk {id}")
+
+def vectors(n, dim=32, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+def paraphrase(vector, seed=1):
+    # ~0.99 cosine similarity to `vector`
+    noise = np.random.default_rng(seed).standard_normal(len(vector)).astype(np.float32)
+    return vector + 0.1 * np.linalg.norm(vector) / np.sqrt(len(vector)) * noise
+
+def test_paraphrase_hits_only_within_the_same_group_set_and_scope():
+    cache = AnswerCache(max_size=10, threshold=0.95)
+    cache.sync(1, set())
+    v = vectors(2)
+    assert cache.put(["group:everyone", "group:dev"], v[0], "vpn error?", "Reboot.", [chunk(1, "WIKI-100")], 1)
+
+    hit = cache.get(["group:dev", "group:everyone"], paraphrase(v[0]))
+    assert hit.answer == "Reboot." and hit.source_ids == {"WIKI-100"} and 0.95 <= hit.similarity < 1
+    assert cache.get(["group:everyone"], v[0]) is None
+    assert cache.get(["group:everyone", "group:dev"], v[1]) is None
+    assert cache.get(["group:everyone", "group:dev"], v[0], SearchScope("jira")) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 3
+
+def test_changed_sources_evict_only_their_entries():
+    cache = AnswerCache(max_size=10)
+    cache.sync(5, set())
+    v = vectors(3)
+    groups = ["group:everyone"]
+    cache.put(groups, v[0], "a", "A", [chunk(1, "WIKI-1"), chunk(2, "WIKI-2")], 5)
+    cache.put(groups, v[1], "b", "B", [chunk(3, "WIKI-3")], 5)
+    cache.put(["group:dev"], v[2], "c", "C", [chunk(4, "WIKI-2")], 5)
+
+    # WIKI-2 is now readable by neither group set, JIRA-9 was deleted
+    assert cache.sync(7, {"WIKI-2", "JIRA-9"}, {"WIKI-2": SourceVisibility("confluence", "HR", frozenset({"group:hr"}))}) == 2
+    assert cache.get(groups, v[0]) is None
+    assert cache.get(["group:dev"], v[2]) is None
+    assert cache.get(groups, v[1]).answer == "B"
+
+    # An answer computed before the sync is not stored; an unknown change set clears everything
+    assert not cache.put(groups, v[0], "a", "A", [chunk(1, "WIKI-1")], 5)
+    assert cache.sync(8, None) == 1
+    assert len(cache) == 0
+
+def test_new_source_evicts_the_partitions_that_can_see_it():
+    cache = AnswerCache(max_size=10)
+    cache.sync(1, set())
+    v = vectors(4)
+    everyone, dev = ["group:everyone"], ["group:dev"]
+    cache.put(everyone, v[0], "a", "Not found.", [chunk(1, "WIKI-1")], 1)
+    cache.put(everyone, v[1], "b", "B", [chunk(2, "WIKI-2")], 1, SearchScope("confluence", ("ENG",)))
+    cache.put(everyone, v[2], "c", "C", [chunk(3, "WIKI-3")], 1, SearchScope("jira"))
+    cache.put(dev, v[3], "d", "D", [chunk(4, "WIKI-4")], 1)
+
+    # A new ENG page for everyone: unscoped and ENG-scoped everyone answers may be outdated
+    new_page = SourceVisibility("confluence", "ENG", frozenset({"group:everyone", "group:hr"}))
+    assert cache.sync(2, {"WIKI-9"}, {"WIKI-9": new_page}) == 2
+    assert cache.get(everyone, v[0]) is None
+    assert cache.get(everyone, v[1], SearchScope("confluence", ("ENG",))) is None
+    assert cache.get(everyone, v[2], SearchScope("jira")).answer == "C"
+    assert cache.get(dev, v[3]).answer == "D"
+
+    # Changes the backend can't place evict everything
+    assert cache.sync(3, {"WIKI-10"}, None) == 2
+    assert len(cache) == 0
+
+def test_bounded_lru_and_uncitable_answers():
+    cache = AnswerCache(max_size=3)
+    cache.sync(1, set())
+    v = vectors(5)
+    groups = ["group:everyone"]
+    for i in range(3):
+        cache.put(groups, v[i], str(i), str(i), [chunk(i, f"S-{i}")], 1)
+    cache.get(groups, v[0])
+    cache.put(groups, v[3], "3", "3", [chunk(3, "S-3")], 1)
+
+    # 1 was least recently used; the swap-removal kept every other row findable
+    assert cache.get(groups, v[1]) is None
+    assert [cache.get(groups, v[i]).answer for i in (0, 2, 3)] == ["0", "2", "3"]
+    assert len(cache) == 3
+
+    # Nothing could ever evict these
+    assert not cache.put(groups, v[4], "4", "4", [], 1)
+    assert not cache.put(groups, v[4], "4", "4", [chunk(9, None)], 1)
+
+def test_expired_best_match_falls_back_to_a_live_one():
+    # Both entries clear the threshold for the query (0.95 and 0.93) but not for each
+    # other (0.88), so the second put doesn't replace the first
+    cache = AnswerCache(max_size=10, threshold=0.9)
+    cache.sync(1, set())
+    query, old, new = np.eye(3, 32, dtype=np.float32)
+    groups = ["group:everyone"]
+    cache.put(groups, query + 0.329 * old, "vpn error?", "Old.", [chunk(1, "WIKI-100")], 1)
+    cache.put(groups, query + 0.395 * new, "vpn error code?", "New.", [chunk(2, "WIKI-101")], 1)
+    assert len(cache) == 2
+    for entry in cache._entries.values():
+        if entry.answer.answer == "Old.":
+            entry.expires_at = 0
+
+    assert cache.get(groups, query).answer == "New."
+    assert len(cache) == 1 and cache.stats()["hits"] == 1
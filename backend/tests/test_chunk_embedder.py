@@ -0,0 +1,62 @@
+import threading
+import time
+from langchain_core.embeddings import Embeddings
+from app.chunk_embedder import ChunkEmbedder
+
+class RecordingEmbeddings(Embeddings):
+    def __init__(self, fail_first=0, delay=0.0):
+        self.batches = []
+        self.fail_first = fail_first
+        self.delay = delay
+        self.max_concurrent = 0
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            if self.fail_first:
+                self.fail_first -= 1
+                raise RuntimeError("429 Too Many Requests")
+            self._active += 1
+            self.max_concurrent = max(self.max_concurrent, self._active)
+            self.batches.append(list(texts))
+        time.sleep(self.delay)
+        with self._lock:
+            self._active -= 1
+        return [[float(len(t))] for t in texts]
+
+    def embed_query(self, text):
+        return [float(len(text))]
+
+def test_dedupes_identical_chunks_and_keeps_order():
+    inner = RecordingEmbeddings()
+    embedder = ChunkEmbedder(inner, batch_size=10, batch_tokens=10_000, concurrency=2)
+
+    texts = ["alpha", "beta", "alpha", "gamma!", "beta"]
+    vectors = embedder.embed(texts)
+
+    assert vectors == [[5.0], [4.0], [5.0], [6.0], [4.0]]
+    assert sorted(t for b in inner.batches for t in b) == ["alpha", "beta", "gamma!"]
+    assert embedder.stats()["duplicates_skipped"] == 2
+
+def test_batches_bounded_by_size_and_tokens():
+    embedder = ChunkEmbedder(RecordingEmbeddings(), batch_size=3, batch_tokens=30, concurrency=1)
+
+    by_size = list(embedder.batches([f"t{i}" for i in range(7)]))
+    assert [len(b) for b in by_size] == [3, 3, 1]
+
+    # each 40-char text is ~11 estimated tokens, so only two fit under 30
+    by_tokens = list(embedder.batches(["x" * 40] * 5))
+    assert [len(b) for b in by_tokens] == [2, 2, 1]
+
+def test_runs_batches_concurrently():
+    inner = RecordingEmbeddings(delay=0.05)
+    embedder = ChunkEmbedder(inner, batch_size=1, batch_tokens=10_000, concurrency=4)
+    embedder.embed([f"text {i}" for i in range(8)])
+    assert inner.max_concurrent > 1
+    assert embedder.stats()["batches_done"] == 8
+
+def test_retries_failed_batches():
+    inner = RecordingEmbeddings(fail_first=2)
+    embedder = ChunkEmbedder(inner, batch_size=10, batch_tokens=10_000, concurrency=1, max_retries=3, retry_backoff=0.001)
+    assert embedder.embed(["a", "bb"]) == [[1.0], [2.0]]
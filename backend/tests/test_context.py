@@ -0,0 +1,95 @@
+import asyncio
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from app.context import ContextBuilder, build_passages, merge_chunks, overlap_length
+from app.ingestion import CHUNK_OVERLAP
+from app.retrieval_backend import RetrievalBackend, RetrievedChunk
+
+DOC = " ".join(
+    "alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu nu xi omicron pi rho sigma tau upsilon".split() * 3
+)
+
+def split(source_id: str, text: str, size: int = 100):
+    """The ingestion splitter (same overlap), with small chunks."""
+    splitter = RecursiveCharacterTextSplitter(chunk_size=size, chunk_overlap=CHUNK_OVERLAP)
+    return [
+        RetrievedChunk(id=hash((source_id, index)), source_id=source_id, chunk_index=index,
+                       content=content, title=f"Doc {source_id}")
+        for index, content in enumerate(splitter.split_text(text))
+    ]
+
+class FakeBackend(RetrievalBackend):
+    def __init__(self, chunks, visible=("group:everyone",)):
+        self.chunks = {(c.source_id, c.chunk_index): c for c in chunks}
+        self.visible = set(visible)
+        self.calls = []
+
+    async def fetch_chunks(self, keys, allowed_groups):
+        self.calls.append((list(keys), list(allowed_groups)))
+        if not self.visible & set(allowed_groups):
+            return []
+        return [self.chunks[k] for k in keys if k in self.chunks]
+
+def words(text: str) -> int:
+    return len(text.split())
+
+def test_merge_chunks_cuts_repeated_overlap():
+    chunks = split("A", DOC)
+    assert len(chunks) > 2
+    assert merge_chunks(chunks) == DOC
+    assert merge_chunks(chunks[1:3]) == DOC[51:193]
+
+def test_coincidental_overlap_is_not_cut():
+    assert overlap_length("Restart the services", "so the cache is rebuilt.") == 0
+    chunks = [RetrievedChunk(id=i, source_id="A", chunk_index=i, content=c)
+              for i, c in enumerate(["Restart the services", "so the cache is rebuilt."])]
+    assert merge_chunks(chunks) == "Restart the services\nso the cache is rebuilt."
+    # Whole words, but too short to be the splitter's repeat
+    assert overlap_length("read the docs", "docs team owns this") == 0
+
+def test_build_passages_groups_consecutive_chunks_best_first():
+    a, b = split("A", DOC), split("B", DOC)
+    for chunk, score in ((a[0], 0.1), (a[1], 0.3), (a[4], 0.2), (b[2], 0.5)):
+        chunk.score = score
+
+    passages = build_passages([a[0], a[1], a[4], b[2]], neighbours=[b[1], b[3], a[3]])
+
+    assert [(p.source_id, [c.chunk_index for c in p.chunks], p.hits) for p in passages] == [
+        ("B", [1, 2, 3], [2]), ("A", [0, 1], [0, 1]), ("A", [3, 4], [4]),
+    ]
+    assert [p.score for p in passages] == [0.5, 0.3, 0.2]
+
+def test_context_fetches_neighbours_once_and_respects_budget():
+    a, b = split("A", DOC), split("B", DOC.upper())
+    backend = FakeBackend(a + b)
+    hits = [a[2], a[3], b[1]]
+    for chunk, score in zip(hits, (0.3, 0.2, 0.1)):
+        chunk.score = score
+
+    context = asyncio.run(ContextBuilder(token_budget=1000, neighbours=1, count_tokens=words)
+                          .build(hits, ["group:everyone"], backend))
+    assert backend.calls == [([("A", 1), ("A", 4), ("B", 0), ("B", 2)], ["group:everyone"])]
+    assert merge_chunks(a[1:5]) in context.text
+    assert [p.source_id for p in context.passages] == ["A", "B"]
+    assert context.tokens_used == words(context.text) <= 1000
+
+    # The overlap is removed, so the hits alone already cost less than their verbatim join
+    alone = asyncio.run(ContextBuilder(token_budget=1000, neighbours=0, count_tokens=words)
+                        .build(hits, ["group:everyone"], backend))
+    assert len(backend.calls) == 1
+    assert alone.tokens_saved > 0
+
+    # Over budget: the second passage is dropped and the first keeps only the hits
+    tight = ContextBuilder(token_budget=words(a[2].content + a[3].content) + 4, neighbours=1, count_tokens=words)
+    context = asyncio.run(tight.build(hits, ["group:everyone"], backend))
+    assert [p.source_id for p in context.passages] == ["A"]
+    assert context.text.endswith(merge_chunks(a[2:4]))
+    assert context.tokens_used <= tight.token_budget
+
+def test_neighbours_follow_the_callers_acl():
+    a = split("A", DOC)
+    backend = FakeBackend(a, visible=("group:dev",))
+    context = asyncio.run(ContextBuilder(token_budget=1000, neighbours=2, count_tokens=words)
+                          .build([a[2]], ["group:everyone"], backend))
+    assert backend.calls[0][1] == ["group:everyone"]
+    assert context.text.endswith(a[2].content)
+    assert [c.chunk_index for c in context.passages[0].chunks] == [2]
@@ -0,0 +1,97 @@
+from datetime import datetime, timezone
+import pytest
+from app.database import SessionLocal
+from app.delta_sync import DeltaSync, ConfluenceSpaceSync
+from app.ingestion import IngestionService
+from app.loaders import SecureConfluenceLoader
+from app.models import DocumentChunk, SyncState
+from tests.fake_atlassian import FakeAtlassian, SPACE_GROUPS
+
+def cleanup():
+    session = SessionLocal()
+    session.query(DocumentChunk).filter(DocumentChunk.source_id.like("50%")).delete(synchronize_session=False)
+    session.query(SyncState).filter(SyncState.source.in_(["confluence:HR", "confluence:ENG"])).delete()
+    session.commit()
+    session.close()
+
+def stored():
+    session = SessionLocal()
+    rows = session.query(DocumentChunk).filter(DocumentChunk.source_id.like("50%"), DocumentChunk.chunk_index == 0).all()
+    session.close()
+    return {r.source_id: r for r in rows}
+
+@pytest.fixture(autouse=True)
+def clean():
+    cleanup()
+    yield
+    cleanup()
+
+def test_delta_sync_applies_edits_permission_changes_and_deletions():
+    with FakeAtlassian(pages=8) as server:
+        source = ConfluenceSpaceSync(SecureConfluenceLoader(server.url, "user", "key", space_groups=SPACE_GROUPS), "HR")
+        sync = DeltaSync()
+
+        first = sync.sync(source)
+        assert first["full"] and first["inserted"] == 4
+        before = stored()
+        assert set(before) == {"5000", "5002", "5004", "5006"}
+
+        server.edit_page(2, "Rewritten handbook section", when=datetime(2024, 3, 1, tzinfo=timezone.utc))
+        server.restrict_page(4, ["hr"])
+        server.delete_page(6)
+        second = sync.sync(source)
+
+    after = stored()
+    assert not second["full"]
+    assert set(after) == {"5000", "5002", "5004"}
+    assert after["5002"].content == "Rewritten handbook section"
+    assert after["5004"].metadata_["allowed_groups"] == ["group:hr"]
+    assert after["5004"].id == before["5004"].id # updated in place, not re-inserted
+    assert second["removed"] == 1 and second["refetched"] == 1
+
+    session = SessionLocal()
+    state = session.get(SyncState, "confluence:HR")
+    assert state.runs == 2 and state.cursor == datetime(2024, 3, 1, tzinfo=timezone.utc)
+    session.close()
+
+def test_reconcile_keeps_a_page_that_moved_to_another_synced_space():
+    with FakeAtlassian(pages=6) as server:
+        loader = SecureConfluenceLoader(server.url, "user", "key", space_groups=SPACE_GROUPS)
+        hr, eng = ConfluenceSpaceSync(loader, "HR"), ConfluenceSpaceSync(loader, "ENG")
+        DeltaSync().sync(hr)
+        DeltaSync().sync(eng)
+        assert stored()["5002"].scope_key == "HR"
+
+        server.move_page(2, "ENG", when=datetime(2024, 3, 1, tzinfo=timezone.utc))
+
+        class RacingService(IngestionService):
+            def delete_sources(self, source_ids, where=()):
+                # ENG ingests the moved page between HR's listing and HR's delete
+                DeltaSync().sync(eng)
+                return super().delete_sources(source_ids, where)
+
+        stats = DeltaSync(RacingService).sync(hr)
+
+    assert stats["removed"] == 1
+    moved = stored()["5002"]
+    assert (moved.source, moved.scope_key) == ("confluence", "ENG")
+    assert moved.metadata_["space_key"] == "ENG"
+
+def test_reconcile_refuses_to_delete_on_a_short_listing():
+    with FakeAtlassian(pages=8) as server:
+        source = ConfluenceSpaceSync(SecureConfluenceLoader(server.url, "user", "key", space_groups=SPACE_GROUPS), "HR")
+        sync = DeltaSync()
+        sync.sync(source)
+
+        # A listing that came back short (paging cut off, API hiccup) isn't evidence of deletions
+        server.delete_page(2)
+        server.delete_page(4)
+        server.delete_page(6)
+        short = sync.sync(source)
+        assert short["removed"] == 0 and short["removals_refused"] == 3
+        assert set(stored()) == {"5000", "5002", "5004", "5006"}
+
+        server.pages = []
+        assert sync.sync(source)["removals_refused"] == 4
+
+    assert set(stored()) == {"5000", "5002", "5004", "5006"}
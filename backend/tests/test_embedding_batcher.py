@@ -0,0 +1,60 @@
+import asyncio
+import time
+from typing import List
+from langchain_core.embeddings import Embeddings
+from app.embedding_batcher import BatchingEmbeddings
+from app.metrics import QUERY_EMBED_BATCH_SIZE
+
+class RecordingEmbeddings(Embeddings):
+    model = "recording"
+
+    def __init__(self, fail: bool = False):
+        self.calls: List[List[str]] = []
+        self.fail = fail
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        if self.fail:
+            raise RuntimeError("endpoint down")
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+def test_concurrent_queries_share_one_call():
+    inner = RecordingEmbeddings()
+    batcher = BatchingEmbeddings(inner, max_batch=8, max_wait_ms=50)
+    before = QUERY_EMBED_BATCH_SIZE.count()
+
+    async def ask():
+        return await asyncio.gather(*(batcher.aembed_query(t) for t in ["a", "bb", "a", "ccc"]))
+
+    assert asyncio.run(ask()) == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0], [3.0, 1.0]]
+    assert inner.calls == [["a", "bb", "ccc"]]  # deduplicated
+    assert QUERY_EMBED_BATCH_SIZE.count() == before + 1
+
+def test_full_batch_is_sent_without_waiting():
+    inner = RecordingEmbeddings()
+    batcher = BatchingEmbeddings(inner, max_batch=3, max_wait_ms=10_000)
+
+    async def ask(n):
+        started = time.perf_counter()
+        await asyncio.gather(*(batcher.aembed_query(str(i)) for i in range(n)))
+        return time.perf_counter() - started
+
+    assert asyncio.run(ask(6)) < 5
+    # Queue state doesn't leak into the next event loop
+    assert asyncio.run(ask(3)) < 5
+    assert [len(c) for c in inner.calls] == [3, 3, 3]
+
+def test_errors_reach_every_waiter_and_batch_size_one_disables():
+    batcher = BatchingEmbeddings(RecordingEmbeddings(fail=True), max_batch=4, max_wait_ms=1)
+
+    async def ask():
+        return await asyncio.gather(*(batcher.aembed_query(t) for t in "xy"), return_exceptions=True)
+
+    assert [str(e) for e in asyncio.run(ask())] == ["endpoint down", "endpoint down"]
+
+    inner = RecordingEmbeddings()
+    assert asyncio.run(BatchingEmbeddings(inner, max_batch=1).aembed_query("q")) == [1.0, 1.0]
+    assert inner.calls == [["q"]]
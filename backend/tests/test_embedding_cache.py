@@ -0,0 +1,61 @@
+import asyncio
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from app.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+class CountingEmbeddings(Embeddings):
+    model = "counting"
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        return [float(len(text)), float(self.calls)]
+
+def test_query_embeddings_are_cached_by_normalized_text():
+    inner = CountingEmbeddings()
+    embeddings = CachedEmbeddings(inner, EmbeddingCache(max_size=10, ttl_seconds=60))
+
+    first = embeddings.embed_query("How to fix login error?")
+    again = embeddings.embed_query("  how to FIX   login error?")
+    assert inner.calls == 1
+    assert first.dtype == np.float32
+    assert np.array_equal(first, again)
+
+    stats = embeddings.cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+def test_async_path_shares_the_cache():
+    inner = CountingEmbeddings()
+    embeddings = CachedEmbeddings(inner, EmbeddingCache(max_size=10, ttl_seconds=60))
+
+    embeddings.embed_query("vpn error")
+    asyncio.run(embeddings.aembed_query("VPN error"))
+    assert inner.calls == 1
+
+def test_lru_and_ttl_eviction():
+    cache = EmbeddingCache(max_size=2, ttl_seconds=60)
+    cache.put("a", [1.0])
+    cache.put("b", [2.0])
+    cache.get("a")            # a is now most recently used
+    cache.put("c", [3.0])     # evicts b
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+
+    expired = EmbeddingCache(max_size=2, ttl_seconds=0)
+    expired.put("a", [1.0])
+    assert expired.get("a") is None
+
+def test_cache_is_keyed_by_model():
+    cache = EmbeddingCache(max_size=10, ttl_seconds=60)
+    a = CachedEmbeddings(CountingEmbeddings(), cache, model_id="model-a")
+    b_inner = CountingEmbeddings()
+    b = CachedEmbeddings(b_inner, cache, model_id="model-b")
+
+    a.embed_query("same question")
+    b.embed_query("same question")
+    assert b_inner.calls == 1
@@ -0,0 +1,165 @@
+import pytest
+from app.ingestion import IngestionService
+from app.database import SessionLocal
+from app.models import DocumentChunk
+from langchain_core.documents import Document
+
+SOURCE_ID = "TEST-INGEST-1"
+
+def make_doc(paragraphs, groups=("group:everyone",)):
+    # Paragraphs of ~300 chars so the 500-char splitter yields one chunk per paragraph
+    return Document(
+        page_content="\n\n".join(paragraphs),
+        metadata={"source_id": SOURCE_ID, "title": "Ingestion test", "allowed_groups": list(groups)}
+    )
+
+def paragraph(word):
+    return " ".join([word] * 60)
+
+def stored_chunks():
+    session = SessionLocal()
+    rows = session.query(DocumentChunk).filter(DocumentChunk.source_id == SOURCE_ID).order_by(DocumentChunk.chunk_index).all()
+    session.close()
+    return rows
+
+@pytest.fixture(autouse=True)
+def clean():
+    session = SessionLocal()
+    session.query(DocumentChunk).filter(DocumentChunk.source_id == SOURCE_ID).delete()
+    session.commit()
+    session.close()
+    yield
+
+def test_reingesting_same_document_is_a_noop():
+    doc = make_doc([paragraph("alpha"), paragraph("beta"), paragraph("gamma")])
+    first = IngestionService().process_documents([doc])
+    assert first["inserted"] == 3
+    before = [(c.id, c.content_hash) for c in stored_chunks()]
+
+    second = IngestionService().process_documents([doc])
+    assert second["inserted"] == 0 and second["updated"] == 0
+    assert second["unchanged"] == 3
+    assert [(c.id, c.content_hash) for c in stored_chunks()] == before
+
+def test_changed_chunk_updated_in_place_and_tail_deleted():
+    IngestionService().process_documents([make_doc([paragraph("alpha"), paragraph("beta"), paragraph("gamma")])])
+    ids = [c.id for c in stored_chunks()]
+
+    stats = IngestionService().process_documents([make_doc([paragraph("alpha"), paragraph("delta")])])
+    assert stats == {"documents": 1, "inserted": 0, "updated": 1, "unchanged": 1, "deleted": 1}
+
+    chunks = stored_chunks()
+    assert [c.id for c in chunks] == ids[:2]
+    assert "delta" in chunks[1].content
+
+def test_acl_only_change_updates_metadata_without_reembedding():
+    IngestionService().process_documents([make_doc([paragraph("alpha")])])
+    before = stored_chunks()[0]
+
+    service = IngestionService()
+    stats = service.process_documents([make_doc([paragraph("alpha")], groups=("group:executives",))])
+    assert stats["updated"] == 1
+    assert service.embedder.stats()["chunks_embedded"] == 0
+
+    after = stored_chunks()[0]
+    assert after.id == before.id
+    assert after.metadata_["allowed_groups"] == ["group:executives"]
+    assert after.acl_ids != before.acl_ids
+
+def in_space(doc, space_key):
+    doc.metadata.update(source="confluence", space_key=space_key)
+    return doc
+
+def test_document_moved_to_another_space_keeps_one_copy_per_chunk():
+    doc = make_doc([paragraph("alpha"), paragraph("beta")])
+    IngestionService().process_documents([in_space(doc, "HR")])
+    ids = [c.id for c in stored_chunks()]
+
+    stats = IngestionService().process_documents([in_space(doc, "ENG")])
+    assert stats["updated"] == 2 and stats["inserted"] == 0
+    chunks = stored_chunks()
+    assert [c.id for c in chunks] == ids  # moved in place (to the ENG partition when partitioned)
+    assert [(c.chunk_index, c.scope_key) for c in chunks] == [(0, "ENG"), (1, "ENG")]
+
+def test_copy_left_in_the_old_scope_is_deleted():
+    # Only a partitioned table lets a document be stored once per (source, scope_key)
+    from app.database import engine
+    from app.schema import is_partitioned
+    with engine.connect() as conn:
+        if not is_partitioned(conn):
+            pytest.skip("document_chunks isn't partitioned (CHUNK_PARTITIONING)")
+
+    doc = make_doc([paragraph("alpha"), paragraph("beta")])
+    IngestionService().process_documents([in_space(doc, "ENG")])
+    ids = [c.id for c in stored_chunks()]
+    kept = stored_chunks()[0]
+    session = SessionLocal()
+    # An HR sync racing the move inserted its own copy of chunk 0
+    session.add(DocumentChunk(
+        source_id=SOURCE_ID, chunk_index=0, content=kept.content, content_hash=kept.content_hash,
+        embedding=kept.embedding, metadata_={**kept.metadata_, "space_key": "HR"}, source="confluence", scope_key="HR",
+    ))
+    session.commit()
+    session.close()
+
+    stats = IngestionService().process_documents([doc])
+    assert stats["deleted"] == 1 and stats["unchanged"] == 2
+    assert [(c.id, c.scope_key) for c in stored_chunks()] == [(ids[0], "ENG"), (ids[1], "ENG")]
+
+@pytest.mark.parametrize("writer", ["copy", "orm"])
+def test_writers_store_identical_rows(writer):
+    doc = make_doc([paragraph("alpha"), paragraph("beta"), paragraph("gamma")])
+    service = IngestionService(writer=writer)
+    service.writer.commit_rows = 2 # one transaction per document at most, still never split
+    stats = service.process_documents([doc])
+    assert stats["inserted"] == 3
+    if writer == "copy":
+        assert service.writer.copy_enabled # did not fall back to INSERT
+
+    chunks = stored_chunks()
+    assert [c.chunk_index for c in chunks] == [0, 1, 2]
+    assert chunks[0].metadata_["allowed_groups"] == ["group:everyone"]
+    assert chunks[0].acl_ids and len(chunks[0].embedding) == 1536
+
+def test_pipeline_ingests_paged_source_in_bounded_batches():
+    from app.pipeline import IngestionPipeline
+    from app.loaders import SecureConfluenceLoader
+    from tests.fake_atlassian import FakeAtlassian, SPACE_GROUPS
+
+    session = SessionLocal()
+    session.query(DocumentChunk).filter(DocumentChunk.source_id.like("50%")).delete(synchronize_session=False)
+    session.commit()
+    with FakeAtlassian(pages=40) as server:
+        loader = SecureConfluenceLoader(server.url, "user", "key", page_size=7, space_groups=SPACE_GROUPS)
+        pipeline = IngestionPipeline(IngestionService(), batch_docs=5, queue_size=1)
+        stats = pipeline.run(loader.lazy_load())
+
+    assert stats["documents"] == 40 and stats["inserted"] == 40
+    assert pipeline.stage_stats["write"].batches == 8
+    stored = session.query(DocumentChunk).filter(DocumentChunk.source_id.like("50%")).count()
+    session.query(DocumentChunk).filter(DocumentChunk.source_id.like("50%")).delete(synchronize_session=False)
+    session.commit()
+    session.close()
+    assert stored == 40
+
+def test_pipeline_resumes_from_checkpoint(tmp_path):
+    from app.pipeline import IngestionPipeline, Checkpoint
+    from benchmarks.corpus import synthetic_documents
+
+    def cleanup():
+        session = SessionLocal()
+        session.query(DocumentChunk).filter(DocumentChunk.source_id.like("CKPT-%")).delete(synchronize_session=False)
+        session.commit()
+        session.close()
+
+    cleanup()
+    path = str(tmp_path / "ingest.ckpt")
+    first = IngestionPipeline(IngestionService(), batch_docs=4, split_workers=2, checkpoint=Checkpoint(path))
+    first.run(synthetic_documents(10, prefix="CKPT-"))
+    assert len(Checkpoint(path)) == 10
+
+    second = IngestionPipeline(IngestionService(), batch_docs=4, checkpoint=Checkpoint(path))
+    stats = second.run(synthetic_documents(12, prefix="CKPT-"))
+    cleanup()
+    assert second.skipped == 10
+    assert stats["documents"] == 2
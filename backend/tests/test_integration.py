@@ -42,6 +42,56 @@ def test_e2e_security_access():
     
     assert "top secret" in answer_exec.lower()
 
+def test_e2e_streaming():
+    """
+    Scenario: stream=true returns OpenAI-style SSE chunks that reassemble
+    into the same answer as the non-streaming call, terminated by [DONE].
+    """
+    question = "Tell me about Project Secret X."
+    payload = {
+        "model": "rag-agent",
+        "messages": [{"role": "user", "content": question}],
+        "user": "exec",
+        "stream": True
+    }
+    with requests.post(BASE_URL, json=payload, stream=True, timeout=5) as response:
+        response.raise_for_status()
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [line[len("data: "):] for line in response.iter_lines(decode_unicode=True) if line.startswith("data: ")]
+
+    assert events[-1] == "[DONE]"
+    chunks = [json.loads(e) for e in events[:-1]]
+    assert all(c["object"] == "chat.completion.chunk" for c in chunks)
+    assert chunks[0]["choices"][0]["delta"]["role"] == "assistant"
+    assert chunks[-1]["choices"][0]["finish_reason"] == "stop"
+
+    streamed = "".join(c["choices"][0]["delta"].get("content", "") for c in chunks)
+    assert streamed == query_api("exec", question)
+
+def test_e2e_retrieve_batch():
+    """
+    Scenario: /v1/retrieve/batch answers each query like /v1/retrieve would, in order,
+    and applies the caller's ACL to every one of them.
+    """
+    questions = ["Project Secret X", "VPN error 0x80040", "Project Secret X"]
+    retrieve_url = BASE_URL.replace("/chat/completions", "/retrieve")
+
+    def batch(user):
+        response = requests.post(f"{retrieve_url}/batch", json={"queries": questions, "user": user, "limit": 5}, timeout=5)
+        response.raise_for_status()
+        return response.json()["data"]
+
+    exec_data = batch("exec")
+    assert [d["index"] for d in exec_data] == [0, 1, 2]
+    assert [d["query"] for d in exec_data] == questions
+    assert exec_data[0]["results"] == exec_data[2]["results"]
+    single = requests.post(retrieve_url, json={"query": questions[0], "user": "exec", "limit": 5}, timeout=5).json()
+    assert [r["id"] for r in single["results"]] == [r["id"] for r in exec_data[0]["results"]]
+    assert any("secret" in r["content"].lower() for r in exec_data[0]["results"])
+
+    intern_data = batch("intern")
+    assert all("secret x" not in r["content"].lower() for d in intern_data for r in d["results"])
+
 if __name__ == "__main__":
     # Manual run support
     try:
@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta, timezone
+from app.loaders import SecureConfluenceLoader, SecureJiraLoader
+from tests.fake_atlassian import FakeAtlassian, SPACE_GROUPS, make_page
+
+def test_confluence_lazy_load_pages_through_space():
+    with FakeAtlassian(pages=23) as server:
+        loader = SecureConfluenceLoader(server.url, "user", "key", page_size=10, space_groups=SPACE_GROUPS)
+        docs = loader.lazy_load()
+        first = next(docs)
+        # Only the first page of results has been fetched so far
+        assert len(server.requests) == 1
+        rest = list(docs)
+
+    assert len(server.requests) == 3
+    assert [d.metadata["source_id"] for d in [first] + rest] == [str(5000 + n) for n in range(23)]
+    assert first.page_content == "Fake page 0 body about topic 0. More & more text."
+
+def test_confluence_restrictions_become_acl_metadata():
+    with FakeAtlassian(pages=6) as server:
+        docs = SecureConfluenceLoader(server.url, "user", "key", space_groups=SPACE_GROUPS).load(space_key="HR")
+
+    assert [d.metadata["source_id"] for d in docs] == ["5000", "5002", "5004"]
+    assert docs[0].metadata["allowed_groups"] == ["group:executives"]
+    assert docs[1].metadata["allowed_groups"] == ["group:hr", "group:executives"]
+
+def test_confluence_pages_get_their_space_groups_and_unmapped_spaces_fail_closed():
+    with FakeAtlassian(pages=4) as server:
+        server.restrict_page(1, ["hr", "executives"])  # group:hr can't view ENG
+        loader = SecureConfluenceLoader(server.url, "user", "key", space_groups={"ENG": SPACE_GROUPS["ENG"]})
+        docs = {d.metadata["source_id"]: d.metadata["allowed_groups"] for d in loader.lazy_load()}
+
+    assert docs == {
+        "5000": [], "5002": [],  # HR isn't mapped
+        "5001": ["group:executives"],
+        "5003": ["group:confluence-users", "group:executives"],
+    }
+
+def test_confluence_children_inherit_ancestor_restrictions():
+    with FakeAtlassian(pages=6) as server:
+        server.set_parent(2, 0)  # under a page restricted to executives
+        server.set_parent(4, 2)
+        server.set_parent(1, 0)
+        server.restrict_page(1, ["executives", "hr"])
+        loader = SecureConfluenceLoader(server.url, "user", "key", space_groups=SPACE_GROUPS)
+        docs = {d.metadata["source_id"]: d.metadata["allowed_groups"] for d in loader.lazy_load()}
+        permissions = {page_id: groups for page_id, groups, _ in loader.list_permissions()}
+
+    assert docs["5002"] == docs["5004"] == ["group:executives"]
+    # Own restriction intersected with the parent's
+    assert docs["5001"] == ["group:executives"]
+    assert docs["5003"] == ["group:confluence-users", "group:executives"]
+    assert permissions == docs
+
+def test_confluence_missing_restriction_data_fails_closed():
+    loader = SecureConfluenceLoader("http://confluence.invalid", "user", "key", space_groups=SPACE_GROUPS)
+    page = make_page(1)
+    assert loader._acl(page) == ([], [])  # ancestors not expanded
+    parent = {"id": "5000", "restrictions": {}}
+    assert loader._acl({**page, "ancestors": [parent]}) == ([], [])
+    assert loader._acl({**page, "ancestors": []}) == (SPACE_GROUPS["ENG"], [])
+
+def test_jira_lazy_load_pages_through_search():
+    with FakeAtlassian(issues=12) as server:
+        loader = SecureJiraLoader(
+            server.url, "user", "key", page_size=5, project_groups={"FAKE": ["group:jira-software-users"]}
+        )
+        docs = list(loader.lazy_load("project=FAKE"))
+
+    assert [params["startAt"] for _, params in server.requests] == ["0", "5", "10"]
+    assert [d.metadata["source_id"] for d in docs] == [f"FAKE-{n}" for n in range(12)]
+    assert docs[0].metadata["allowed_groups"] == []  # security level
+    assert docs[1].metadata["allowed_groups"] == ["group:jira-software-users"]
+    assert "Description: \n" in docs[0].page_content
+
+def test_jira_unconfigured_project_fails_closed():
+    with FakeAtlassian(issues=3) as server:
+        docs = list(SecureJiraLoader(server.url, "user", "key", project_groups={}).lazy_load("project=FAKE"))
+
+    assert [d.metadata["allowed_groups"] for d in docs] == [[], [], []]
+
+def test_jira_secured_issue_fails_closed(caplog):
+    # A security level's name isn't a group: its members can be roles, the reporter, ...
+    with FakeAtlassian(issues=21) as server:
+        loader = SecureJiraLoader(server.url, "user", "key", project_groups={"FAKE": ["group:jira-software-users"]})
+        docs = {d.metadata["source_id"]: d.metadata["allowed_groups"] for d in loader.lazy_load("project=FAKE")}
+        permissions = dict((key, groups) for key, groups, _ in loader.list_permissions("project=FAKE"))
+
+    assert docs["FAKE-0"] == docs["FAKE-10"] == docs["FAKE-20"] == []
+    assert docs["FAKE-1"] == ["group:jira-software-users"]
+    assert permissions == docs
+    assert "group:hr-administrators" not in str(docs)
+    assert sum("security level 'hr-administrators'" in r.message for r in caplog.records) == 1
+
+def test_confluence_changed_since_uses_cql_cursor():
+    with FakeAtlassian(pages=10) as server:
+        loader = SecureConfluenceLoader(server.url, "user", "key", page_size=3, space_groups=SPACE_GROUPS)
+        since = datetime(2024, 1, 1, 6, 30, tzinfo=timezone.utc)
+        server.edit_page(2, "Edited body", when=since + timedelta(days=1))
+        docs = list(loader.changed_since(since, space_key="HR"))
+
+    _, params = server.requests[0]
+    assert params["cql"] == 'space = "HR" AND type = page AND lastmodified >= "2024-01-01 06:30"'
+    # Pages 7 and 9 are newer (one page per hour from the epoch); page 2 was just edited
+    assert sorted(d.metadata["source_id"] for d in docs) == ["5002", "5008"]
+    assert docs[0].metadata["updated_at"] == "2024-01-02T06:30:00+00:00"
+
+def test_list_permissions_sees_restriction_changes_and_deletions():
+    with FakeAtlassian(pages=4, issues=3) as server:
+        confluence = SecureConfluenceLoader(server.url, "user", "key", space_groups=SPACE_GROUPS)
+        server.restrict_page(1, ["executives"])
+        server.delete_page(3)
+        pages = list(confluence.list_permissions())
+        issues = list(SecureJiraLoader(server.url, "user", "key").list_permissions('project = "FAKE"'))
+
+    assert pages == [
+        ("5000", ["group:executives"], []),
+        ("5001", ["group:executives"], []),
+        ("5002", ["group:hr", "group:executives"], []),
+    ]
+    assert "body" not in server.requests[0][1]["expand"]
+    assert issues[0] == ("FAKE-0", [], [])
+
+def test_jira_changed_since_and_load_keys():
+    with FakeAtlassian(issues=12) as server:
+        loader = SecureJiraLoader(server.url, "user", "key")
+        changed = list(loader.changed_since(datetime(2024, 1, 1, 10, tzinfo=timezone.utc), 'project = "FAKE"'))
+        fetched = list(loader.load_keys(["FAKE-3", "FAKE-5"]))
+
+    assert [d.metadata["source_id"] for d in changed] == ["FAKE-10", "FAKE-11"]
+    assert server.requests[0][1]["jql"] == '(project = "FAKE") AND updated >= "2024/01/01 10:00" ORDER BY updated ASC'
+    assert [d.metadata["source_id"] for d in fetched] == ["FAKE-3", "FAKE-5"]
@@ -0,0 +1,28 @@
+from app import metrics
+
+def test_histogram_renders_cumulative_buckets():
+    h = metrics.Histogram("test_latency_seconds", "test", ["stage"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        h.observe(value, stage="dense")
+
+    lines = [l for l in metrics.render().splitlines() if l.startswith("test_latency_seconds")]
+    assert lines == [
+        'test_latency_seconds_bucket{stage="dense",le="0.1"} 2',
+        'test_latency_seconds_bucket{stage="dense",le="1"} 3',
+        'test_latency_seconds_bucket{stage="dense",le="+Inf"} 4',
+        'test_latency_seconds_sum{stage="dense"} 3.65',
+        'test_latency_seconds_count{stage="dense"} 4',
+    ]
+    assert "# TYPE test_latency_seconds histogram" in metrics.render()
+
+def test_stage_feeds_histogram_and_request_timings():
+    before = metrics.STAGE_SECONDS.count(stage="test_stage")
+    timings = metrics.start_request_timing()
+    with metrics.stage("test_stage"):
+        pass
+    with metrics.stage("test_stage"):
+        pass
+
+    assert metrics.STAGE_SECONDS.count(stage="test_stage") == before + 2
+    assert list(timings) == ["test_stage"]
+    assert metrics.server_timing_header({"embed": 0.0012}) == "embed;dur=1.20"
@@ -0,0 +1,175 @@
+import asyncio
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from sqlalchemy import text
+from app.database import SessionLocal, engine, async_engine
+from app.embedding_cache import CachedEmbeddings, EmbeddingCache
+from app.ingestion import IngestionService
+from app.numpy_backend import NumpyBackend, NumpyIndex, export_postgres, write_index
+from app.search_service import HybridSearchService, PostgresBackend
+from app.retrieval_cache import RetrievalCache
+from app.retrieval_backend import SearchScope
+from benchmarks.corpus import SyntheticCorpus
+from benchmarks.suite import QueryVectors
+
+def corpus_rows(corpus: SyntheticCorpus):
+    row_id = 0
+    for _, chunks in corpus.documents():
+        for chunk in chunks:
+            row_id += 1
+            yield {
+                "id": row_id, "source_id": chunk["source_id"], "chunk_index": chunk["chunk_index"],
+                "content": chunk["content"], "title": chunk["metadata_"]["title"], "url": None,
+                "allowed_groups": chunk["metadata_"]["allowed_groups"], "embedding": chunk["embedding"],
+            }
+
+@pytest.fixture(scope="module")
+def corpus_index(tmp_path_factory):
+    corpus = SyntheticCorpus(3000, seed=7, topics=32, dim=64)
+    path = str(tmp_path_factory.mktemp("idx") / "numpy_index")
+    rows = list(corpus_rows(corpus))
+    write_index(path, iter(rows), len(rows), 64, generation=3, distance="l2")
+    return corpus, rows, NumpyIndex(path)
+
+def test_dense_is_exact_and_acl_filtered(corpus_index):
+    """Blocked top-k equals brute force over the rows the caller may read."""
+    corpus, rows, index = corpus_index
+    matrix = np.stack([r["embedding"] for r in rows]).astype(np.float32)
+    assert isinstance(index.embeddings, np.memmap)
+
+    for _, vector, groups in corpus.queries(20, seed=3):
+        visible = np.array([bool(set(r["allowed_groups"]) & set(groups)) for r in rows])
+        distances = np.linalg.norm(matrix - vector, axis=1)
+        distances[~visible] = np.inf
+        expected = [rows[i]["id"] for i in np.argsort(distances, kind="stable")[:10] if visible[i]]
+
+        for block_rows in (256, 100_000):
+            hits = index.dense(vector, groups, 10, block_rows=block_rows)
+            assert [int(index.ids[row]) for row, _ in hits] == expected
+            assert all(set(rows[row]["allowed_groups"]) & set(groups) for row, _ in hits)
+
+    assert index.dense(vector, ["group:nobody"], 10) == []
+
+def test_keyword_query_semantics(tmp_path):
+    """All terms required, -term excludes, `or` alternates, stop words ignored, title outweighs body."""
+    rows = [
+        {"id": 1, "source_id": "A", "chunk_index": 0, "content": "The VPN handshake fails with 0x80040", "title": None,
+         "allowed_groups": ["group:everyone"]},
+        {"id": 2, "source_id": "B", "chunk_index": 0, "content": "Reset the VPN token", "title": "Handshake guide",
+         "allowed_groups": ["group:everyone"]},
+        {"id": 3, "source_id": "C", "chunk_index": 0, "content": "VPN handshake for executives", "title": None,
+         "allowed_groups": ["group:executives"]},
+    ]
+    for row in rows:
+        row["embedding"] = np.zeros(4, dtype=np.float32)
+    path = write_index(str(tmp_path / "idx"), iter(rows), len(rows), 4)
+    index = NumpyIndex(path)
+    ids = lambda q, groups=("group:everyone",): [int(index.ids[r]) for r, _ in index.sparse(q, list(groups), 10)]
+
+    assert ids("the vpn handshake") == [2, 1]  # title hit (1.0 + 0.4) ranks first
+    assert ids("vpn handshake -0x80040") == [2]
+    assert ids("0x80040 or token") == [1, 2]
+    assert ids("vpn handshake", ["group:executives"]) == [3]
+    assert ids("missing") == []
+
+def test_search_service_on_numpy_backend(corpus_index):
+    """HybridSearchService runs unchanged on the NumPy backend: fused, ACL-filtered, cached by generation."""
+    corpus, rows, index = corpus_index
+    queries = corpus.queries(5, seed=11)
+    service = HybridSearchService(backend=NumpyBackend(index))
+    vectors = {q: v for q, v, _ in queries}
+    service.embeddings = CachedEmbeddings(QueryVectors(vectors), EmbeddingCache(max_size=0))
+    service.cache = RetrievalCache(max_size=16)
+
+    for query, _, groups in queries:
+        results = asyncio.run(service.search(query, groups, limit=5))
+        assert 0 < len(results) <= 5
+        assert [c.score for c in results] == sorted((c.score for c in results), reverse=True)
+        by_id = {r["id"]: r for r in rows}
+        assert all(set(by_id[c.id]["allowed_groups"]) & set(groups) for c in results)
+        assert asyncio.run(service.search(query, groups, limit=5)) == results
+    assert service.cache.stats()["hits"] == len(queries)
+
+def test_search_many_embeds_once_and_matches_search(corpus_index):
+    corpus, _, index = corpus_index
+    queries = corpus.queries(6, seed=13)
+    vectors = {q: v for q, v, _ in queries}
+    groups = queries[0][2]
+
+    class CountingVectors(QueryVectors):
+        calls = 0
+
+        def embed_documents(self, texts):
+            CountingVectors.calls += 1
+            return super().embed_documents(texts)
+
+    service = HybridSearchService(backend=NumpyBackend(index))
+    service.embeddings = CachedEmbeddings(CountingVectors(vectors), EmbeddingCache(max_size=0))
+    service.cache = RetrievalCache(max_size=0)
+    texts = [q for q, _, _ in queries] + [queries[0][0]]
+
+    batch = asyncio.run(service.search_many(texts, groups, limit=5))
+    assert CountingVectors.calls == 1
+    assert batch == [asyncio.run(service.search(q, groups, limit=5)) for q in texts]
+
+def test_scope_restricts_both_legs(tmp_path):
+    """A SearchScope keeps only its source (and listed spaces), on top of the ACL mask."""
+    scopes = [("confluence", "ENG"), ("confluence", "OPS"), ("jira", "PROJ"), ("confluence", "ENG"), ("", "")]
+    rows = [
+        {"id": i + 1, "source_id": f"S-{i}", "chunk_index": 0, "content": "quokka rollout", "title": None,
+         "allowed_groups": ["group:dev"] if i == 3 else ["group:everyone"], "source": source, "scope_key": key,
+         "embedding": np.full(4, i, dtype=np.float32)}
+        for i, (source, key) in enumerate(scopes)
+    ]
+    index = NumpyIndex(write_index(str(tmp_path / "idx"), iter(rows), len(rows), 4))
+    backend = NumpyBackend(index)
+    everyone = ["group:everyone"]
+
+    def ids(scope, groups=everyone):
+        results = asyncio.run(backend.retrieve("quokka", [0.0] * 4, groups, 10, scope=scope))
+        return sorted(c.id for c in results)
+
+    assert ids(None) == [1, 2, 3, 5]
+    assert ids(SearchScope("confluence")) == [1, 2]
+    assert ids(SearchScope("confluence", ("ENG",))) == [1]
+    assert ids(SearchScope("confluence", ("ENG",)), ["group:everyone", "group:dev"]) == [1, 4]
+    assert ids(SearchScope("jira", ("ENG",))) == []
+    assert [int(index.ids[r]) for r, _ in index.dense([0.0] * 4, everyone, 10, scope=SearchScope("jira"))] == [3]
+
+def test_numpy_backend_agrees_with_postgres(tmp_path):
+    """Exported from Postgres, the NumPy backend returns the same dense and keyword hits per caller."""
+    with engine.connect() as conn:
+        conn.execute(text("TRUNCATE TABLE document_chunks"))
+        conn.commit()
+    words = ["vpn", "router", "login", "payroll", "roadmap", "invoice", "outage", "deploy"]
+    docs = [
+        Document(
+            page_content=f"{words[i % 8]} {words[(i * 3) % 8]} notes number {i}",
+            metadata={"source_id": f"AGREE-{i}", "title": f"Page {i}",
+                      "allowed_groups": ["group:everyone"] if i % 3 else ["group:dev"]},
+        )
+        for i in range(60)
+    ]
+    IngestionService().process_documents(docs)
+    with SessionLocal() as session:
+        export_postgres(session, str(tmp_path / "idx"))
+    local = NumpyBackend.open(str(tmp_path / "idx"))
+    postgres = PostgresBackend()
+
+    async def compare():
+        try:
+            rng = np.random.default_rng(0)
+            for groups in (["group:everyone"], ["group:dev"], ["group:everyone", "group:dev"]):
+                for _ in range(5):
+                    vector = rng.random(1536).tolist()
+                    expected = [c.id for c in await postgres.dense(vector, groups, 10, ef_search=200)]
+                    assert [c.id for c in await local.dense(vector, groups, 10)] == expected
+                for query in ("vpn", "router login", "payroll -roadmap"):
+                    expected = {c.id for c in await postgres.sparse(query, groups, 100)}
+                    assert {c.id for c in await local.sparse(query, groups, 100)} == expected
+            assert await local.generation() == await postgres.generation()
+        finally:
+            await async_engine.dispose()
+
+    asyncio.run(compare())
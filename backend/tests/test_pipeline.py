@@ -0,0 +1,27 @@
+from concurrent.futures import ProcessPoolExecutor
+from app.ingestion import split_documents
+from app.pipeline import Checkpoint
+from benchmarks.corpus import synthetic_documents
+
+def test_checkpoint_survives_reopen(tmp_path):
+    path = str(tmp_path / "crawl.ckpt")
+    checkpoint = Checkpoint(path)
+    checkpoint.mark(["A-1", "A-2", None])
+    checkpoint.mark(["A-2", "A-3"])
+
+    reopened = Checkpoint(path)
+    assert len(reopened) == 3 and "A-3" in reopened and "A-4" not in reopened
+    assert open(path).read().splitlines() == ["A-1", "A-2", "A-3"]
+
+    reopened.reset()
+    assert len(Checkpoint(path)) == 0
+
+def test_split_in_worker_process_matches_in_process():
+    docs = list(synthetic_documents(20, seed=3))
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        remote = pool.submit(split_documents, docs).result()
+    local = split_documents(docs)
+
+    assert [(d.metadata["source_id"], [c.page_content for c in chunks], hashes) for d, chunks, hashes in remote] == \
+           [(d.metadata["source_id"], [c.page_content for c in chunks], hashes) for d, chunks, hashes in local]
+    assert all(len(chunks) > 1 for _, chunks, _ in local)
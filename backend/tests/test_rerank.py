@@ -0,0 +1,57 @@
+import time
+import numpy as np
+from app.metrics import RERANK_BUDGET_EXCEEDED
+from app.rerank import LexicalScorer, Reranker, ScoreCache, Scorer
+from app.retrieval_backend import RetrievedChunk
+
+def chunks():
+    return [
+        RetrievedChunk(id=1, source_id="A", chunk_index=0, content="Cafeteria opening hours and menu", score=0.05),
+        RetrievedChunk(id=2, source_id="B", chunk_index=0, content="Reboot the router when the handshake times out",
+                       title="VPN troubleshooting", score=0.04),
+        RetrievedChunk(id=3, source_id="C", chunk_index=0, content="VPN client download links", score=0.03),
+    ]
+
+class CountingScorer(Scorer):
+    name = "counting"
+
+    def __init__(self, delay: float = 0.0):
+        self.calls = []
+        self.delay = delay
+
+    def score(self, query, docs, deadline=None):
+        self.calls.append([d.id for d in docs])
+        time.sleep(self.delay)
+        return np.array([float(d.id) for d in docs])
+
+def test_lexical_rerank_reorders_copies_only():
+    """BM25 + title boost moves the VPN troubleshooting page first; the retrieved chunks are not touched."""
+    docs = chunks()
+    reranked = Reranker(LexicalScorer(title_boost=2.0), top_n=2, budget_ms=0).rerank("vpn troubleshooting", docs)
+
+    assert [d.id for d in reranked] == [2, 3]
+    assert reranked[0].rerank_score > reranked[1].rerank_score > 0
+    assert [d.id for d in docs] == [1, 2, 3]
+    assert all(d.rerank_score is None for d in docs)
+
+def test_rerank_falls_back_to_rrf_order_over_budget():
+    before = RERANK_BUDGET_EXCEEDED.value()
+    reranker = Reranker(CountingScorer(delay=0.05), top_n=3, budget_ms=10)
+
+    assert [d.id for d in reranker.rerank("anything", chunks())] == [1, 2, 3]
+    assert RERANK_BUDGET_EXCEEDED.value() == before + 1
+    # The late scores were still cached, so the next request is instant and reranked
+    assert [d.id for d in reranker.rerank("anything", chunks())] == [3, 2, 1]
+
+def test_scores_cached_per_query_chunk_and_content():
+    scorer = CountingScorer()
+    reranker = Reranker(scorer, top_n=3, budget_ms=0, cache=ScoreCache(100))
+
+    reranker.rerank("VPN  Setup", chunks())
+    reranker.rerank("vpn setup", chunks())
+    edited = chunks()
+    edited[1].content = "Updated text"
+    reranker.rerank("vpn setup", edited)
+    reranker.rerank("other question", chunks())
+
+    assert scorer.calls == [[1, 2, 3], [2], [1, 2, 3]]
@@ -0,0 +1,39 @@
+from app.retrieval_cache import RetrievalCache
+
+def test_never_serves_across_acl_boundaries():
+    cache = RetrievalCache(max_size=10, ttl_seconds=60)
+    exec_key = RetrievalCache.key("Project Secret X", ["group:everyone", "group:executives"], 5)
+    cache.put(exec_key, 1, ["secret-chunk"])
+
+    intern_key = RetrievalCache.key("Project Secret X", ["group:everyone"], 5)
+    assert cache.get(intern_key, 1) is None
+
+    # Same group set in another order (and with duplicates) is the same ACL view
+    same_view = RetrievalCache.key("project secret x", ["group:executives", "group:everyone", "group:everyone"], 5)
+    assert cache.get(same_view, 1) == ["secret-chunk"]
+
+def test_new_generation_invalidates_everything():
+    cache = RetrievalCache(max_size=10, ttl_seconds=60)
+    key = RetrievalCache.key("vpn", ["group:everyone"], 5)
+    cache.put(key, 7, ["old"])
+    assert cache.get(key, 7) == ["old"]
+
+    assert cache.get(key, 8) is None
+    assert cache.stats()["size"] == 0
+    assert cache.stats()["invalidations"] == 1
+
+def test_limit_and_options_are_part_of_the_key():
+    cache = RetrievalCache(max_size=10, ttl_seconds=60)
+    cache.put(RetrievalCache.key("vpn", ["g"], 5), 1, ["a"])
+    assert cache.get(RetrievalCache.key("vpn", ["g"], 10), 1) is None
+    assert cache.get(RetrievalCache.key("vpn", ["g"], 5, (100, None)), 1) is None
+
+def test_hit_ratio_and_lru_bound():
+    cache = RetrievalCache(max_size=2, ttl_seconds=60)
+    for q in ("a", "b", "c"):
+        cache.put(RetrievalCache.key(q, ["g"], 5), 1, [q])
+    assert cache.get(RetrievalCache.key("a", ["g"], 5), 1) is None
+    assert cache.get(RetrievalCache.key("c", ["g"], 5), 1) == ["c"]
+    stats = cache.stats()
+    assert stats["size"] == 2
+    assert stats["hit_ratio"] == 0.5